@@ -0,0 +1,381 @@
+"""
+Local stand-in for the Fireworks inference API.
+
+Implements the endpoints LLMClient uses, with configurable latency, jitter,
+error rate and payload size, so benchmarks run offline without burning credits:
+
+    POST /inference/v1/chat/completions                 text, JSON mode and SSE streaming
+    POST /inference/v1/image_generation/<model path>    raw image bytes
+    GET  /inference/v1/models                           model list (used by warm-up)
+
+Run standalone:
+    python -m benchmarks.mock_server --port 8000 --latency 0.3 --error-rate 0.02
+
+then point the client at it with FIREWORKS_BASE_URL=http://127.0.0.1:8000/inference/v1.
+
+Chat prompts go through a simulated prefix cache: like the KV cache of a real
+inference server, it hashes prompts in fixed-size blocks, and leading blocks seen
+before skip prefill. Cached prompt tokens are reported in
+usage.prompt_tokens_details.cached_tokens.
+"""
+
+import json
+import math
+import zlib
+import hashlib
+import time
+import struct
+import random
+import argparse
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, Optional, Tuple
+
+API_PREFIX = "/inference/v1"
+
+_WORDS = ("dream", "water", "falling", "light", "door", "shadow", "forest", "memory",
+          "ocean", "stairs", "mirror", "flight", "house", "voice", "storm", "garden")
+
+
+class MockSettings:
+    """Behaviour of the mock server. All times are in seconds."""
+
+    def __init__(self,
+                 latency: float = 0.2,
+                 jitter: float = 0.05,
+                 token_delay: float = 0.002,
+                 error_rate: float = 0.0,
+                 payload_chars: int = 1500,
+                 image_bytes: int = 1_500_000,
+                 image_latency: float = 1.0,
+                 chunk_chars: int = 16,
+                 prefill_delay: float = 0.0002,
+                 prefix_block_chars: int = 256,
+                 seed: Optional[int] = None):
+        """
+        Args:
+            latency: Time to first byte of a chat response
+            jitter: Uniform +/- jitter added to latency and image_latency
+            token_delay: Time to generate each chunk of text (the delay between streamed chunks)
+            error_rate: Fraction of requests answered with 429 or 503
+            payload_chars: Characters of generated text per response
+            image_bytes: Size of each generated image
+            image_latency: Time to render an image
+            chunk_chars: Characters per streamed chunk
+            prefill_delay: Time to prefill each prompt token that is not in the prefix cache
+            prefix_block_chars: Granularity of the prefix cache; only whole blocks are reused
+            seed: Random seed for reproducible runs
+        """
+        self.latency = latency
+        self.jitter = jitter
+        self.token_delay = token_delay
+        self.error_rate = error_rate
+        self.payload_chars = payload_chars
+        self.image_bytes = image_bytes
+        self.image_latency = image_latency
+        self.chunk_chars = chunk_chars
+        self.prefill_delay = prefill_delay
+        self.prefix_block_chars = prefix_block_chars
+        self.random = random.Random(seed)
+        self.requests = 0
+        self.prompt_chars = 0
+        self.cached_chars = 0
+        self._prefix_blocks = set()
+        self._images = {}
+        self._lock = threading.Lock()
+
+    def delay(self, base: float) -> float:
+        with self._lock:
+            return max(0.0, base + self.random.uniform(-self.jitter, self.jitter))
+
+    def should_fail(self) -> bool:
+        with self._lock:
+            return self.random.random() < self.error_rate
+
+    def image(self, size_bytes: int) -> bytes:
+        """A cached PNG of about ``size_bytes`` bytes."""
+        with self._lock:
+            if size_bytes not in self._images:
+                self._images[size_bytes] = make_png(size_bytes)
+            return self._images[size_bytes]
+
+    def prefill(self, prompt: str) -> int:
+        """
+        Pass a prompt through the prefix cache and return how many of its leading
+        characters were already cached.
+        """
+        block = self.prefix_block_chars
+        digest = hashlib.sha1()
+        cached = 0
+        hit = True
+        with self._lock:
+            self.prompt_chars += len(prompt)
+            for start in range(0, len(prompt) - block + 1, block):
+                # Each block's key covers everything before it, so only identical prefixes match
+                digest.update(prompt[start:start + block].encode())
+                key = digest.digest()
+                if hit and key in self._prefix_blocks:
+                    cached += block
+                else:
+                    hit = False
+                    self._prefix_blocks.add(key)
+            self.cached_chars += cached
+        return cached
+
+    def text(self, chars: int) -> str:
+        with self._lock:
+            words = []
+            length = 0
+            while length < chars:
+                word = self.random.choice(_WORDS)
+                words.append(word)
+                length += len(word) + 1
+        return " ".join(words)[:chars]
+
+
+def make_png(size_bytes: int, seed: int = 0) -> bytes:
+    """
+    Build a valid RGB PNG of roughly ``size_bytes`` bytes.
+
+    The pixels are noise, so the file compresses about as poorly as a rendered image
+    and post-processing has realistic work to do.
+    """
+    side = max(8, int((size_bytes / 3) ** 0.5))
+    rng = random.Random(seed)
+    rows = b"".join(b"\x00" + rng.randbytes(side * 3) for _ in range(side))
+
+    def chunk(kind: bytes, data: bytes) -> bytes:
+        return struct.pack(">I", len(data)) + kind + data + struct.pack(">I", zlib.crc32(kind + data))
+
+    return (b"\x89PNG\r\n\x1a\n"
+            + chunk(b"IHDR", struct.pack(">IIBBBBB", side, side, 8, 2, 0, 0, 0))
+            + chunk(b"IDAT", zlib.compress(rows, 1))
+            + chunk(b"IEND", b""))
+
+
+def _prompt_text(messages) -> str:
+    """The prompt as the server would tokenize it: each message's role and text in order."""
+    parts = []
+    for message in messages:
+        content = message.get("content")
+        if isinstance(content, list):
+            content = "".join(part.get("text", "") for part in content)
+        parts.append(f"<{message.get('role')}>{content or ''}")
+    return "".join(parts)
+
+
+def _fake_object(schema: Dict[str, Any], settings: MockSettings,
+                 defs: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+    """
+    Build an object that satisfies a JSON schema, spreading the payload over string fields.
+
+    Arrays of objects (batched requests) get ``minItems`` items, each with a full payload.
+    """
+    defs = schema.get("$defs", defs or {})
+    properties = schema.get("properties", {})
+    string_fields = [name for name, prop in properties.items() if prop.get("type") == "string"]
+    per_field = settings.payload_chars // max(1, len(string_fields))
+    value = {}
+    for name, prop in properties.items():
+        kind = prop.get("type")
+        if kind == "string":
+            value[name] = settings.text(per_field)
+        elif kind == "integer":
+            value[name] = 3
+        elif kind == "number":
+            value[name] = 0.5
+        elif kind == "boolean":
+            value[name] = True
+        elif kind == "array":
+            items = prop.get("items", {})
+            if "$ref" in items:
+                items = defs.get(items["$ref"].rsplit("/", 1)[-1], {})
+            count = prop.get("minItems", 0) if items.get("properties") else 0
+            value[name] = [_fake_object(items, settings, defs) for _ in range(count)]
+        else:
+            value[name] = {}
+    return value
+
+
+class MockFireworksHandler(BaseHTTPRequestHandler):
+    """Request handler; ``settings`` is injected on the server instance."""
+
+    protocol_version = "HTTP/1.1"
+
+    @property
+    def settings(self) -> MockSettings:
+        return self.server.settings
+
+    def log_message(self, format, *args):
+        pass
+
+    def _read_json(self) -> Dict[str, Any]:
+        length = int(self.headers.get("Content-Length", 0))
+        return json.loads(self.rfile.read(length) or b"{}")
+
+    def _send(self, status: int, body: bytes, content_type: str, headers: Tuple = ()) -> None:
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        for name, value in headers:
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _send_json(self, status: int, payload: Dict[str, Any], headers: Tuple = ()) -> None:
+        self._send(status, json.dumps(payload).encode(), "application/json", headers)
+
+    def _maybe_fail(self) -> bool:
+        if not self.settings.should_fail():
+            return False
+        if self.settings.random.random() < 0.5:
+            self._send_json(429, {"error": {"message": "rate limited"}}, (("Retry-After", "0.05"),))
+        else:
+            self._send_json(503, {"error": {"message": "overloaded"}})
+        return True
+
+    def do_GET(self):
+        if self.path.rstrip("/") == f"{API_PREFIX}/models":
+            self._send_json(200, {"object": "list", "data": [
+                {"id": "accounts/fireworks/models/mock", "object": "model", "created": 0, "owned_by": "mock"}
+            ]})
+        else:
+            self._send_json(404, {"error": {"message": "not found"}})
+
+    def do_POST(self):
+        with self.settings._lock:
+            self.settings.requests += 1
+        if self.path == f"{API_PREFIX}/chat/completions":
+            self._chat()
+        elif self.path.startswith(f"{API_PREFIX}/image_generation/"):
+            self._image()
+        else:
+            self._send_json(404, {"error": {"message": "not found"}})
+
+    def _chat(self):
+        request = self._read_json()
+        time.sleep(self.settings.delay(self.settings.latency))
+        if self._maybe_fail():
+            return
+
+        prompt = _prompt_text(request.get("messages", []))
+        cached_chars = self.settings.prefill(prompt)
+        prompt_tokens = len(prompt) // 4
+        if self.settings.prefill_delay:
+            time.sleep(self.settings.prefill_delay * ((len(prompt) - cached_chars) // 4))
+        response_format = request.get("response_format") or {}
+        if response_format.get("type") == "json_object":
+            content = json.dumps(_fake_object(response_format.get("schema") or {}, self.settings))
+        else:
+            content = self.settings.text(self.settings.payload_chars)
+        usage = {
+            "prompt_tokens": prompt_tokens,
+            "completion_tokens": len(content) // 4,
+            "total_tokens": prompt_tokens + len(content) // 4,
+            "prompt_tokens_details": {"cached_tokens": cached_chars // 4},
+        }
+        model = request.get("model", "mock")
+
+        if not request.get("stream"):
+            # Decoding takes as long as when streamed; a batch of answers takes proportionally longer
+            if self.settings.token_delay:
+                time.sleep(self.settings.token_delay * math.ceil(len(content) / self.settings.chunk_chars))
+            self._send_json(200, {
+                "id": "chatcmpl-mock",
+                "object": "chat.completion",
+                "created": int(time.time()),
+                "model": model,
+                "choices": [{"index": 0, "finish_reason": "stop",
+                             "message": {"role": "assistant", "content": content}}],
+                "usage": usage,
+            })
+            return
+
+        # Server-sent events over chunked transfer encoding, as the real API streams
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+
+        def write_event(payload) -> None:
+            data = f"data: {payload}\n\n".encode()
+            self.wfile.write(f"{len(data):x}\r\n".encode() + data + b"\r\n")
+            self.wfile.flush()
+
+        step = self.settings.chunk_chars
+        for i in range(0, len(content), step):
+            write_event(json.dumps({
+                "id": "chatcmpl-mock", "object": "chat.completion.chunk",
+                "created": int(time.time()), "model": model,
+                "choices": [{"index": 0, "delta": {"content": content[i:i + step]}, "finish_reason": None}],
+            }))
+            if self.settings.token_delay:
+                time.sleep(self.settings.token_delay)
+        write_event(json.dumps({
+            "id": "chatcmpl-mock", "object": "chat.completion.chunk",
+            "created": int(time.time()), "model": model,
+            "choices": [{"index": 0, "delta": {}, "finish_reason": "stop"}],
+            "usage": usage,
+        }))
+        write_event("[DONE]")
+        self.wfile.write(b"0\r\n\r\n")
+
+    def _image(self):
+        request = self._read_json()
+        # Renders scale with steps and pixel count relative to a 30-step 1024x1024 image
+        scale = (request.get("steps", 30) / 30) * (request.get("width", 1024) * request.get("height", 1024)) / (1024 * 1024)
+        time.sleep(self.settings.delay(self.settings.image_latency * scale))
+        if self._maybe_fail():
+            return
+        self._send(200, self.settings.image(max(256, int(self.settings.image_bytes * scale))), "image/png")
+
+
+def start_mock_server(settings: Optional[MockSettings] = None, host: str = "127.0.0.1",
+                      port: int = 0) -> Tuple[ThreadingHTTPServer, str]:
+    """
+    Start the mock server on a background thread.
+
+    Args:
+        settings: Server behaviour (defaults to MockSettings())
+        host: Interface to bind
+        port: Port to bind (0 picks a free port)
+
+    Returns:
+        The server (call shutdown() to stop it) and the API base URL
+    """
+    server = ThreadingHTTPServer((host, port), MockFireworksHandler)
+    server.daemon_threads = True
+    server.settings = settings or MockSettings()
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    return server, f"http://{host}:{server.server_address[1]}{API_PREFIX}"
+
+
+def main():
+    """Entry point for running the mock server standalone"""
+
+    parser = argparse.ArgumentParser(description="Local stand-in for the Fireworks API")
+    parser.add_argument("--host", type=str, default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--latency", type=float, default=0.2)
+    parser.add_argument("--jitter", type=float, default=0.05)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--payload-chars", type=int, default=1500)
+    parser.add_argument("--image-bytes", type=int, default=1_500_000)
+    parser.add_argument("--image-latency", type=float, default=1.0)
+    parser.add_argument("--prefill-delay", type=float, default=0.0002)
+    args = parser.parse_args()
+
+    settings = MockSettings(latency=args.latency, jitter=args.jitter, error_rate=args.error_rate,
+                            payload_chars=args.payload_chars, image_bytes=args.image_bytes,
+                            image_latency=args.image_latency, prefill_delay=args.prefill_delay)
+    server, base_url = start_mock_server(settings, args.host, args.port)
+    print(f"Mock Fireworks API listening on {base_url}")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
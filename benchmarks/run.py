@@ -0,0 +1,304 @@
+"""
+Offline throughput and latency benchmark.
+
+Runs LLMClient and DreamAnalysisPipeline against the local mock Fireworks server
+(benchmarks/mock_server.py), so results are reproducible and cost nothing.
+Modes:
+    client      chat completion, JSON mode and image calls, one at a time
+    serial      analyze_dream for each dream in turn
+    batch       analyze_many (thread pool)
+    concurrent  aanalyze_many (asyncio)
+    microbatch  aanalyze_many with analyses coalesced by a MicroBatcher
+
+For every mode it reports throughput, p50/p95/p99 latency, the tracemalloc peak
+and the net number of memory blocks still allocated per dream afterwards (a
+leak indicator). The JSON output adds prompt tokens per dream, the share of them
+served from the mock's prefix cache and time to first token for streamed calls. tracemalloc slows Python code down; pass --no-memory for
+cleaner latency numbers.
+
+Run from the repository root:
+    python -m benchmarks.run --dreams 50 --concurrency 16
+    python -m benchmarks.run --latency 0.5 --error-rate 0.05 --modes batch concurrent
+    python -m benchmarks.run --json results.json
+    python -m benchmarks.run --baseline results.json --tolerance 0.15
+
+With --baseline the exit status is 1 if throughput dropped or p95 latency grew by
+more than the tolerance, so the command can gate CI.
+"""
+
+import os
+import sys
+import json
+import math
+import time
+import asyncio
+import argparse
+import tempfile
+import threading
+import tracemalloc
+import contextlib
+from typing import Any, Callable, Dict, List, Optional
+
+from benchmarks.mock_server import MockSettings, start_mock_server
+
+MODES = ("client", "serial", "batch", "concurrent", "microbatch")
+
+_NARRATIVES = (
+    "I was walking through a flooded house and every door opened onto the ocean.",
+    "I was falling down an endless staircase while a voice kept calling my name.",
+    "I found a mirror in the forest that showed my childhood home in a storm.",
+    "I could fly over the city but my shadow stayed on the ground and followed me.",
+)
+
+
+def synthetic_dreams(count: int, start: int = 0) -> List[Any]:
+    """Build ``count`` varied DreamSchema instances, numbered from ``start``."""
+    from modules.pipeline import DreamSchema
+    return [
+        DreamSchema(
+            narrative=f"(dream {i}) {_NARRATIVES[i % len(_NARRATIVES)]}",
+            mainSymbols=["water", "door", "mirror", "stairs"][: 1 + i % 4],
+            primaryEmotion=["fear", "wonder", "sadness", "joy"][i % 4],
+            emotionalIntensity=1 + i % 5,
+            lifeConnection="A big change at work is coming up.",
+        )
+        for i in range(start, start + count)
+    ]
+
+
+def percentile(values: List[float], q: float) -> float:
+    """Nearest-rank percentile of ``values`` (q between 0 and 1)."""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, math.ceil(q * len(ordered)) - 1))
+    return ordered[index]
+
+
+class RecordingSink:
+    """Metrics sink that keeps every raw observation, for exact percentiles."""
+
+    def __init__(self):
+        self.observations: Dict[str, List[float]] = {}
+        self.counters: Dict[str, float] = {}
+        self._lock = threading.Lock()
+
+    def increment(self, name: str, amount: float, labels: Dict[str, str]) -> None:
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + amount
+
+    def observe(self, name: str, value: float, labels: Dict[str, str]) -> None:
+        with self._lock:
+            self.observations.setdefault(name, []).append(value)
+
+    def reset(self) -> None:
+        with self._lock:
+            self.observations.clear()
+            self.counters.clear()
+
+
+def _measure(run: Callable[[], int], memory: bool) -> Dict[str, float]:
+    """Run a workload that returns the number of items processed; time and optionally trace it."""
+    if memory:
+        tracemalloc.start()
+        before = sum(stat.count for stat in tracemalloc.take_snapshot().statistics("filename"))
+    start = time.perf_counter()
+    items = run()
+    wall = time.perf_counter() - start
+    result = {"items": items, "wall_seconds": wall, "throughput": items / wall if wall else 0.0}
+    if memory:
+        after = sum(stat.count for stat in tracemalloc.take_snapshot().statistics("filename"))
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        result["peak_kib"] = peak / 1024
+        result["net_blocks_per_item"] = (after - before) / items if items else 0.0
+    return result
+
+
+def _latencies(values: List[float]) -> Dict[str, float]:
+    return {
+        "p50_ms": percentile(values, 0.50) * 1000,
+        "p95_ms": percentile(values, 0.95) * 1000,
+        "p99_ms": percentile(values, 0.99) * 1000,
+    }
+
+
+def run_benchmarks(args) -> Dict[str, Dict[str, Any]]:
+    """Start the mock server, run the selected modes and return their results."""
+    from modules.llm_client import LLMClient
+    from modules.pipeline import DreamAnalysisPipeline
+    from modules.transport import HTTPTransport
+    from modules.scheduler import RequestScheduler, RetryPolicy
+    from modules.metrics import Metrics
+    from modules.images import ImageProcessor
+    from modules.batching import MicroBatcher
+
+    settings = MockSettings(latency=args.latency, jitter=args.jitter, error_rate=args.error_rate,
+                            payload_chars=args.payload_chars, image_bytes=args.image_bytes,
+                            image_latency=args.image_latency, prefill_delay=args.prefill_delay,
+                            seed=args.seed)
+    server, base_url = start_mock_server(settings)
+    os.environ.setdefault("FIREWORKS_API_KEY", "benchmark")
+
+    sink = RecordingSink()
+    metrics = Metrics([sink])
+    transport = HTTPTransport(base_url=base_url, max_connections=max(32, args.concurrency * 2))
+    scheduler = RequestScheduler(retry=RetryPolicy(base_delay=0.05, max_delay=1.0), metrics=metrics)
+    client = LLMClient(api_key="benchmark", transport=transport, scheduler=scheduler, metrics=metrics)
+    results: Dict[str, Dict[str, Any]] = {}
+
+    with tempfile.TemporaryDirectory() as output_dir:
+        image_processor = None
+        if args.image_format:
+            image_processor = ImageProcessor(format=args.image_format, thumbnail_sizes=args.thumbnails,
+                                             metrics=metrics)
+        pipeline = DreamAnalysisPipeline(llm_client=client, output_dir=output_dir, metrics=metrics,
+                                         image_processor=image_processor)
+        client.warmup(connect=True)
+
+        for number, mode in enumerate(args.modes):
+            # Fresh dreams per mode, so no mode benefits from prompts cached by an earlier one
+            dreams = synthetic_dreams(args.dreams, start=number * args.dreams)
+            sink.reset()
+            requests_before = settings.requests
+            prompt_chars_before = settings.prompt_chars
+            cached_chars_before = settings.cached_chars
+
+            if mode == "client":
+                from modules.pipeline import DreamAnalysis
+                from modules.prompts import DREAM_ANALYSIS_SYSTEM_PROMPT, format_analysis_prompt
+
+                def workload() -> int:
+                    for dream in dreams:
+                        client.generate_text(dream.narrative)
+                        client.generate_structured_json(format_analysis_prompt(dream), DreamAnalysis,
+                                                        system=DREAM_ANALYSIS_SYSTEM_PROMPT)
+                        client.generate_image(dream.narrative)
+                    return len(dreams)
+            elif mode == "serial":
+                def workload() -> int:
+                    for dream in dreams:
+                        pipeline.analyze_dream(dream)
+                    return len(dreams)
+            elif mode == "batch":
+                def workload() -> int:
+                    return len(pipeline.analyze_many(dreams, max_concurrency=args.concurrency))
+            elif mode == "microbatch":
+                def workload() -> int:
+                    with MicroBatcher(max_batch_size=args.batch_size, max_wait=args.batch_wait,
+                                      metrics=metrics) as batcher:
+                        pipeline.batcher = batcher
+                        try:
+                            return len(asyncio.run(pipeline.aanalyze_many(dreams, max_concurrency=args.concurrency)))
+                        finally:
+                            pipeline.batcher = None
+            else:
+                def workload() -> int:
+                    return len(asyncio.run(pipeline.aanalyze_many(dreams, max_concurrency=args.concurrency)))
+
+            # The pipeline logs to stdout; keep that out of the report (and the timings)
+            with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(sys.stdout if args.verbose else devnull):
+                result = _measure(workload, memory=not args.no_memory)
+            if mode == "client":
+                # Per-endpoint latencies; the headline numbers cover every call
+                chat = sink.observations.get("llm_request_seconds", [])
+                image = sink.observations.get("image_request_seconds", [])
+                result.update({f"chat_{key}": value for key, value in _latencies(chat).items()})
+                result.update({f"image_{key}": value for key, value in _latencies(image).items()})
+                result.update(_latencies(chat + image))
+            else:
+                result.update(_latencies(sink.observations.get("pipeline_dream_seconds", [])))
+            result["http_requests"] = settings.requests - requests_before
+            prompt_chars = settings.prompt_chars - prompt_chars_before
+            result["prompt_tokens_per_item"] = prompt_chars / 4 / len(dreams) if dreams else 0.0
+            result["cached_prompt_share"] = (settings.cached_chars - cached_chars_before) / prompt_chars if prompt_chars else 0.0
+            ttft = sink.observations.get("llm_time_to_first_token_seconds", [])
+            if ttft:
+                result["ttft_p50_ms"] = percentile(ttft, 0.50) * 1000
+            result["retries"] = sink.counters.get("scheduler_retries_total", 0)
+            results[mode] = result
+
+        transport.close()
+        if image_processor:
+            image_processor.close()
+    server.shutdown()
+    return results
+
+
+def format_results(results: Dict[str, Dict[str, Any]]) -> str:
+    """Render results as a fixed-width table."""
+    header = (f"{'mode':<12}{'dreams/s':>10}{'p50':>10}{'p95':>10}{'p99':>10}{'peak KiB':>11}{'blocks/dream':>14}"
+              f"{'requests':>10}{'prompt tok':>12}{'cached':>8}")
+    lines = [header]
+    for mode, r in results.items():
+        peak = f"{r['peak_kib']:.0f}" if "peak_kib" in r else "-"
+        blocks = f"{r['net_blocks_per_item']:.1f}" if "net_blocks_per_item" in r else "-"
+        lines.append(
+            f"{mode:<12}{r['throughput']:>10.2f}{r['p50_ms']:>8.1f}ms{r['p95_ms']:>8.1f}ms{r['p99_ms']:>8.1f}ms"
+            f"{peak:>11}{blocks:>14}{r['http_requests']:>10}"
+            f"{r.get('prompt_tokens_per_item', 0):>12.0f}{r.get('cached_prompt_share', 0):>8.0%}"
+        )
+    return "\n".join(lines)
+
+
+def compare(results: Dict[str, Dict[str, Any]], baseline: Dict[str, Dict[str, Any]],
+            tolerance: float) -> List[str]:
+    """Return a description of every regression beyond ``tolerance`` relative to ``baseline``."""
+    regressions = []
+    for mode, r in results.items():
+        base = baseline.get(mode)
+        if not base:
+            continue
+        if r["throughput"] < base["throughput"] * (1 - tolerance):
+            regressions.append(f"{mode}: throughput {r['throughput']:.2f}/s vs {base['throughput']:.2f}/s")
+        if r["p95_ms"] > base["p95_ms"] * (1 + tolerance):
+            regressions.append(f"{mode}: p95 {r['p95_ms']:.1f}ms vs {base['p95_ms']:.1f}ms")
+    return regressions
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    """Entry point for the offline benchmark"""
+
+    parser = argparse.ArgumentParser(description="Benchmark the pipeline against a local mock Fireworks API")
+    parser.add_argument("--modes", nargs="+", choices=MODES, default=list(MODES))
+    parser.add_argument("--dreams", type=int, default=20, help="Dreams per mode")
+    parser.add_argument("--concurrency", type=int, default=8, help="Dreams in flight for batch/concurrent")
+    parser.add_argument("--latency", type=float, default=0.2, help="Mock chat time to first byte (s)")
+    parser.add_argument("--jitter", type=float, default=0.05, help="Uniform latency jitter (s)")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Fraction of 429/503 responses")
+    parser.add_argument("--payload-chars", type=int, default=1500, help="Characters per chat response")
+    parser.add_argument("--image-bytes", type=int, default=1_500_000, help="Bytes per image")
+    parser.add_argument("--image-latency", type=float, default=1.0, help="Mock image render time (s)")
+    parser.add_argument("--prefill-delay", type=float, default=0.0002,
+                        help="Mock prefill time per prompt token missing the prefix cache (s)")
+    parser.add_argument("--batch-size", type=int, default=8, help="Largest batch in microbatch mode")
+    parser.add_argument("--batch-wait", type=float, default=0.02, help="Longest batching wait in microbatch mode (s)")
+    parser.add_argument("--image-format", type=str, default=None, choices=["webp", "avif", "jpeg", "png"],
+                        help="Post-process images into this format (default: keep the PNG)")
+    parser.add_argument("--thumbnails", type=int, nargs="*", default=[], help="Thumbnail sizes to write")
+    parser.add_argument("--seed", type=int, default=0, help="Random seed for the mock server")
+    parser.add_argument("--verbose", action="store_true", help="Show the pipeline's console output")
+    parser.add_argument("--no-memory", action="store_true", help="Skip tracemalloc measurements")
+    parser.add_argument("--json", type=str, default=None, help="Write results to this JSON file")
+    parser.add_argument("--baseline", type=str, default=None, help="Compare against a previous --json file")
+    parser.add_argument("--tolerance", type=float, default=0.15, help="Allowed relative regression")
+    args = parser.parse_args(argv)
+
+    results = run_benchmarks(args)
+    print(format_results(results))
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=2)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = compare(results, json.load(f), args.tolerance)
+        for line in regressions:
+            print(f"REGRESSION {line}")
+        return 1 if regressions else 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
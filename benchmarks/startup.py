@@ -0,0 +1,130 @@
+"""
+Startup benchmark: import time and cold first-call latency.
+
+Every measurement runs in a fresh interpreter, as the job runner does, and is
+repeated to smooth out noise. Reported phases:
+    interpreter     bare `python -c pass`
+    import_cli      importing modules.main (what `python -m modules.main --help` pays)
+    import_pipeline importing modules.pipeline and modules.llm_client
+    client_init     constructing LLMClient (no network, no SDK imports)
+    warmup          importing openai/httpx and building the clients
+    first_call      first generate_text request (only with --call)
+
+Run from the repository root:
+    python -m benchmarks.startup --repeat 5
+    python -m benchmarks.startup --call --base-url http://127.0.0.1:8000/inference/v1
+    python -m benchmarks.startup --importtime
+"""
+
+import os
+import sys
+import json
+import time
+import argparse
+import statistics
+import subprocess
+from typing import Dict, List
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Runs inside the child interpreter and prints phase timings as JSON
+CHILD_SCRIPT = r"""
+import json, sys, time
+timings = {}
+start = time.perf_counter()
+import modules.main
+timings["import_cli"] = time.perf_counter() - start
+
+start = time.perf_counter()
+from modules.pipeline import DreamAnalysisPipeline
+from modules.llm_client import LLMClient
+timings["import_pipeline"] = time.perf_counter() - start
+
+start = time.perf_counter()
+client = LLMClient(max_tokens=16)
+timings["client_init"] = time.perf_counter() - start
+
+start = time.perf_counter()
+client.warmup()
+timings["warmup"] = time.perf_counter() - start
+
+if "--call" in sys.argv:
+    start = time.perf_counter()
+    client.generate_text("Reply with the single word: ok")
+    timings["first_call"] = time.perf_counter() - start
+
+print(json.dumps(timings))
+"""
+
+
+def _run_child(call: bool, env: Dict[str, str]) -> Dict[str, float]:
+    args = [sys.executable, "-c", CHILD_SCRIPT] + (["--call"] if call else [])
+    output = subprocess.run(args, cwd=REPO_ROOT, env=env, capture_output=True, text=True, check=True)
+    # The timings are the last line; anything before it is client logging
+    return json.loads(output.stdout.strip().splitlines()[-1])
+
+
+def _interpreter_time(env: Dict[str, str]) -> float:
+    args = [sys.executable, "-c", "pass"]
+    start = time.perf_counter()
+    subprocess.run(args, cwd=REPO_ROOT, env=env, capture_output=True, check=True)
+    return time.perf_counter() - start
+
+
+def import_profile(top: int = 15) -> List[str]:
+    """Return the slowest imports (cumulative microseconds) reported by -X importtime."""
+    output = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", "import modules.pipeline, modules.llm_client"],
+        cwd=REPO_ROOT, capture_output=True, text=True, check=True,
+    )
+    rows = []
+    for line in output.stderr.splitlines():
+        if not line.startswith("import time:"):
+            continue
+        # "import time: self [us] | cumulative | imported package"
+        parts = [part.strip() for part in line[len("import time:"):].split("|")]
+        if len(parts) != 3 or not parts[1].isdigit():
+            continue
+        rows.append((int(parts[1]), parts[2]))
+    rows.sort(reverse=True)
+    return [f"{cumulative / 1000:8.1f} ms  {name}" for cumulative, name in rows[:top]]
+
+
+def main():
+    """Entry point for the startup benchmark"""
+
+    parser = argparse.ArgumentParser(description="Measure import time and cold first-call latency")
+    parser.add_argument("--repeat", type=int, default=5, help="Fresh interpreters per measurement")
+    parser.add_argument("--call", action="store_true", help="Include the first API request")
+    parser.add_argument("--base-url", type=str, default=None,
+                        help="API root for --call (e.g. a local mock server)")
+    parser.add_argument("--importtime", action="store_true",
+                        help="Also list the slowest imports reported by -X importtime")
+    args = parser.parse_args()
+
+    env = dict(os.environ)
+    # The warmup builds the OpenAI client, which refuses to start without a key
+    env.setdefault("FIREWORKS_API_KEY", "benchmark")
+    if args.base_url:
+        env["FIREWORKS_BASE_URL"] = args.base_url
+
+    runs = []
+    interpreter = []
+    for _ in range(args.repeat):
+        interpreter.append(_interpreter_time(env))
+        runs.append(_run_child(args.call, env))
+
+    print(f"{'phase':<16}{'median':>10}{'min':>10}")
+    print(f"{'interpreter':<16}{statistics.median(interpreter) * 1000:>8.1f}ms{min(interpreter) * 1000:>8.1f}ms")
+    for phase in runs[0]:
+        values = [run[phase] for run in runs]
+        print(f"{phase:<16}{statistics.median(values) * 1000:>8.1f}ms{min(values) * 1000:>8.1f}ms")
+
+    if args.importtime:
+        print("\nSlowest imports (cumulative):")
+        for line in import_profile():
+            print(line)
+
+
+if __name__ == "__main__":
+    main()
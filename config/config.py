@@ -1,8 +1,30 @@
 import os
-from dotenv import load_dotenv
 
-load_dotenv()
+_env_loaded = False
 
-class Config:
-    FIREWORKS_API_KEY = os.getenv("FIREWORKS_API_KEY")
 
+def load_env() -> None:
+    """Load variables from .env once, on first use rather than at import time."""
+    global _env_loaded
+    if not _env_loaded:
+        from dotenv import load_dotenv
+        load_dotenv()
+        _env_loaded = True
+
+
+class _ConfigMeta(type):
+    """Resolves settings lazily so importing config does not read .env."""
+
+    @property
+    def FIREWORKS_API_KEY(cls):
+        load_env()
+        return os.getenv("FIREWORKS_API_KEY")
+
+    @property
+    def FIREWORKS_BASE_URL(cls):
+        load_env()
+        return os.getenv("FIREWORKS_BASE_URL", "https://api.fireworks.ai/inference/v1")
+
+
+class Config(metaclass=_ConfigMeta):
+    pass
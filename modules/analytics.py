@@ -0,0 +1,411 @@
+"""
+Incrementally maintained dream analytics.
+
+Dashboards need emotion frequency over time, the distribution of emotional
+intensity and which symbols appear together, overall and per dreamer. Instead of
+rescanning the archive for every query, DreamAnalytics keeps these aggregates in
+NumPy arrays and updates them as each analyzed dream lands:
+
+- emotion counts per day, a dense (days x emotions) array
+- intensity counts per day, a dense (days x levels) array, plus whole-history totals
+- symbol counts, and a sparse symbol co-occurrence matrix stored as adjacency maps
+
+Whole-history counts are O(1) to read. Windowed trends cost O(days in window), and
+the symbols co-occurring with one symbol cost O(k) in its k neighbours. After a
+restart, ``rebuild`` reloads the aggregates from a DreamStore in vectorized chunks.
+
+Example:
+    analytics = DreamAnalytics().rebuild(store)
+    pipeline = DreamAnalysisPipeline(store=store, analytics=analytics)
+    analytics.emotion_counts(user="u123")
+    analytics.co_occurring("water", k=5)
+
+Requires NumPy (listed under the optional dependencies).
+"""
+
+import time
+import threading
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from .store import DreamStore, _normalize
+
+# Series holding the aggregates over every dreamer
+ALL_USERS = ""
+
+
+def _grow(vector: np.ndarray, size: int) -> np.ndarray:
+    """Return ``vector`` zero-padded to at least ``size`` entries, doubling to keep growth amortised."""
+    if size <= len(vector):
+        return vector
+    grown = np.zeros(max(size, 2 * len(vector)), dtype=vector.dtype)
+    grown[:len(vector)] = vector
+    return grown
+
+
+class _DayCounts:
+    """Counts per time bucket and category, in a dense array that grows in both dimensions."""
+
+    def __init__(self):
+        self.first: Optional[int] = None
+        self.last: Optional[int] = None
+        self.counts = np.zeros((0, 0), dtype=np.int64)
+
+    def _fit(self, low: int, high: int, columns: int) -> None:
+        """Make room for buckets low..high and ``columns`` categories."""
+        rows, cols = self.counts.shape
+        if self.first is None:
+            self.first = low
+        start = min(self.first, low)
+        end = self.first + rows
+        if high >= end:
+            end = max(high + 1, start + 2 * rows)
+        new_cols = max(columns, 2 * cols) if columns > cols else cols
+        if start == self.first and end == self.first + rows and new_cols == cols:
+            return
+        grown = np.zeros((end - start, new_cols), dtype=np.int64)
+        offset = self.first - start
+        grown[offset:offset + rows, :cols] = self.counts
+        self.counts, self.first = grown, start
+
+    def add(self, buckets: np.ndarray, columns: np.ndarray) -> None:
+        if not len(buckets):
+            return
+        low, high = int(buckets.min()), int(buckets.max())
+        self._fit(low, high, int(columns.max()) + 1)
+        self.last = high if self.last is None else max(self.last, high)
+        np.add.at(self.counts, (buckets - self.first, columns), 1)
+
+    def add_one(self, bucket: int, column: int) -> None:
+        self._fit(bucket, bucket, column + 1)
+        self.last = bucket if self.last is None else max(self.last, bucket)
+        self.counts[bucket - self.first, column] += 1
+
+    def window(self, low: Optional[int], high: Optional[int], columns: int) -> Tuple[int, np.ndarray]:
+        """First bucket and counts of buckets low..high (inclusive), clipped to the data."""
+        if self.first is None:
+            return (low or 0), np.zeros((0, columns), dtype=np.int64)
+        start = self.first if low is None else max(low, self.first)
+        # Rows past the last bucket seen are spare capacity, not empty days
+        stop = self.last + 1 if high is None else min(high + 1, self.last + 1)
+        block = self.counts[max(0, start - self.first):max(0, stop - self.first)]
+        if block.shape[1] < columns:
+            block = np.pad(block, ((0, 0), (0, columns - block.shape[1])))
+        return start, block[:, :columns]
+
+
+class _Series:
+    """Aggregates for one dreamer (or for all of them)."""
+
+    def __init__(self, levels: int):
+        self.dreams = 0
+        self.emotions = _DayCounts()
+        self.intensity = _DayCounts()
+        self.emotion_totals = np.zeros(0, dtype=np.int64)
+        self.intensity_totals = np.zeros(levels, dtype=np.int64)
+        self.symbol_totals = np.zeros(0, dtype=np.int64)
+        # Sparse, symmetric co-occurrence matrix: symbol -> {other symbol: dreams with both}
+        self.cooccurrence: Dict[int, Dict[int, int]] = {}
+
+    def add(self, buckets: np.ndarray, emotions: np.ndarray, intensities: np.ndarray,
+            symbols: np.ndarray, pair_counts: Sequence[Tuple[int, int, int]]) -> None:
+        self.dreams += len(buckets)
+        self.emotions.add(buckets, emotions)
+        self.intensity.add(buckets, intensities)
+        if len(emotions):
+            self.emotion_totals = _grow(self.emotion_totals, int(emotions.max()) + 1)
+            np.add.at(self.emotion_totals, emotions, 1)
+        np.add.at(self.intensity_totals, intensities, 1)
+        if len(symbols):
+            self.symbol_totals = _grow(self.symbol_totals, int(symbols.max()) + 1)
+            np.add.at(self.symbol_totals, symbols, 1)
+        self._add_pairs(pair_counts)
+
+    def add_one(self, bucket: int, emotion: int, intensity: int, symbols: Sequence[int]) -> None:
+        """Scalar twin of add for a single dream, avoiding the array set-up cost."""
+        self.dreams += 1
+        self.emotions.add_one(bucket, emotion)
+        self.intensity.add_one(bucket, intensity)
+        self.emotion_totals = _grow(self.emotion_totals, emotion + 1)
+        self.emotion_totals[emotion] += 1
+        self.intensity_totals[intensity] += 1
+        if symbols:
+            self.symbol_totals = _grow(self.symbol_totals, max(symbols) + 1)
+            self.symbol_totals[list(symbols)] += 1
+        self._add_pairs([(a, b, 1) for i, a in enumerate(symbols) for b in symbols[i + 1:]])
+
+    def _add_pairs(self, pair_counts: Sequence[Tuple[int, int, int]]) -> None:
+        for a, b, count in pair_counts:
+            row = self.cooccurrence.setdefault(a, {})
+            row[b] = row.get(b, 0) + count
+            row = self.cooccurrence.setdefault(b, {})
+            row[a] = row.get(a, 0) + count
+
+
+class DreamAnalytics:
+    """Emotion, intensity and symbol aggregates per dreamer, updated as dreams are analyzed."""
+
+    def __init__(self, bucket_seconds: float = 86400, max_intensity: int = 5):
+        """
+        Args:
+            bucket_seconds: Width of the time buckets trends are counted in (default: one day, UTC)
+            max_intensity: Highest emotional intensity; values outside 0..max_intensity are clipped
+        """
+        self.bucket_seconds = bucket_seconds
+        self.max_intensity = max_intensity
+        self._emotion_ids: Dict[str, int] = {}
+        self._emotions: List[str] = []
+        self._symbol_ids: Dict[str, int] = {}
+        self._symbols: List[str] = []
+        self._series: Dict[str, _Series] = {}
+        self._lock = threading.Lock()
+
+    # Updates
+
+    def _id(self, ids: Dict[str, int], names: List[str], name: str) -> int:
+        index = ids.get(name)
+        if index is None:
+            index = ids[name] = len(names)
+            names.append(name)
+        return index
+
+    def _series_for(self, user: str) -> _Series:
+        series = self._series.get(user)
+        if series is None:
+            series = self._series[user] = _Series(self.max_intensity + 1)
+        return series
+
+    def record(self, dream: Any, created_at: Optional[float] = None) -> None:
+        """
+        Add one analyzed dream to the aggregates.
+
+        Args:
+            dream: DreamSchema (or a dict with the same fields)
+            created_at: When the dream was recorded (Unix timestamp, defaults to now)
+        """
+        data = dream.model_dump() if hasattr(dream, "model_dump") else dream
+        bucket = int((time.time() if created_at is None else created_at) // self.bucket_seconds)
+        intensity = min(max(int(data.get("emotionalIntensity") or 0), 0), self.max_intensity)
+        user = data.get("userId") or ALL_USERS
+        with self._lock:
+            emotion = self._id(self._emotion_ids, self._emotions, _normalize(data.get("primaryEmotion", "")))
+            symbols = [self._id(self._symbol_ids, self._symbols, symbol)
+                       for symbol in {_normalize(s) for s in data.get("mainSymbols", [])} - {""}]
+            self._series_for(ALL_USERS).add_one(bucket, emotion, intensity, symbols)
+            if user != ALL_USERS:
+                self._series_for(user).add_one(bucket, emotion, intensity, symbols)
+
+    def rebuild(self, store: DreamStore, chunk_size: int = 5000) -> "DreamAnalytics":
+        """
+        Replace the aggregates with ones computed from every dream in a store.
+
+        The archive is read in chunks of ``chunk_size`` dreams, and each chunk is
+        counted with array operations rather than dream by dream.
+        """
+        with self._lock:
+            self._series.clear()
+        for chunk in store.scan(chunk_size):
+            self._add_chunk(chunk)
+        return self
+
+    def _add_chunk(self, rows: Sequence[Tuple[float, str, int, str, Iterable[str]]]) -> None:
+        """Count (created_at, emotion, intensity, user, symbols) rows, overall and per user."""
+        with self._lock:
+            n = len(rows)
+            buckets = np.floor(np.fromiter((row[0] for row in rows), dtype=np.float64, count=n)
+                               / self.bucket_seconds).astype(np.int64)
+            emotions = np.fromiter((self._id(self._emotion_ids, self._emotions, row[1]) for row in rows),
+                                   dtype=np.int64, count=n)
+            intensities = np.clip(np.fromiter((row[2] for row in rows), dtype=np.int64, count=n),
+                                  0, self.max_intensity)
+            users = [row[3] for row in rows]
+
+            # Flatten the symbols into (dream, symbol) columns, sorted by dream
+            owners: List[int] = []
+            symbols: List[int] = []
+            for position, row in enumerate(rows):
+                for symbol in row[4]:
+                    owners.append(position)
+                    symbols.append(self._id(self._symbol_ids, self._symbols, symbol))
+            owner_array = np.asarray(owners, dtype=np.int64)
+            symbol_array = np.asarray(symbols, dtype=np.int64)
+            pair_owners, pair_a, pair_b = self._pairs(owner_array, symbol_array)
+
+            self._add_to(ALL_USERS, slice(None), buckets, emotions, intensities,
+                         symbol_array, pair_a, pair_b)
+            if not any(users):
+                return
+            # Split rows, symbols and pairs by user with one sort each instead of a pass per user
+            names, user_of_row = np.unique(np.asarray(users, dtype=object), return_inverse=True)
+            user_of_row = user_of_row.reshape(-1)
+            row_groups = self._groups(user_of_row, len(names))
+            symbol_groups = self._groups(user_of_row[owner_array], len(names))
+            pair_groups = self._groups(user_of_row[pair_owners], len(names))
+            for index, user in enumerate(names):
+                if user == ALL_USERS:
+                    continue
+                pairs = pair_groups[index]
+                self._add_to(user, row_groups[index], buckets, emotions, intensities,
+                             symbol_array[symbol_groups[index]], pair_a[pairs], pair_b[pairs])
+
+    @staticmethod
+    def _groups(keys: np.ndarray, count: int) -> List[np.ndarray]:
+        """Indices of the entries with each key 0..count-1, in their original order."""
+        order = np.argsort(keys, kind="stable")
+        return np.split(order, np.searchsorted(keys[order], np.arange(1, count)))
+
+    @staticmethod
+    def _pairs(owners: np.ndarray, symbols: np.ndarray) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """
+        Every unordered pair of distinct symbols within each dream.
+
+        ``owners`` is sorted, so the symbols of one dream are contiguous; comparing the
+        arrays with themselves shifted by 1, 2, ... positions finds all pairs in as many
+        vectorized steps as the largest dream has symbols.
+        """
+        pair_owners, pair_a, pair_b = [], [], []
+        for shift in range(1, len(owners)):
+            same = owners[:-shift] == owners[shift:]
+            if not same.any():
+                break
+            first, second = symbols[:-shift][same], symbols[shift:][same]
+            pair_owners.append(owners[:-shift][same])
+            pair_a.append(np.minimum(first, second))
+            pair_b.append(np.maximum(first, second))
+        if not pair_owners:
+            empty = np.zeros(0, dtype=np.int64)
+            return empty, empty, empty
+        return np.concatenate(pair_owners), np.concatenate(pair_a), np.concatenate(pair_b)
+
+    def _add_to(self, user: str, rows, buckets: np.ndarray, emotions: np.ndarray, intensities: np.ndarray,
+                symbols: np.ndarray, pair_a: np.ndarray, pair_b: np.ndarray) -> None:
+        pair_counts: List[Tuple[int, int, int]] = []
+        if len(pair_a):
+            width = len(self._symbols)
+            keys, counts = np.unique(pair_a * width + pair_b, return_counts=True)
+            pair_counts = list(zip((keys // width).tolist(), (keys % width).tolist(), counts.tolist()))
+        self._series_for(user).add(buckets[rows], emotions[rows], intensities[rows], symbols, pair_counts)
+
+    # Queries
+
+    def users(self) -> List[str]:
+        """IDs of the dreamers with aggregates of their own."""
+        with self._lock:
+            return sorted(user for user in self._series if user != ALL_USERS)
+
+    def dream_count(self, user: Optional[str] = None) -> int:
+        """Number of dreams counted, overall or for one dreamer."""
+        with self._lock:
+            series = self._series.get(user or ALL_USERS)
+            return series.dreams if series else 0
+
+    def emotion_counts(self, user: Optional[str] = None) -> Dict[str, int]:
+        """Primary emotion frequencies over the whole history, most frequent first."""
+        with self._lock:
+            series = self._series.get(user or ALL_USERS)
+            if series is None:
+                return {}
+            totals = series.emotion_totals
+            order = np.argsort(-totals, kind="stable")
+            return {self._emotions[i]: int(totals[i]) for i in order if totals[i]}
+
+    def emotion_trend(self, user: Optional[str] = None, since: Optional[float] = None,
+                      until: Optional[float] = None) -> Tuple[np.ndarray, List[str], np.ndarray]:
+        """
+        Emotion counts per time bucket.
+
+        Args:
+            user: Dreamer to report on (all dreamers if omitted)
+            since: Start of the window (Unix timestamp, inclusive)
+            until: End of the window (Unix timestamp, exclusive)
+
+        Returns:
+            Bucket start times, emotion names and a (buckets x emotions) count array
+        """
+        with self._lock:
+            series = self._series.get(user or ALL_USERS)
+            names = list(self._emotions)
+            if series is None:
+                return np.zeros(0), names, np.zeros((0, len(names)), dtype=np.int64)
+            first, counts = series.emotions.window(*self._bucket_range(since, until), len(names))
+            counts = counts.copy()
+        return (first + np.arange(len(counts))) * self.bucket_seconds, names, counts
+
+    def intensity_distribution(self, user: Optional[str] = None, since: Optional[float] = None,
+                               until: Optional[float] = None) -> np.ndarray:
+        """Number of dreams at each intensity level (index 0 counts dreams without one)."""
+        with self._lock:
+            series = self._series.get(user or ALL_USERS)
+            if series is None:
+                return np.zeros(self.max_intensity + 1, dtype=np.int64)
+            if since is None and until is None:
+                return series.intensity_totals.copy()
+            _, counts = series.intensity.window(*self._bucket_range(since, until), self.max_intensity + 1)
+            return counts.sum(axis=0)
+
+    def top_symbols(self, user: Optional[str] = None, k: int = 10) -> List[Tuple[str, int]]:
+        """The ``k`` most frequent symbols with their dream counts."""
+        with self._lock:
+            series = self._series.get(user or ALL_USERS)
+            if series is None:
+                return []
+            totals = series.symbol_totals
+            k = min(k, int(np.count_nonzero(totals)))
+            if k < 1:
+                return []
+            best = np.argpartition(-totals, k - 1)[:k]
+            best = best[np.argsort(-totals[best], kind="stable")]
+            return [(self._symbols[i], int(totals[i])) for i in best]
+
+    def co_occurring(self, symbol: str, user: Optional[str] = None, k: int = 10) -> List[Tuple[str, int]]:
+        """Symbols that appeared in the same dreams as ``symbol``, most frequent first."""
+        with self._lock:
+            series = self._series.get(user or ALL_USERS)
+            index = self._symbol_ids.get(_normalize(symbol))
+            if series is None or index is None:
+                return []
+            row = series.cooccurrence.get(index, {})
+            best = sorted(row.items(), key=lambda item: -item[1])[:k]
+            return [(self._symbols[other], count) for other, count in best]
+
+    def cooccurrence_matrix(self, user: Optional[str] = None) -> Tuple[List[str], np.ndarray, np.ndarray, np.ndarray]:
+        """
+        The whole co-occurrence matrix in coordinate form, for export or scipy.sparse.
+
+        Returns:
+            Symbol names and the row indices, column indices and counts of the
+            non-zero entries (both triangles)
+        """
+        with self._lock:
+            series = self._series.get(user or ALL_USERS)
+            names = list(self._symbols)
+            entries = [(a, b, count) for a, row in (series.cooccurrence.items() if series else ())
+                       for b, count in row.items()]
+        if not entries:
+            empty = np.zeros(0, dtype=np.int64)
+            return names, empty, empty, empty
+        rows, cols, counts = (np.asarray(column, dtype=np.int64) for column in zip(*entries))
+        return names, rows, cols, counts
+
+    def summary(self, user: Optional[str] = None, days: int = 30, k: int = 10) -> Dict[str, Any]:
+        """JSON-serialisable dashboard data for the last ``days`` buckets."""
+        since = (np.floor(time.time() / self.bucket_seconds) - days + 1) * self.bucket_seconds
+        starts, names, counts = self.emotion_trend(user, since=since)
+        return {
+            "dreams": self.dream_count(user),
+            "emotions": self.emotion_counts(user),
+            "emotionTrend": {
+                "bucketStarts": starts.tolist(),
+                "emotions": names,
+                "counts": counts.tolist(),
+            },
+            "intensity": self.intensity_distribution(user)[1:].tolist(),
+            "topSymbols": [{"symbol": name, "count": count} for name, count in self.top_symbols(user, k)],
+        }
+
+    def _bucket_range(self, since: Optional[float], until: Optional[float]) -> Tuple[Optional[int], Optional[int]]:
+        low = None if since is None else int(np.floor(since / self.bucket_seconds))
+        # until is exclusive
+        high = None if until is None else int(np.ceil(until / self.bucket_seconds)) - 1
+        return low, high
@@ -0,0 +1,182 @@
+"""
+Micro-batching of structured requests.
+
+Under load, every queued dream would otherwise be its own chat completion, each
+paying the request overhead and re-sending the shared instructions and schema.
+A MicroBatcher holds requests for up to ``max_wait`` seconds and sends the ones
+that arrived in that window as a single multi-item request
+(LLMClient.generate_structured_batch), then hands each caller its own answer.
+A batch is sent as soon as it reaches ``max_batch_size``, so latency only grows
+when traffic is light.
+
+Requests are only batched together when they go to the same transport with the
+same model, temperature, token budget, schema and instructions, so routed
+requests stay on their route.
+
+Example:
+    batcher = MicroBatcher(max_batch_size=8, max_wait=0.02)
+    analysis = batcher.generate(llm_client, prompt, DreamAnalysis, system=DREAM_ANALYSIS_SYSTEM_PROMPT)
+    # or, from async code
+    analysis = await batcher.agenerate(llm_client, prompt, DreamAnalysis, system=DREAM_ANALYSIS_SYSTEM_PROMPT)
+"""
+
+import time
+import asyncio
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, Dict, Hashable, List, Optional, Tuple, TYPE_CHECKING
+
+from .metrics import Metrics, metrics as default_metrics
+
+if TYPE_CHECKING:
+    from pydantic import BaseModel
+    from .llm_client import LLMClient
+
+
+class _Batch:
+    """Requests collected for one batch key."""
+
+    __slots__ = ("llm_client", "schema_model", "system", "prompts", "futures", "opened", "deadline")
+
+    def __init__(self, llm_client: "LLMClient", schema_model: "BaseModel", system: Optional[str], max_wait: float):
+        self.llm_client = llm_client
+        self.schema_model = schema_model
+        self.system = system
+        self.prompts: List[str] = []
+        self.futures: List[Future] = []
+        self.opened = time.monotonic()
+        self.deadline = self.opened + max_wait
+
+
+class MicroBatcher:
+    """Coalesces structured requests arriving within a short window into batched upstream calls."""
+
+    def __init__(self, max_batch_size: int = 8, max_wait: float = 0.02, max_workers: int = 4,
+                 metrics: Optional[Metrics] = None):
+        """
+        Args:
+            max_batch_size: Most requests answered by one upstream call
+            max_wait: Longest time, in seconds, the first request of a batch waits for others
+            max_workers: Batches in flight upstream at once
+            metrics: Instrumentation front end (defaults to the process-wide one)
+        """
+        if max_batch_size < 1:
+            raise ValueError("max_batch_size must be at least 1")
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait
+        self.max_workers = max_workers
+        self.metrics = metrics or default_metrics
+        self._pending: Dict[Hashable, _Batch] = {}
+        self._condition = threading.Condition()
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._flusher: Optional[threading.Thread] = None
+        self._closed = False
+
+    @staticmethod
+    def _key(llm_client: "LLMClient", schema_model: "BaseModel", system: Optional[str]) -> Tuple:
+        # Copies made by with_options share the transport, so they batch together when
+        # their generation settings match
+        return (id(llm_client.transport), llm_client.model, llm_client.temperature, llm_client.max_tokens,
+                schema_model, system)
+
+    def submit(self, llm_client: "LLMClient", prompt: str, schema_model: "BaseModel",
+               system: Optional[str] = None) -> Future:
+        """
+        Queue a structured request for the next batch.
+
+        Args:
+            llm_client: Client (and with it model and settings) the request is sent with
+            prompt: The per-request prompt
+            schema_model: Pydantic model defining the expected JSON structure
+            system: Optional static instructions, shared by every request in a batch
+
+        Returns:
+            A future resolving to the validated schema_model instance
+        """
+        future: Future = Future()
+        key = self._key(llm_client, schema_model, system)
+        with self._condition:
+            if self._closed:
+                raise RuntimeError("MicroBatcher is closed")
+            self._start()
+            batch = self._pending.get(key)
+            if batch is None:
+                batch = self._pending[key] = _Batch(llm_client, schema_model, system, self.max_wait)
+                # Wake the flusher so it waits for this batch's deadline
+                self._condition.notify()
+            batch.prompts.append(prompt)
+            batch.futures.append(future)
+            if len(batch.prompts) >= self.max_batch_size:
+                self._dispatch(self._pending.pop(key))
+        return future
+
+    def generate(self, llm_client: "LLMClient", prompt: str, schema_model: "BaseModel",
+                 system: Optional[str] = None) -> "BaseModel":
+        """Blocking form of submit: returns the validated schema_model instance."""
+        return self.submit(llm_client, prompt, schema_model, system).result()
+
+    async def agenerate(self, llm_client: "LLMClient", prompt: str, schema_model: "BaseModel",
+                        system: Optional[str] = None) -> "BaseModel":
+        """Async form of submit; the batch itself runs on the batcher's worker threads."""
+        return await asyncio.wrap_future(self.submit(llm_client, prompt, schema_model, system))
+
+    def _start(self) -> None:
+        """Create the worker threads on first use. Called with the condition held."""
+        if self._flusher is None:
+            self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="micro-batch")
+            self._flusher = threading.Thread(target=self._flush_loop, name="micro-batch-flusher", daemon=True)
+            self._flusher.start()
+
+    def _flush_loop(self) -> None:
+        """Send every batch whose wait has expired, sleeping until the next deadline."""
+        with self._condition:
+            while True:
+                now = time.monotonic()
+                for key in [key for key, batch in self._pending.items() if self._closed or batch.deadline <= now]:
+                    self._dispatch(self._pending.pop(key))
+                if self._closed:
+                    return
+                timeout = min((batch.deadline for batch in self._pending.values()), default=None)
+                self._condition.wait(None if timeout is None else max(0.0, timeout - now))
+
+    def _dispatch(self, batch: _Batch) -> None:
+        """Hand a closed batch to a worker thread. Called with the condition held."""
+        self.metrics.observe("batch_wait_seconds", time.monotonic() - batch.opened)
+        self._executor.submit(self._run, batch)
+
+    @staticmethod
+    def _run(batch: _Batch) -> None:
+        try:
+            if len(batch.prompts) == 1:
+                results = [batch.llm_client.generate_structured_json(
+                    batch.prompts[0], batch.schema_model, system=batch.system, as_model=True)]
+            else:
+                results = batch.llm_client.generate_structured_batch(
+                    batch.prompts, batch.schema_model, system=batch.system)
+        except Exception as e:
+            for future in batch.futures:
+                future.set_exception(e)
+            return
+        for future, result in zip(batch.futures, results):
+            future.set_result(result)
+
+    def flush(self) -> None:
+        """Send every pending batch now, without waiting for its deadline."""
+        with self._condition:
+            for key in list(self._pending):
+                self._dispatch(self._pending.pop(key))
+
+    def close(self) -> None:
+        """Send the pending batches, wait for every batch in flight and stop the worker threads."""
+        with self._condition:
+            self._closed = True
+            self._condition.notify()
+        if self._flusher is not None:
+            self._flusher.join()
+            self._executor.shutdown()
+
+    def __enter__(self) -> "MicroBatcher":
+        return self
+
+    def __exit__(self, *exc_info: Any) -> None:
+        self.close()
@@ -0,0 +1,281 @@
+"""
+Response cache for the LLM client.
+
+Responses are keyed on a hash of everything that determines the model output
+(model, temperature, max_tokens, messages and schema). A bounded in-memory LRU
+tier sits in front of an optional SQLite tier that survives restarts.
+"""
+
+import json
+import time
+import hashlib
+import sqlite3
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional
+
+
+def make_cache_key(model: str, temperature: float, max_tokens: int,
+                   messages: List[Dict], schema: Optional[Dict] = None) -> str:
+    """
+    Build a content-addressed cache key for a completion request.
+
+    Args:
+        model: Model identifier
+        temperature: Sampling temperature
+        max_tokens: Maximum tokens to generate
+        messages: Chat messages sent to the model
+        schema: JSON schema of the structured response, if any
+
+    Returns:
+        Hex SHA-256 digest identifying the request
+    """
+    payload = json.dumps(
+        {
+            "model": model,
+            "temperature": temperature,
+            "max_tokens": max_tokens,
+            "messages": messages,
+            "schema": schema,
+        },
+        sort_keys=True,
+        separators=(",", ":"),
+    )
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class MemoryCache:
+    """Thread-safe in-memory LRU cache with optional TTL."""
+
+    def __init__(self, max_entries: int = 1024, ttl: Optional[float] = None):
+        """
+        Args:
+            max_entries: Maximum number of entries kept before evicting the least recently used
+            ttl: Seconds an entry stays valid (None keeps entries until evicted)
+        """
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries: "OrderedDict[str, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> Optional[str]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            value, stored_at = entry
+            if self.ttl is not None and time.time() - stored_at > self.ttl:
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key: str, value: str) -> None:
+        with self._lock:
+            self._entries[key] = (value, time.time())
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
+class SQLiteCache:
+    """
+    Persistent cache tier backed by a single SQLite file.
+
+    Reads do not write: the access times that drive LRU eviction are buffered and
+    written in batches, and rows are evicted in batches once the table has grown
+    past ``max_entries``, so neither a hit nor an insert pays for a table scan.
+    """
+
+    def __init__(self, path: str, max_entries: int = 100_000, ttl: Optional[float] = None,
+                 touch_batch: int = 256, touch_interval: float = 30.0):
+        """
+        Args:
+            path: Path to the SQLite database file
+            max_entries: Maximum number of rows kept before evicting the least recently used
+            ttl: Seconds an entry stays valid (None keeps entries until evicted)
+            touch_batch: Buffered access times that trigger a write
+            touch_interval: Most seconds an access time stays buffered
+        """
+        self.path = path
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.touch_batch = touch_batch
+        self.touch_interval = touch_interval
+        # Rows removed at once when the cap is exceeded
+        self._evict_batch = max(1, max_entries // 20)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS responses ("
+            "key TEXT PRIMARY KEY, value TEXT NOT NULL, "
+            "created_at REAL NOT NULL, accessed_at REAL NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS responses_accessed ON responses(accessed_at)")
+        self._conn.commit()
+        # Upper bound on the row count (replacing a key counts as an insert); the
+        # table is only counted when this passes max_entries
+        self._rows = self._conn.execute("SELECT COUNT(*) FROM responses").fetchone()[0]
+        # Key -> last access time not yet written
+        self._touched: Dict[str, float] = {}
+        self._touched_since = time.time()
+
+    def get(self, key: str) -> Optional[str]:
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT value, created_at FROM responses WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                return None
+            value, created_at = row
+            if self.ttl is not None and now - created_at > self.ttl:
+                self._touched.pop(key, None)
+                self._conn.execute("DELETE FROM responses WHERE key = ?", (key,))
+                self._conn.commit()
+                return None
+            if not self._touched:
+                self._touched_since = now
+            self._touched[key] = now
+            if len(self._touched) >= self.touch_batch or now - self._touched_since >= self.touch_interval:
+                self._flush_touches()
+                self._conn.commit()
+            return value
+
+    def set(self, key: str, value: str) -> None:
+        now = time.time()
+        with self._lock:
+            self._touched.pop(key, None)
+            self._conn.execute(
+                "INSERT OR REPLACE INTO responses (key, value, created_at, accessed_at) VALUES (?, ?, ?, ?)",
+                (key, value, now, now),
+            )
+            self._rows += 1
+            if self._rows > self.max_entries:
+                self._evict()
+            self._conn.commit()
+
+    def _flush_touches(self) -> None:
+        """Write the buffered access times (the caller holds the lock and commits)."""
+        if self._touched:
+            self._conn.executemany("UPDATE responses SET accessed_at = ? WHERE key = ?",
+                                   [(accessed_at, key) for key, accessed_at in self._touched.items()])
+            self._touched.clear()
+
+    def _evict(self) -> None:
+        """Trim the least recently used rows once the size cap is exceeded, a batch at a time."""
+        self._rows = self._conn.execute("SELECT COUNT(*) FROM responses").fetchone()[0]
+        if self._rows <= self.max_entries:
+            return
+        # Recent reads must count before choosing what to drop
+        self._flush_touches()
+        # Down to a batch below the cap, so the next evictions are a batch of inserts away
+        excess = self._rows - (self.max_entries - self._evict_batch)
+        self._conn.execute(
+            "DELETE FROM responses WHERE key IN ("
+            "SELECT key FROM responses ORDER BY accessed_at LIMIT ?)",
+            (excess,),
+        )
+        self._rows -= excess
+
+    def clear(self) -> None:
+        with self._lock:
+            self._touched.clear()
+            self._conn.execute("DELETE FROM responses")
+            self._conn.commit()
+            self._rows = 0
+
+    def close(self) -> None:
+        with self._lock:
+            self._flush_touches()
+            self._conn.commit()
+            self._conn.close()
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM responses").fetchone()[0]
+
+
+class ResponseCache:
+    """
+    Two-tier response cache: an in-memory LRU in front of an optional persistent tier.
+
+    Values are stored as JSON so every hit returns a fresh object the caller may mutate.
+    """
+
+    def __init__(self, memory: Optional[MemoryCache] = None, disk: Optional[SQLiteCache] = None):
+        """
+        Args:
+            memory: In-memory tier (a default LRU is created when omitted)
+            disk: Optional persistent tier
+        """
+        self.memory = memory if memory is not None else MemoryCache()
+        self.disk = disk
+        self.hits = 0
+        self.misses = 0
+        self.disk_hits = 0
+        self._lock = threading.Lock()
+
+    @classmethod
+    def with_sqlite(cls, path: str, max_memory_entries: int = 1024,
+                    max_disk_entries: int = 100_000, ttl: Optional[float] = None) -> "ResponseCache":
+        """Create a cache with both the memory and SQLite tiers."""
+        return cls(
+            memory=MemoryCache(max_entries=max_memory_entries, ttl=ttl),
+            disk=SQLiteCache(path, max_entries=max_disk_entries, ttl=ttl),
+        )
+
+    def get(self, key: str) -> Optional[Any]:
+        """Return the cached value for the key, or None on a miss."""
+        value = self.memory.get(key)
+        from_disk = False
+        if value is None and self.disk is not None:
+            value = self.disk.get(key)
+            if value is not None:
+                # Promote to the memory tier so the next hit is cheap
+                self.memory.set(key, value)
+                from_disk = True
+
+        with self._lock:
+            if value is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            if from_disk:
+                self.disk_hits += 1
+        return json.loads(value)
+
+    def set(self, key: str, value: Any) -> None:
+        """Store a successful response. Callers must never pass fabricated error values."""
+        serialized = json.dumps(value)
+        self.memory.set(key, serialized)
+        if self.disk is not None:
+            self.disk.set(key, serialized)
+
+    def clear(self) -> None:
+        self.memory.clear()
+        if self.disk is not None:
+            self.disk.clear()
+
+    def close(self) -> None:
+        """Close the persistent tier, writing its buffered access times."""
+        if self.disk is not None:
+            self.disk.close()
+
+    def stats(self) -> Dict[str, int]:
+        """Return hit/miss counters."""
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "disk_hits": self.disk_hits,
+                "memory_entries": len(self.memory),
+            }
@@ -0,0 +1,236 @@
+"""
+Near-duplicate detection for dreams.
+
+Dreams are embedded from their narrative and main symbols and kept in an
+in-memory vector index. When a new dream is close enough to one analyzed
+before (the same recurring nightmare, a re-submission), the pipeline can reuse
+the earlier analysis and image instead of paying for another LLM call and
+image render.
+
+Embeddings come from hashed character n-grams by default, which needs nothing
+beyond NumPy. A local embedding model can be plugged in with CallableEmbedder:
+
+    from sentence_transformers import SentenceTransformer
+    model = SentenceTransformer("all-MiniLM-L6-v2")
+    index = DreamIndex(embedder=CallableEmbedder(model.encode))
+
+Requires NumPy (listed under the optional dependencies).
+"""
+
+import os
+import json
+import zlib
+import threading
+from typing import Any, Callable, Dict, List, NamedTuple, Optional, Sequence
+
+import numpy as np
+
+
+def dream_text(dream: Any) -> str:
+    """The text a dream is embedded from: its narrative followed by its symbols."""
+    return f"{dream.narrative}\n{', '.join(dream.mainSymbols)}"
+
+
+class HashingEmbedder:
+    """
+    Embeds dreams as L2-normalised signed feature hashes of character n-grams.
+
+    Character n-grams are robust to small rewordings and typos, which is what
+    near-duplicate submissions tend to differ by. Symbols are hashed as whole
+    tokens and weighted separately.
+    """
+
+    def __init__(self, dim: int = 512, ngram_range: Sequence[int] = (3, 5), symbol_weight: float = 2.0):
+        """
+        Args:
+            dim: Embedding dimension
+            ngram_range: Smallest and largest character n-gram length
+            symbol_weight: Weight of each main symbol relative to a single n-gram
+        """
+        self.dim = dim
+        self.ngram_range = tuple(ngram_range)
+        self.symbol_weight = symbol_weight
+
+    def _features(self, dream: Any):
+        text = f" {' '.join(dream.narrative.lower().split())} "
+        low, high = self.ngram_range
+        for n in range(low, high + 1):
+            for i in range(len(text) - n + 1):
+                yield text[i:i + n], 1.0
+        for symbol in dream.mainSymbols:
+            yield "symbol:" + " ".join(symbol.lower().split()), self.symbol_weight
+
+    def embed(self, dream: Any) -> np.ndarray:
+        indices, weights = [], []
+        for feature, weight in self._features(dream):
+            # crc32 rather than hash(): stable across processes, so saved indexes stay valid
+            h = zlib.crc32(feature.encode())
+            indices.append(h % self.dim)
+            weights.append(weight if h & 0x80000000 else -weight)
+        vector = np.bincount(np.asarray(indices, dtype=np.int64), weights=weights,
+                             minlength=self.dim).astype(np.float32)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+
+class CallableEmbedder:
+    """Adapts a text encoder (e.g. a local sentence-embedding model's ``encode``) to dreams."""
+
+    def __init__(self, encode: Callable[[List[str]], Any]):
+        """
+        Args:
+            encode: Function mapping a list of texts to a 2-D array of embeddings
+        """
+        self.encode = encode
+
+    def embed(self, dream: Any) -> np.ndarray:
+        vector = np.asarray(self.encode([dream_text(dream)])[0], dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+
+class Match(NamedTuple):
+    """A previously analyzed dream similar to the query."""
+    score: float
+    payload: Dict[str, Any]
+
+
+class DreamIndex:
+    """
+    Cosine-similarity index over dream embeddings.
+
+    Small indexes are searched exactly with a single matrix-vector product. Once
+    the index grows past ``exact_limit`` vectors, random-hyperplane LSH tables
+    narrow the search to candidates sharing a bucket with the query, and only
+    those are scored exactly.
+    """
+
+    def __init__(self, embedder: Optional[Any] = None, threshold: float = 0.92,
+                 image_threshold: Optional[float] = 0.8, exact_limit: int = 20_000,
+                 lsh_tables: int = 8, lsh_bits: int = 12, seed: int = 0):
+        """
+        Args:
+            embedder: Object with an ``embed(dream) -> vector`` method (defaults to HashingEmbedder)
+            threshold: Similarity at or above which the whole analysis and image are reused
+            image_threshold: Lower similarity at which only the image is reused and the
+                             analysis is regenerated (None disables image-only reuse)
+            exact_limit: Index size up to which every vector is scored
+            lsh_tables: Number of LSH hash tables
+            lsh_bits: Hyperplanes (signature bits) per LSH table
+            seed: Seed for the LSH hyperplanes
+        """
+        self.embedder = embedder or HashingEmbedder()
+        self.threshold = threshold
+        self.image_threshold = image_threshold
+        self.exact_limit = exact_limit
+        self.lsh_tables = lsh_tables
+        self.lsh_bits = lsh_bits
+        self.seed = seed
+        self._vectors: Optional[np.ndarray] = None
+        self._size = 0
+        self._payloads: List[Dict[str, Any]] = []
+        self._planes: Optional[np.ndarray] = None
+        self._buckets: List[Dict[int, List[int]]] = []
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return self._size
+
+    def _signatures(self, vectors: np.ndarray) -> np.ndarray:
+        """LSH bucket id of each vector in each table, shape (n, tables)."""
+        if self._planes is None:
+            rng = np.random.default_rng(self.seed)
+            self._planes = rng.standard_normal(
+                (self.lsh_tables, self.lsh_bits, vectors.shape[1])).astype(np.float32)
+        bits = np.einsum("tbd,nd->ntb", self._planes, vectors) > 0
+        return bits.astype(np.int64) @ (1 << np.arange(self.lsh_bits, dtype=np.int64))
+
+    def _index_rows(self, start: int, stop: int) -> None:
+        if not self._buckets:
+            self._buckets = [{} for _ in range(self.lsh_tables)]
+        signatures = self._signatures(self._vectors[start:stop])
+        for offset, row in enumerate(signatures):
+            for table, signature in enumerate(row):
+                self._buckets[table].setdefault(int(signature), []).append(start + offset)
+
+    def _append(self, vectors: np.ndarray, payloads: List[Dict[str, Any]]) -> None:
+        count = len(vectors)
+        if self._vectors is None:
+            self._vectors = np.empty((max(1024, count), vectors.shape[1]), dtype=np.float32)
+        elif self._size + count > len(self._vectors):
+            # Grow geometrically so appends stay amortised O(1)
+            grown = np.empty((max(2 * len(self._vectors), self._size + count), vectors.shape[1]),
+                             dtype=np.float32)
+            grown[:self._size] = self._vectors[:self._size]
+            self._vectors = grown
+        self._vectors[self._size:self._size + count] = vectors
+        self._payloads.extend(payloads)
+        self._size += count
+        if self._size > self.exact_limit:
+            # Build the LSH tables the first time the limit is crossed, then keep them current
+            first = 0 if not self._buckets else self._size - count
+            self._index_rows(first, self._size)
+
+    def add(self, dream: Any, payload: Dict[str, Any]) -> None:
+        """
+        Add an analyzed dream.
+
+        Args:
+            dream: The dream (DreamSchema) the payload belongs to
+            payload: JSON-serialisable data returned on a match, e.g. the analysis and image path
+        """
+        vector = self.embedder.embed(dream)
+        with self._lock:
+            self._append(vector[None, :], [payload])
+
+    def search(self, dream: Any, k: int = 5) -> List[Match]:
+        """Return up to ``k`` indexed dreams most similar to ``dream``, best first."""
+        query = self.embedder.embed(dream)
+        with self._lock:
+            if not self._size:
+                return []
+            if self._buckets:
+                signature = self._signatures(query[None, :])[0]
+                candidates = set()
+                for table, bucket in zip(self._buckets, signature):
+                    candidates.update(table.get(int(bucket), ()))
+                rows = np.fromiter(candidates, dtype=np.int64, count=len(candidates))
+            else:
+                rows = np.arange(self._size)
+            if not len(rows):
+                return []
+            scores = self._vectors[rows] @ query
+            k = min(k, len(rows))
+            best = np.argpartition(-scores, k - 1)[:k]
+            best = best[np.argsort(-scores[best])]
+            return [Match(float(scores[i]), self._payloads[rows[i]]) for i in best]
+
+    def lookup(self, dream: Any) -> Optional[Match]:
+        """Return the closest indexed dream if it clears the lower of the two thresholds."""
+        matches = self.search(dream, k=1)
+        if not matches:
+            return None
+        floor = self.threshold if self.image_threshold is None else min(self.threshold, self.image_threshold)
+        return matches[0] if matches[0].score >= floor else None
+
+    def save(self, path: str) -> None:
+        """Write the vectors and payloads to ``path`` (atomically replaced)."""
+        with self._lock:
+            vectors = self._vectors[:self._size] if self._vectors is not None else np.empty((0, 0), np.float32)
+            payloads = json.dumps(self._payloads)
+        temp_path = f"{path}.tmp"
+        with open(temp_path, "wb") as f:
+            np.savez(f, vectors=vectors, payloads=np.array(payloads))
+        os.replace(temp_path, path)
+
+    def load(self, path: str) -> "DreamIndex":
+        """Add the vectors and payloads saved at ``path``; a missing file is ignored."""
+        if not os.path.exists(path):
+            return self
+        with np.load(path) as data:
+            vectors = data["vectors"]
+            payloads = json.loads(str(data["payloads"]))
+        if len(vectors):
+            with self._lock:
+                self._append(vectors.astype(np.float32), payloads)
+        return self
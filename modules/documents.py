@@ -0,0 +1,123 @@
+"""
+Document store for inlined reference documents.
+
+Documents attached to a request are sent as base64 data URLs. Encoding a multi-MB
+PDF on every call is wasteful when the same symbol dictionaries are attached to
+every dream, so encoded payloads are cached, keyed by path, modification time
+and size, and evicted least-recently-used once a byte budget is exceeded.
+"""
+
+import os
+import mmap
+import base64
+import threading
+from collections import OrderedDict
+from typing import Dict, NamedTuple, Optional, Tuple
+
+# MIME types for the document formats that can be inlined
+DOCUMENT_MIME_TYPES = {
+    ".pdf": "application/pdf",
+}
+
+
+class EncodedDocument(NamedTuple):
+    """A document encoded as a data URL, with the size of the original file."""
+    url: str
+    size: int
+
+
+class DocumentStore:
+    """Thread-safe, byte-budgeted LRU cache of encoded documents."""
+
+    def __init__(self, max_bytes: int = 256 * 1024 * 1024):
+        """
+        Args:
+            max_bytes: Total size of cached data URLs before the least recently used are evicted
+        """
+        self.max_bytes = max_bytes
+        self.cached_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self._entries: "OrderedDict[Tuple[str, int, int], EncodedDocument]" = OrderedDict()
+        self._current_keys: Dict[str, Tuple[str, int, int]] = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _encode(path: str, size: int, mime_type: str) -> str:
+        """Base64-encode a file straight from a memory map, without reading it into a bytes copy."""
+        with open(path, 'rb') as file:
+            if size == 0:
+                encoded = b""
+            else:
+                with mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+                    encoded = base64.b64encode(mapped)
+        # Use transform=inline so Fireworks inlines the document into the prompt
+        return f"data:{mime_type};base64,{encoded.decode('ascii')}#transform=inline"
+
+    def get(self, path: str) -> Optional[EncodedDocument]:
+        """
+        Return the encoded document for a path.
+
+        Args:
+            path: Path to the document on disk
+
+        Returns:
+            The encoded document, or None if the file does not exist or its type
+            cannot be inlined
+        """
+        mime_type = DOCUMENT_MIME_TYPES.get(os.path.splitext(path)[1].lower())
+        if mime_type is None:
+            return None
+        try:
+            # A single stat gives existence, size and modification time
+            stat = os.stat(path)
+        except OSError:
+            return None
+
+        key = (os.path.abspath(path), stat.st_mtime_ns, stat.st_size)
+        with self._lock:
+            document = self._entries.get(key)
+            if document is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return document
+            self.misses += 1
+
+        document = EncodedDocument(self._encode(path, stat.st_size, mime_type), stat.st_size)
+
+        with self._lock:
+            if key not in self._entries:
+                # Drop the encoding of an older version of the same file
+                stale_key = self._current_keys.get(key[0])
+                if stale_key is not None and stale_key in self._entries:
+                    self.cached_bytes -= len(self._entries.pop(stale_key).url)
+                self._current_keys[key[0]] = key
+                self._entries[key] = document
+                self.cached_bytes += len(document.url)
+            self._entries.move_to_end(key)
+            while self.cached_bytes > self.max_bytes and len(self._entries) > 1:
+                evicted_key, evicted = self._entries.popitem(last=False)
+                self.cached_bytes -= len(evicted.url)
+                if self._current_keys.get(evicted_key[0]) == evicted_key:
+                    del self._current_keys[evicted_key[0]]
+        return document
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._current_keys.clear()
+            self.cached_bytes = 0
+
+    def stats(self) -> Dict[str, int]:
+        """Return hit/miss counters and the number of cached bytes."""
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "entries": len(self._entries),
+                "cached_bytes": self.cached_bytes,
+            }
+
+
+# Shared by every client in the process so batch runs encode each document once
+default_document_store = DocumentStore()
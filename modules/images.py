@@ -0,0 +1,190 @@
+"""
+Post-processing of generated images.
+
+The image API returns a 1024x1024 PNG of several megabytes. ImageProcessor
+re-encodes it to a compact format (WebP, AVIF or JPEG) at a configurable
+quality, writes thumbnails for the web UI and drops all metadata. Decoding and
+encoding are CPU-bound, so they run in a process pool and never hold up the
+threads or event loop serving requests.
+
+Example:
+    processor = ImageProcessor(format="webp", quality=80, thumbnail_sizes=(512, 256))
+    paths = processor.process("dream_results/dream_image_123.png")
+    # {"full": ".../dream_image_123.webp", "512": ".../dream_image_123_512.webp", ...}
+"""
+
+import os
+import time
+import asyncio
+import threading
+import multiprocessing
+from concurrent.futures import Executor, ProcessPoolExecutor
+from typing import Dict, List, Optional, Sequence, Tuple
+
+from .metrics import Metrics, metrics as default_metrics
+
+# Pillow format name and file extension for each supported output format
+IMAGE_FORMATS = {
+    "webp": ("WEBP", ".webp"),
+    "avif": ("AVIF", ".avif"),
+    "jpeg": ("JPEG", ".jpg"),
+    "png": ("PNG", ".png"),
+}
+
+
+def thumbnail_sizes(value: str) -> List[int]:
+    """
+    Parse comma-separated thumbnail sizes ("512,256"), for use as an argparse ``type``.
+
+    Raises:
+        ValueError: If a size is not a positive whole number of pixels
+    """
+    sizes = []
+    for size in value.split(","):
+        if size.strip():
+            if not size.strip().isdigit() or int(size) <= 0:
+                raise ValueError(f"thumbnail size {size.strip()!r} is not a positive number of pixels")
+            sizes.append(int(size))
+    return sizes
+
+
+def encode_image(source: str, image_format: str, quality: int, thumbnail_sizes: Sequence[int],
+                 keep_original: bool) -> Tuple[Dict[str, str], Dict[str, int], float]:
+    """
+    Re-encode an image and write its thumbnails next to it.
+
+    Runs in a worker process, so it takes and returns only plain values.
+
+    Returns:
+        Paths keyed by "full" or thumbnail size, their sizes in bytes, and the
+        seconds spent encoding
+    """
+    from PIL import Image
+
+    start = time.perf_counter()
+    pil_format, extension = IMAGE_FORMATS[image_format]
+    base = os.path.splitext(source)[0]
+    options = {"optimize": True} if pil_format in ("JPEG", "PNG") else {}
+    if pil_format != "PNG":
+        options["quality"] = quality
+    if pil_format == "WEBP":
+        options["method"] = 4
+
+    with Image.open(source) as original:
+        image = original.convert("RGBA" if original.mode in ("RGBA", "LA", "P") and pil_format != "JPEG" else "RGB")
+    # Nothing from the source (EXIF, ICC profile, PNG text chunks) is carried over
+    image.info = {}
+
+    paths: Dict[str, str] = {}
+    sizes: Dict[str, int] = {}
+
+    def save(img, key: str, path: str) -> None:
+        temp_path = f"{path}.tmp"
+        img.save(temp_path, format=pil_format, **options)
+        # Readers never see a partially written file
+        os.replace(temp_path, path)
+        paths[key] = path
+        sizes[key] = os.path.getsize(path)
+
+    full_path = base + extension
+    save(image, "full", full_path)
+
+    # Downscale from the previous (larger) thumbnail rather than the full image each time
+    thumbnail = image
+    for size in sorted(thumbnail_sizes, reverse=True):
+        thumbnail = thumbnail.copy()
+        thumbnail.thumbnail((size, size), Image.LANCZOS)
+        save(thumbnail, str(size), f"{base}_{size}{extension}")
+
+    if not keep_original and os.path.abspath(full_path) != os.path.abspath(source):
+        os.remove(source)
+    return paths, sizes, time.perf_counter() - start
+
+
+class ImageProcessor:
+    """Re-encodes generated images and writes thumbnails in a pool of worker processes."""
+
+    def __init__(self,
+                 format: str = "webp",
+                 quality: int = 80,
+                 thumbnail_sizes: Sequence[int] = (),
+                 keep_original: bool = False,
+                 max_workers: Optional[int] = None,
+                 metrics: Optional[Metrics] = None):
+        """
+        Args:
+            format: Output format: "webp", "avif", "jpeg" or "png"
+            quality: Encoder quality (1-100) for lossy formats
+            thumbnail_sizes: Longest-edge sizes, in pixels, of the thumbnails to write
+            keep_original: Keep the PNG returned by the image API next to the re-encoded file
+                           (a PNG output always replaces it)
+            max_workers: Worker processes (defaults to the CPU count; 0 encodes in the calling thread)
+            metrics: Instrumentation front end (defaults to the process-wide one)
+        """
+        if format not in IMAGE_FORMATS:
+            raise ValueError(f"Unsupported image format '{format}'. Choose from: {', '.join(IMAGE_FORMATS)}")
+        if format == "avif":
+            from PIL import features
+            if not features.check("avif"):
+                raise ValueError("This Pillow build cannot encode AVIF (Pillow 11.2+ with libavif is required)")
+        self.format = format
+        self.quality = quality
+        self.thumbnail_sizes = tuple(thumbnail_sizes)
+        self.keep_original = keep_original
+        self.max_workers = max_workers
+        self.metrics = metrics or default_metrics
+        self._executor: Optional[Executor] = None
+        self._lock = threading.Lock()
+
+    @property
+    def executor(self) -> Optional[Executor]:
+        """The shared process pool, created on first use (None when encoding inline)."""
+        if self.max_workers == 0:
+            return None
+        if self._executor is None:
+            with self._lock:
+                if self._executor is None:
+                    # spawn rather than fork: forking a process that runs threads can deadlock
+                    self._executor = ProcessPoolExecutor(
+                        max_workers=self.max_workers, mp_context=multiprocessing.get_context("spawn"))
+        return self._executor
+
+    def _args(self, path: str) -> tuple:
+        return (path, self.format, self.quality, self.thumbnail_sizes, self.keep_original)
+
+    def _record(self, result: Tuple[Dict[str, str], Dict[str, int], float]) -> Dict[str, str]:
+        paths, sizes, seconds = result
+        self.metrics.observe("image_encode_seconds", seconds, format=self.format)
+        for key, size in sizes.items():
+            self.metrics.observe("image_output_bytes", size, format=self.format,
+                                 variant="full" if key == "full" else "thumbnail")
+        return paths
+
+    def process(self, path: str) -> Dict[str, str]:
+        """
+        Re-encode an image and write its thumbnails, blocking until done.
+
+        Args:
+            path: Image written by LLMClient.generate_image
+
+        Returns:
+            Output paths keyed by "full" and by thumbnail size (as a string)
+        """
+        if self.executor is None:
+            return self._record(encode_image(*self._args(path)))
+        return self._record(self.executor.submit(encode_image, *self._args(path)).result())
+
+    async def aprocess(self, path: str) -> Dict[str, str]:
+        """Async twin of process."""
+        loop = asyncio.get_running_loop()
+        if self.executor is None:
+            result = await asyncio.to_thread(encode_image, *self._args(path))
+        else:
+            result = await loop.run_in_executor(self.executor, encode_image, *self._args(path))
+        return self._record(result)
+
+    def close(self) -> None:
+        """Shut down the worker processes."""
+        if self._executor is not None:
+            self._executor.shutdown()
+            self._executor = None
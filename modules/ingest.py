@@ -0,0 +1,390 @@
+"""
+Bulk import and export of dream journals.
+
+Journal exports of any size stream through the pipeline in constant memory.
+Rows are read lazily from CSV or JSONL and validated into DreamSchema. A
+bounded number of them are analyzed concurrently, and each result is appended
+to a JSONL file as soon as it finishes. Lines are in completion order and
+tagged with their input row.
+
+A checkpoint file next to the output records how far the import has got, so
+running the same command again after an interruption resumes where it stopped
+instead of starting over, and retries the rows whose analysis failed:
+
+    python -m modules.ingest import journal.csv results.jsonl --concurrency 16
+    python -m modules.ingest export dream_results dreams.jsonl
+
+CSV files need a header row with the DreamSchema field names (narrative,
+mainSymbols, primaryEmotion, emotionalIntensity, lifeConnection). mainSymbols
+may be a JSON list or a comma or semicolon separated string.
+"""
+
+import os
+import csv
+import json
+import asyncio
+import argparse
+from collections import deque
+from typing import Any, Dict, Iterator, NamedTuple, Optional, Set, Tuple
+
+from .pipeline import DreamAnalysisPipeline, DreamSchema, failure_reason
+from .store import DreamStore
+
+
+class ImportStats(NamedTuple):
+    """Outcome of an import run."""
+    analyzed: int
+    invalid: int
+    failed: int
+    skipped: int
+
+
+def read_journal(path: str, start: int = 0) -> Iterator[Tuple[int, Dict[str, Any]]]:
+    """
+    Lazily read a CSV or JSONL journal export.
+
+    Args:
+        path: File ending in .csv, or .jsonl/.ndjson (one JSON object per line)
+        start: Row number to start from; earlier rows are skipped without being parsed
+
+    Yields:
+        (row number, record) pairs. Rows are numbered from 0, counting CSV records or
+        JSONL lines. A JSONL line that is not valid JSON yields its error message as
+        the record.
+    """
+    extension = os.path.splitext(path)[1].lower()
+    if extension == ".csv":
+        # utf-8-sig drops the byte order mark spreadsheet exports often start with
+        with open(path, newline="", encoding="utf-8-sig") as f:
+            for row, record in enumerate(csv.DictReader(f)):
+                if row >= start:
+                    yield row, record
+    elif extension in (".jsonl", ".ndjson"):
+        with open(path, encoding="utf-8") as f:
+            for row, line in enumerate(f):
+                if row < start or not line.strip():
+                    continue
+                try:
+                    yield row, json.loads(line)
+                except ValueError as e:
+                    yield row, f"invalid JSON: {e}"
+    else:
+        raise ValueError(f"Unsupported journal format '{extension}'. Use .csv, .jsonl or .ndjson")
+
+
+def parse_dream(record: Dict[str, Any]) -> DreamSchema:
+    """
+    Validate a journal record into a DreamSchema.
+
+    Raises:
+        ValueError: If the record is not an object or does not match the schema
+            (pydantic.ValidationError is a ValueError)
+    """
+    if not isinstance(record, dict):
+        raise ValueError(record if isinstance(record, str) else "record is not an object")
+    symbols = record.get("mainSymbols")
+    if isinstance(symbols, str):
+        text = symbols.strip()
+        if text.startswith("["):
+            symbols = json.loads(text)
+        else:
+            separator = ";" if ";" in text else ","
+            symbols = [symbol.strip() for symbol in text.split(separator) if symbol.strip()]
+        record = {**record, "mainSymbols": symbols}
+    return DreamSchema.model_validate(record)
+
+
+class _Checkpoint:
+    """
+    Progress of an import, saved next to its output file.
+
+    ``row`` is the first input row not known to be finished; ``done`` holds rows
+    past it that already finished (results complete out of order); ``failed`` holds
+    finished rows whose analysis failed, which the next run retries; ``output_bytes``
+    is the size of the output file when the checkpoint was written.
+    """
+
+    def __init__(self, path: str, source: str):
+        self.path = path
+        self.source = os.path.abspath(source)
+        self.row = 0
+        self.done: Set[int] = set()
+        self.failed: Set[int] = set()
+        self.output_bytes = 0
+
+    def load(self) -> bool:
+        """Read the checkpoint; returns False if there is none for this source."""
+        if not os.path.exists(self.path):
+            return False
+        with open(self.path) as f:
+            data = json.load(f)
+        if data.get("source") != self.source:
+            raise ValueError(f"Checkpoint {self.path} belongs to {data.get('source')}, not {self.source}")
+        self.row = data["row"]
+        self.done = set(data["done"])
+        self.failed = set(data.get("failed", ()))
+        self.output_bytes = data["output_bytes"]
+        return True
+
+    def save(self, row: int, done: Set[int], failed: Set[int], output_bytes: int) -> None:
+        temp_path = f"{self.path}.tmp"
+        with open(temp_path, "w") as f:
+            json.dump({"source": self.source, "row": row, "done": sorted(done), "failed": sorted(failed),
+                       "output_bytes": output_bytes}, f)
+        # Never leave a half-written checkpoint behind
+        os.replace(temp_path, self.path)
+
+
+class JournalImporter:
+    """Streams a journal export through a pipeline with bounded concurrency."""
+
+    def __init__(self, pipeline: DreamAnalysisPipeline, concurrency: int = 8, checkpoint_every: int = 50,
+                 window: int = 1000):
+        """
+        Args:
+            pipeline: Pipeline analyzing each dream (its store, if any, archives them too)
+            concurrency: Maximum number of dreams analyzed at once
+            checkpoint_every: Finished rows between checkpoint writes
+            window: Most rows read past the oldest unfinished one; a stalled dream holds
+                    the reader back here rather than growing the checkpoint without bound
+        """
+        self.pipeline = pipeline
+        self.concurrency = concurrency
+        self.checkpoint_every = checkpoint_every
+        self.window = max(window, concurrency)
+
+    def run(self, source: str, output: str, resume: bool = True) -> ImportStats:
+        """Blocking wrapper around arun."""
+        return asyncio.run(self.arun(source, output, resume))
+
+    async def arun(self, source: str, output: str, resume: bool = True) -> ImportStats:
+        """
+        Import every dream in ``source`` and append one JSON line per row to ``output``.
+
+        Output lines are ``{"row": n, "result": {...}}`` for analyzed dreams,
+        ``{"row": n, "error": "..."}`` for invalid rows and ``{"row": n, "error": "...",
+        "retryable": true}`` for rows whose analysis or image failed. Failed rows are
+        retried when the import is resumed, so a row may have several lines; the last
+        one counts.
+
+        Args:
+            source: CSV or JSONL journal export
+            output: JSONL results file
+            resume: Continue from the checkpoint of an earlier, interrupted run of the
+                    same import (otherwise the output and checkpoint are started afresh)
+        """
+        checkpoint = _Checkpoint(f"{output}.checkpoint", source)
+        if resume and checkpoint.load():
+            written, failed_after = self._rows_written_after(output, checkpoint.output_bytes)
+            retry = (checkpoint.failed | failed_after) - written
+            skip = (checkpoint.done | written) - retry
+            print(f"Resuming {source} at row {checkpoint.row}"
+                  + (f", retrying {len(retry)} failed rows" if retry else ""))
+        else:
+            retry, skip = set(), set()
+            if os.path.exists(output):
+                os.remove(output)
+
+        analyzed = invalid = failed = skipped = 0
+        # Rows in reading order that are not yet known to be finished, and the
+        # finished rows among them; their head is the checkpoint position
+        open_rows: "deque[int]" = deque()
+        finished: Set[int] = set()
+        # Rows whose analysis failed (or that are still to be retried), kept for the next run
+        failed_rows = set(retry)
+        next_row = checkpoint.row
+        since_checkpoint = 0
+
+        with open(output, "a", encoding="utf-8") as out:
+            def write(line: Dict[str, Any]) -> None:
+                out.write(json.dumps(line) + "\n")
+                out.flush()
+
+            def finish(row: int) -> None:
+                nonlocal since_checkpoint
+                finished.add(row)
+                while open_rows and open_rows[0] in finished:
+                    finished.remove(open_rows.popleft())
+                since_checkpoint += 1
+                if since_checkpoint >= self.checkpoint_every:
+                    since_checkpoint = 0
+                    checkpoint.save(open_rows[0] if open_rows else next_row, finished, failed_rows, out.tell())
+
+            async def analyze(row: int, dream: DreamSchema) -> Tuple[int, Optional[Dict[str, Any]], Optional[str]]:
+                try:
+                    return row, await self.pipeline.aanalyze_dream(dream), None
+                except Exception as e:
+                    return row, None, str(e)
+
+            pending: Set["asyncio.Task"] = set()
+
+            async def drain(return_when: str) -> None:
+                nonlocal analyzed, failed
+                done, _ = await asyncio.wait(pending, return_when=return_when)
+                for task in done:
+                    pending.remove(task)
+                    row, result, error = task.result()
+                    # Upstream errors come back as error defaults rather than exceptions
+                    error = error or failure_reason(result)
+                    if error is None:
+                        write({"row": row, "result": result})
+                        analyzed += 1
+                    else:
+                        write({"row": row, "error": error, "retryable": True})
+                        failed_rows.add(row)
+                        failed += 1
+                    finish(row)
+
+            # Failed rows may lie before the checkpoint position; the rows between them were done
+            start = min(retry | {checkpoint.row})
+            for row, record in read_journal(source, start=start):
+                next_row = max(next_row, row + 1)
+                open_rows.append(row)
+                if row not in retry and (row < checkpoint.row or row in skip):
+                    # Finished before the interruption; kept in the checkpoint until passed
+                    skipped += 1
+                    finish(row)
+                    continue
+                failed_rows.discard(row)
+                try:
+                    dream = parse_dream(record)
+                except ValueError as e:
+                    write({"row": row, "error": f"invalid dream: {e}"})
+                    invalid += 1
+                    finish(row)
+                    continue
+                pending.add(asyncio.create_task(analyze(row, dream)))
+                # The reader only runs ahead of the workers by the pool size, and ahead of
+                # the oldest unfinished row (always a pending task) by the window
+                if len(pending) >= self.concurrency:
+                    await drain(asyncio.FIRST_COMPLETED)
+                while pending and len(open_rows) >= self.window:
+                    await drain(asyncio.FIRST_COMPLETED)
+            if pending:
+                await drain(asyncio.ALL_COMPLETED)
+            checkpoint.save(next_row, set(), failed_rows, out.tell())
+
+        return ImportStats(analyzed, invalid, failed, skipped)
+
+    @staticmethod
+    def _rows_written_after(output: str, offset: int) -> Tuple[Set[int], Set[int]]:
+        """
+        Rows finished after the checkpoint, and those among them that failed and
+        are to be retried. A partial last line (from a crash mid-write) is cut off
+        so appends start on a fresh line.
+        """
+        rows: Set[int] = set()
+        failed: Set[int] = set()
+        if not os.path.exists(output):
+            return rows, failed
+        with open(output, "r+b") as f:
+            f.seek(offset)
+            end = offset
+            for line in f:
+                if not line.endswith(b"\n"):
+                    break
+                data = json.loads(line)
+                # The last line for a row decides
+                if data.get("retryable"):
+                    rows.discard(data["row"])
+                    failed.add(data["row"])
+                else:
+                    failed.discard(data["row"])
+                    rows.add(data["row"])
+                end += len(line)
+            f.truncate(end)
+        return rows, failed
+
+
+def export_dreams(store: DreamStore, output: str, page_size: int = 500, **filters: Any) -> int:
+    """
+    Write stored dreams to a JSONL file, newest first, one page at a time.
+
+    Args:
+        store: Dream archive to read from
+        output: JSONL file to write
+        page_size: Dreams fetched per query
+        **filters: Passed to DreamStore.find (emotion, symbol, min_intensity, since, ...)
+
+    Returns:
+        The number of dreams written
+    """
+    count = 0
+    before = None
+    temp_path = f"{output}.tmp"
+    with open(temp_path, "w", encoding="utf-8") as out:
+        while True:
+            page = store.find(limit=page_size, before=before, **filters)
+            for dream in page:
+                out.write(json.dumps(dream) + "\n")
+            count += len(page)
+            if len(page) < page_size:
+                break
+            before = page[-1]["id"]
+    os.replace(temp_path, output)
+    return count
+
+
+def main():
+    """Entry point for bulk import and export"""
+
+    parser = argparse.ArgumentParser(description="Bulk import and export of dream journals")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    import_parser = commands.add_parser("import", help="Analyze every dream in a CSV or JSONL journal export")
+    import_parser.add_argument("source", help="Journal export (.csv, .jsonl or .ndjson)")
+    import_parser.add_argument("results", help="JSONL file the results are appended to")
+    import_parser.add_argument("--concurrency", type=int, default=8,
+                               help="Number of dreams analyzed at once")
+    import_parser.add_argument("--window", type=int, default=1000,
+                               help="Most rows read past the oldest dream still being analyzed")
+    import_parser.add_argument("--restart", action="store_true",
+                               help="Ignore an existing checkpoint and start from the first row")
+    import_parser.add_argument("--model", type=str,
+                               default="accounts/fireworks/models/llama-v3p3-70b-instruct",
+                               help="LLM model to use for analysis")
+    import_parser.add_argument("--temperature", type=float, default=0.6,
+                               help="Temperature for LLM generation (0.0-1.0)")
+    import_parser.add_argument("--output", type=str, default="dream_results",
+                               help="Directory holding the dream store and generated images")
+
+    export_parser = commands.add_parser("export", help="Write stored dreams to a JSONL file")
+    export_parser.add_argument("output", help="Directory holding the dream store")
+    export_parser.add_argument("destination", help="JSONL file to write")
+    export_parser.add_argument("--emotion", type=str, default=None, help="Only dreams with this primary emotion")
+    export_parser.add_argument("--symbol", type=str, default=None, help="Only dreams with this symbol")
+    args = parser.parse_args()
+
+    if args.command == "export":
+        with DreamStore(args.output) as store:
+            count = export_dreams(store, args.destination, emotion=args.emotion, symbol=args.symbol)
+        print(f"Exported {count} dreams to {args.destination}")
+        return
+
+    from .llm_client import LLMClient
+
+    llm_client = LLMClient(model=args.model, temperature=args.temperature)
+    with DreamStore(args.output) as store:
+        pipeline = DreamAnalysisPipeline(llm_client=llm_client, output_dir=args.output, store=store)
+        importer = JournalImporter(pipeline, concurrency=args.concurrency, window=args.window)
+
+        async def run_import() -> ImportStats:
+            try:
+                return await importer.arun(args.source, args.results, resume=not args.restart)
+            finally:
+                # The async pool belongs to this event loop
+                await llm_client.transport.aclose()
+
+        try:
+            stats = asyncio.run(run_import())
+        except KeyboardInterrupt:
+            print("\nInterrupted; run the same command again to resume from the checkpoint.")
+            return
+    print(f"Analyzed {stats.analyzed} dreams ({stats.invalid} invalid, {stats.failed} failed, "
+          f"{stats.skipped} already done)")
+    if stats.failed:
+        print("Run the same command again to retry the failed dreams.")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,386 @@
+"""
+Durable job queue shared by pipeline worker processes.
+
+Jobs follow the visibility-timeout model of SQS-style queues:
+
+- ``get`` leases the oldest ready job to one consumer for ``visibility_timeout``
+  seconds and hands it a receipt. While leased, the job is invisible to others.
+- ``ack`` (with the job's result) finishes it. ``nack`` (with an error) makes it
+  visible again after an exponential backoff.
+- If a consumer dies without doing either, the lease runs out and the job is
+  handed to the next consumer. Long jobs ``extend`` their lease as they go.
+- A job that has been leased ``max_attempts`` times without succeeding is moved
+  to the dead-letter state, where it stays until ``retry_dead`` requeues it.
+
+Acks and nacks only apply while the caller still holds the lease, so a consumer
+that stalled past its timeout cannot finish a job another consumer now owns.
+Delivery is therefore at least once, and jobs should be safe to run twice.
+
+Two backends share the JobQueue interface. SQLiteJobQueue works across threads
+and processes on one host (or any host that can lock the database file).
+MemoryJobQueue works within one process and serves as a stand-in in tests.
+Another backend (Redis, a cloud queue) only has to implement the same methods.
+
+Example:
+    queue = SQLiteJobQueue("dream_results/jobs.db")
+    job_id = queue.put({"dream": dream.model_dump()})
+    job = queue.get(visibility_timeout=300)
+    ...
+    queue.ack(job, result)
+"""
+
+import json
+import time
+import secrets
+import sqlite3
+import threading
+from typing import Any, Dict, List, NamedTuple, Optional
+
+from .store import new_dream_id
+
+# Job states as stored; "running" is derived for queued jobs under a lease
+JOB_STATES = ("queued", "running", "done", "dead")
+
+
+class QueuedJob(NamedTuple):
+    """A job leased to a consumer."""
+    id: str
+    payload: Dict[str, Any]
+    attempts: int
+    receipt: str
+
+
+class JobQueue:
+    """Interface of the durable job queue backends."""
+
+    def __init__(self, max_attempts: int = 5, retry_delay: float = 5.0, max_retry_delay: float = 300.0):
+        """
+        Args:
+            max_attempts: Leases after which a job that never succeeded is dead-lettered
+            retry_delay: Delay before a nacked job is visible again, doubled on every attempt
+            max_retry_delay: Upper bound of that delay
+        """
+        self.max_attempts = max_attempts
+        self.retry_delay = retry_delay
+        self.max_retry_delay = max_retry_delay
+
+    def _backoff(self, attempts: int) -> float:
+        return min(self.max_retry_delay, self.retry_delay * 2 ** max(0, attempts - 1))
+
+    def put(self, payload: Dict[str, Any], job_id: Optional[str] = None, delay: float = 0.0) -> str:
+        """Add a job (JSON-serialisable payload) and return its ID. An existing ID is left unchanged."""
+        raise NotImplementedError
+
+    def get(self, visibility_timeout: float = 300.0) -> Optional[QueuedJob]:
+        """Lease the oldest ready job, or return None if no job is ready."""
+        raise NotImplementedError
+
+    def extend(self, job: QueuedJob, visibility_timeout: float) -> bool:
+        """Push the lease's expiry to ``visibility_timeout`` seconds from now; False if the lease was lost."""
+        raise NotImplementedError
+
+    def ack(self, job: QueuedJob, result: Optional[Dict[str, Any]] = None) -> bool:
+        """Mark a leased job done with its result; False if the lease was lost."""
+        raise NotImplementedError
+
+    def nack(self, job: QueuedJob, error: str, retry: bool = True) -> bool:
+        """
+        Record a failed attempt. The job becomes visible again after a backoff, or is
+        dead-lettered if it is out of attempts or ``retry`` is False. False if the lease was lost.
+        """
+        raise NotImplementedError
+
+    def status(self, job_id: str) -> Optional[Dict[str, Any]]:
+        """State, attempts, result and last error of a job, or None if unknown."""
+        raise NotImplementedError
+
+    def stats(self) -> Dict[str, int]:
+        """Number of jobs in each of JOB_STATES."""
+        raise NotImplementedError
+
+    def dead_letters(self, limit: int = 100) -> List[Dict[str, Any]]:
+        """Dead-lettered jobs with their payload and last error, oldest first."""
+        raise NotImplementedError
+
+    def retry_dead(self) -> int:
+        """Requeue every dead-lettered job with fresh attempts; returns how many."""
+        raise NotImplementedError
+
+    def purge(self, before: float) -> int:
+        """Delete jobs that finished before ``before`` (Unix timestamp); returns how many."""
+        raise NotImplementedError
+
+    def close(self) -> None:
+        pass
+
+    def __enter__(self) -> "JobQueue":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+
+class SQLiteJobQueue(JobQueue):
+    """JobQueue in a SQLite database, shared by any number of threads and processes."""
+
+    def __init__(self, path: str, **options: Any):
+        """
+        Args:
+            path: Path to the SQLite database file
+            **options: max_attempts, retry_delay and max_retry_delay (see JobQueue)
+        """
+        super().__init__(**options)
+        self.path = path
+        self._lock = threading.Lock()
+        # Autocommit mode; leases are taken in explicit BEGIN IMMEDIATE transactions
+        self._conn = sqlite3.connect(path, timeout=30, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS jobs ("
+            "id TEXT PRIMARY KEY, state TEXT NOT NULL, payload TEXT NOT NULL, "
+            "attempts INTEGER NOT NULL DEFAULT 0, visible_at REAL NOT NULL, receipt TEXT, "
+            "created_at REAL NOT NULL, updated_at REAL NOT NULL, result TEXT, error TEXT)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS jobs_ready ON jobs(state, visible_at)")
+
+    def put(self, payload: Dict[str, Any], job_id: Optional[str] = None, delay: float = 0.0) -> str:
+        job_id = job_id or new_dream_id()
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR IGNORE INTO jobs (id, state, payload, visible_at, created_at, updated_at) "
+                "VALUES (?, 'queued', ?, ?, ?, ?)",
+                (job_id, json.dumps(payload), now + delay, now, now),
+            )
+        return job_id
+
+    def get(self, visibility_timeout: float = 300.0) -> Optional[QueuedJob]:
+        with self._lock:
+            # IMMEDIATE takes the write lock up front, so two processes never lease the same job
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                while True:
+                    now = time.time()
+                    row = self._conn.execute(
+                        "SELECT id, payload, attempts, error FROM jobs WHERE state = 'queued' AND visible_at <= ? "
+                        "ORDER BY visible_at LIMIT 1",
+                        (now,),
+                    ).fetchone()
+                    if row is None:
+                        self._conn.execute("COMMIT")
+                        return None
+                    job_id, payload, attempts, error = row
+                    if attempts >= self.max_attempts:
+                        # Every lease so far ran out without an ack: the job keeps killing its consumer
+                        self._conn.execute(
+                            "UPDATE jobs SET state = 'dead', receipt = NULL, updated_at = ?, error = ? WHERE id = ?",
+                            (now, error or f"lease expired {attempts} times", job_id),
+                        )
+                        continue
+                    receipt = secrets.token_hex(8)
+                    self._conn.execute(
+                        "UPDATE jobs SET attempts = attempts + 1, visible_at = ?, receipt = ?, updated_at = ? "
+                        "WHERE id = ?",
+                        (now + visibility_timeout, receipt, now, job_id),
+                    )
+                    self._conn.execute("COMMIT")
+                    return QueuedJob(job_id, json.loads(payload), attempts + 1, receipt)
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+
+    def _update_leased(self, job: QueuedJob, assignments: str, params: tuple) -> bool:
+        with self._lock:
+            cursor = self._conn.execute(
+                f"UPDATE jobs SET {assignments}, updated_at = ? WHERE id = ? AND receipt = ? AND state = 'queued'",
+                params + (time.time(), job.id, job.receipt),
+            )
+        return cursor.rowcount == 1
+
+    def extend(self, job: QueuedJob, visibility_timeout: float) -> bool:
+        return self._update_leased(job, "visible_at = ?", (time.time() + visibility_timeout,))
+
+    def ack(self, job: QueuedJob, result: Optional[Dict[str, Any]] = None) -> bool:
+        return self._update_leased(job, "state = 'done', receipt = NULL, result = ?, error = NULL",
+                                   (json.dumps(result),))
+
+    def nack(self, job: QueuedJob, error: str, retry: bool = True) -> bool:
+        if not retry or job.attempts >= self.max_attempts:
+            return self._update_leased(job, "state = 'dead', receipt = NULL, error = ?", (error,))
+        return self._update_leased(job, "visible_at = ?, receipt = NULL, error = ?",
+                                   (time.time() + self._backoff(job.attempts), error))
+
+    def status(self, job_id: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT state, attempts, visible_at, receipt, created_at, updated_at, result, error "
+                "FROM jobs WHERE id = ?",
+                (job_id,),
+            ).fetchone()
+        if row is None:
+            return None
+        state, attempts, visible_at, receipt, created_at, updated_at, result, error = row
+        if state == "queued" and receipt is not None and visible_at > time.time():
+            state = "running"
+        return {"id": job_id, "state": state, "attempts": attempts, "createdAt": created_at,
+                "updatedAt": updated_at, "result": json.loads(result) if result else None, "error": error}
+
+    def stats(self) -> Dict[str, int]:
+        now = time.time()
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT CASE WHEN state = 'queued' AND receipt IS NOT NULL AND visible_at > ? "
+                "THEN 'running' ELSE state END, COUNT(*) FROM jobs GROUP BY 1",
+                (now,),
+            ).fetchall()
+        counts = dict.fromkeys(JOB_STATES, 0)
+        counts.update(rows)
+        return counts
+
+    def dead_letters(self, limit: int = 100) -> List[Dict[str, Any]]:
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT id, payload, attempts, error, updated_at FROM jobs WHERE state = 'dead' "
+                "ORDER BY updated_at LIMIT ?",
+                (limit,),
+            ).fetchall()
+        return [{"id": job_id, "payload": json.loads(payload), "attempts": attempts, "error": error,
+                 "updatedAt": updated_at} for job_id, payload, attempts, error, updated_at in rows]
+
+    def retry_dead(self) -> int:
+        now = time.time()
+        with self._lock:
+            cursor = self._conn.execute(
+                "UPDATE jobs SET state = 'queued', attempts = 0, visible_at = ?, receipt = NULL, updated_at = ? "
+                "WHERE state = 'dead'",
+                (now, now),
+            )
+        return cursor.rowcount
+
+    def purge(self, before: float) -> int:
+        with self._lock:
+            cursor = self._conn.execute(
+                "DELETE FROM jobs WHERE state IN ('done', 'dead') AND updated_at < ?", (before,))
+        return cursor.rowcount
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+
+class MemoryJobQueue(JobQueue):
+    """In-process JobQueue with the same semantics, for a single process and for tests."""
+
+    def __init__(self, **options: Any):
+        super().__init__(**options)
+        self._jobs: Dict[str, Dict[str, Any]] = {}
+        self._lock = threading.Lock()
+
+    def put(self, payload: Dict[str, Any], job_id: Optional[str] = None, delay: float = 0.0) -> str:
+        job_id = job_id or new_dream_id()
+        now = time.time()
+        with self._lock:
+            # Stored as JSON, like the SQLite backend, so callers never share the payload object
+            self._jobs.setdefault(job_id, {
+                "state": "queued", "payload": json.dumps(payload), "attempts": 0, "visible_at": now + delay,
+                "receipt": None, "created_at": now, "updated_at": now, "result": None, "error": None,
+            })
+        return job_id
+
+    def get(self, visibility_timeout: float = 300.0) -> Optional[QueuedJob]:
+        now = time.time()
+        with self._lock:
+            while True:
+                ready = [(job["visible_at"], job_id) for job_id, job in self._jobs.items()
+                         if job["state"] == "queued" and job["visible_at"] <= now]
+                if not ready:
+                    return None
+                job_id = min(ready)[1]
+                job = self._jobs[job_id]
+                if job["attempts"] >= self.max_attempts:
+                    job.update(state="dead", receipt=None, updated_at=now,
+                               error=job["error"] or f"lease expired {job['attempts']} times")
+                    continue
+                job.update(attempts=job["attempts"] + 1, visible_at=now + visibility_timeout,
+                           receipt=secrets.token_hex(8), updated_at=now)
+                return QueuedJob(job_id, json.loads(job["payload"]), job["attempts"], job["receipt"])
+
+    def _leased(self, job: QueuedJob) -> Optional[Dict[str, Any]]:
+        """The stored job if ``job`` still holds its lease. Called with the lock held."""
+        stored = self._jobs.get(job.id)
+        if stored is None or stored["state"] != "queued" or stored["receipt"] != job.receipt:
+            return None
+        return stored
+
+    def extend(self, job: QueuedJob, visibility_timeout: float) -> bool:
+        with self._lock:
+            stored = self._leased(job)
+            if stored is not None:
+                stored.update(visible_at=time.time() + visibility_timeout, updated_at=time.time())
+            return stored is not None
+
+    def ack(self, job: QueuedJob, result: Optional[Dict[str, Any]] = None) -> bool:
+        with self._lock:
+            stored = self._leased(job)
+            if stored is not None:
+                stored.update(state="done", receipt=None, result=json.dumps(result), error=None,
+                              updated_at=time.time())
+            return stored is not None
+
+    def nack(self, job: QueuedJob, error: str, retry: bool = True) -> bool:
+        with self._lock:
+            stored = self._leased(job)
+            if stored is None:
+                return False
+            now = time.time()
+            if not retry or job.attempts >= self.max_attempts:
+                stored.update(state="dead", receipt=None, error=error, updated_at=now)
+            else:
+                stored.update(visible_at=now + self._backoff(job.attempts), receipt=None, error=error,
+                              updated_at=now)
+            return True
+
+    def status(self, job_id: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is None:
+                return None
+            state = job["state"]
+            if state == "queued" and job["receipt"] is not None and job["visible_at"] > time.time():
+                state = "running"
+            return {"id": job_id, "state": state, "attempts": job["attempts"], "createdAt": job["created_at"],
+                    "updatedAt": job["updated_at"], "result": json.loads(job["result"]) if job["result"] else None,
+                    "error": job["error"]}
+
+    def stats(self) -> Dict[str, int]:
+        counts = dict.fromkeys(JOB_STATES, 0)
+        with self._lock:
+            job_ids = list(self._jobs)
+        for job_id in job_ids:
+            status = self.status(job_id)
+            if status is not None:
+                counts[status["state"]] += 1
+        return counts
+
+    def dead_letters(self, limit: int = 100) -> List[Dict[str, Any]]:
+        with self._lock:
+            dead = sorted((job["updated_at"], job_id) for job_id, job in self._jobs.items() if job["state"] == "dead")
+            return [{"id": job_id, "payload": json.loads(self._jobs[job_id]["payload"]),
+                     "attempts": self._jobs[job_id]["attempts"], "error": self._jobs[job_id]["error"],
+                     "updatedAt": updated_at} for updated_at, job_id in dead[:limit]]
+
+    def retry_dead(self) -> int:
+        now = time.time()
+        with self._lock:
+            dead = [job for job in self._jobs.values() if job["state"] == "dead"]
+            for job in dead:
+                job.update(state="queued", attempts=0, visible_at=now, receipt=None, updated_at=now)
+        return len(dead)
+
+    def purge(self, before: float) -> int:
+        with self._lock:
+            finished = [job_id for job_id, job in self._jobs.items()
+                        if job["state"] in ("done", "dead") and job["updated_at"] < before]
+            for job_id in finished:
+                del self._jobs[job_id]
+        return len(finished)
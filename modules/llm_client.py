@@ -1,15 +1,118 @@
 import os
+import copy
 import json
-import base64
-from typing import Dict, Any, Optional, Union, List
-from pydantic import BaseModel, Field
-import openai
-import sys
-import os
+import tempfile
+import asyncio
+import time
+import functools
+import threading
+from typing import Dict, Any, Optional, Union, List, Iterator, AsyncIterator, Sequence, Tuple, BinaryIO, TYPE_CHECKING
 
-# Add the parent directory to sys.path to allow imports from the config package
-sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 from config.config import Config
+from .cache import ResponseCache, make_cache_key
+from .streaming import StructuredStream, AsyncStructuredStream, repair_json
+from .documents import DocumentStore, default_document_store
+from .transport import HTTPTransport
+from .scheduler import RequestScheduler
+from .metrics import Metrics, metrics as default_metrics
+
+if TYPE_CHECKING:
+    # openai and pydantic are imported on first use to keep CLI startup fast
+    import openai
+    from pydantic import BaseModel
+
+
+@functools.lru_cache(maxsize=None)
+def schema_for(schema_model: "BaseModel") -> Dict[str, Any]:
+    """
+    JSON schema of a Pydantic model class, generated once per class.
+    
+    The dictionary is shared between requests and must not be modified.
+    """
+    return schema_model.model_json_schema()
+
+
+@functools.lru_cache(maxsize=256)
+def structured_system_prompt(instructions: str, schema_model: "BaseModel") -> str:
+    """
+    System message for a structured request: the static instructions followed by
+    the compact schema JSON.
+    
+    Keys are sorted so the text is byte-identical across processes, which lets the
+    inference server serve this prefix from its KV cache instead of prefilling it
+    on every request.
+    """
+    schema = json.dumps(schema_for(schema_model), separators=(",", ":"), sort_keys=True)
+    return f"{instructions}\n\nRespond with a JSON object matching this schema:\n{schema}"
+
+
+BATCH_INSTRUCTIONS = (
+    "The user message holds several independent requests, numbered from 1. Answer each "
+    "one on its own and return the answers in the same order as the \"items\" list, "
+    "exactly one item per request."
+)
+
+# Start of the explanation filled in when structured generation fails, which marks error defaults
+ERROR_EXPLANATION_PREFIX = "Error generating explanation"
+
+# Generated images are written to their destination in chunks of this size
+IMAGE_CHUNK_BYTES = 64 * 1024
+# Images returned as file objects stay in memory up to this size, then spill to a temp file
+IMAGE_SPOOL_BYTES = 4 * 1024 * 1024
+
+# Makes "first finished attempt wins" atomic when hedged image downloads race to publish
+_publish_lock = threading.Lock()
+
+
+@functools.lru_cache(maxsize=None)
+def _default_file_mode() -> int:
+    """
+    Mode open() gives a new file under the process umask.
+    
+    The umask can only be read by setting it, so this is done once, at the first published image.
+    """
+    umask = os.umask(0o022)
+    os.umask(umask)
+    return 0o666 & ~umask
+
+
+@functools.lru_cache(maxsize=None)
+def batch_model_for(schema_model: "BaseModel") -> "BaseModel":
+    """Pydantic model holding a list of schema_model items, created once per class."""
+    from pydantic import create_model
+    return create_model(f"{schema_model.__name__}Batch", items=(List[schema_model], ...))
+
+
+@functools.lru_cache(maxsize=None)
+def _default_factories(schema_model: "BaseModel") -> Dict[str, Any]:
+    """Per-field factories of the empty values returned when generation fails, built once per schema."""
+    factories = {}
+    for field_name, field in schema_model.model_fields.items():
+        if field.annotation == str:
+            factories[field_name] = str
+        elif field.annotation in (int, float):
+            factories[field_name] = int
+        elif field.annotation in (bool, list, dict):
+            factories[field_name] = field.annotation
+        elif field.default_factory is not None:
+            # Handle nested models by checking if they have default factories
+            factories[field_name] = field.default_factory
+        else:
+            factories[field_name] = type(None)
+    return factories
+
+
+class StructuredOutputError(ValueError):
+    """Raised when a structured response cannot be parsed or validated, even after repair."""
+
+
+class ImageGenerationError(Exception):
+    """Raised when the image API returns an error response."""
+    
+    def __init__(self, message: str, response=None):
+        super().__init__(message)
+        self.response = response
+        self.status_code = getattr(response, "status_code", None)
 
 class LLMClient:
     """
@@ -21,7 +124,20 @@ class LLMClient:
                  api_key: Optional[str] = None,
                  model: str = "accounts/fireworks/models/llama-v3p3-70b-instruct",
                  max_tokens: int = 4096,
-                 temperature: float = 0.6):
+                 temperature: float = 0.6,
+                 cache: Optional[ResponseCache] = None,
+                 document_store: Optional[DocumentStore] = None,
+                 transport: Optional[HTTPTransport] = None,
+                 image_backend: str = "http",
+                 scheduler: Optional[RequestScheduler] = None,
+                 metrics: Optional[Metrics] = None,
+                 image_model: str = "stable-diffusion-xl-1024-v1-0",
+                 image_width: int = 1024,
+                 image_height: int = 1024,
+                 image_steps: int = 30,
+                 image_cfg_scale: float = 7,
+                 image_seed: int = 0,
+                 debug: bool = False):
         """
         Initialize the Fireworks LLM client.
         
@@ -30,96 +146,309 @@ class LLMClient:
             model: Model identifier to use
             max_tokens: Maximum tokens to generate in the response
             temperature: Controls randomness in generation (0.0-1.0)
+            cache: Optional response cache for text and structured JSON calls
+            document_store: Cache of encoded documents (defaults to the process-wide store)
+            transport: Pooled HTTP transport shared by chat and image requests
+            image_backend: "http" to render images over the pooled transport,
+                           "sdk" to use the fireworks-ai ImageInference client
+            scheduler: Rate limiting, retry and hedging policy for upstream calls
+            metrics: Instrumentation front end (defaults to the process-wide one)
+            image_model: Image generation model
+            image_width: Image width in pixels
+            image_height: Image height in pixels
+            image_steps: Diffusion steps per image (fewer is faster and rougher)
+            image_cfg_scale: How closely the image follows the prompt
+            image_seed: Seed for image generation (0 lets the API pick a random one)
+            debug: Print raw responses, attached documents and image requests
         """
         self.api_key = api_key or Config.FIREWORKS_API_KEY
         self.model = model
         self.max_tokens = max_tokens
         self.temperature = temperature
+        self.cache = cache
+        self.document_store = document_store if document_store is not None else default_document_store
         
-        # Initialize OpenAI client with Fireworks base URL
-        self.client = openai.OpenAI(
-            base_url="https://api.fireworks.ai/inference/v1",
-            api_key=self.api_key,
-        )
+        self.transport = transport or HTTPTransport()
+        self.image_backend = image_backend
+        self.metrics = metrics or default_metrics
+        self.debug = debug
+        self.scheduler = scheduler or RequestScheduler(metrics=self.metrics)
+        self.image_model = image_model
+        self.image_width = image_width
+        self.image_height = image_height
+        self.image_steps = image_steps
+        self.image_cfg_scale = image_cfg_scale
+        self.image_seed = image_seed
+        
+        # OpenAI clients are created on first request, so constructing an LLMClient stays cheap.
+        # They live in a dict so copies made by with_options() share them.
+        self._clients: Dict[str, Any] = {}
+        self._client_lock = threading.Lock()
+        
+        # fireworks-ai image clients, created once per model on first use
+        self._image_clients: Dict[str, Any] = {}
+        self._image_clients_lock = threading.Lock()
+    
+    @property
+    def client(self) -> "openai.OpenAI":
+        """Lazily constructed OpenAI client using the Fireworks base URL and pooled connections."""
+        if "sync" not in self._clients:
+            with self._client_lock:
+                if "sync" not in self._clients:
+                    import openai
+                    self._clients["sync"] = openai.OpenAI(
+                        base_url=self.transport.base_url,
+                        api_key=self.api_key,
+                        http_client=self.transport.client,
+                        # Retries are handled by the request scheduler
+                        max_retries=0,
+                    )
+        return self._clients["sync"]
+    
+    @property
+    def async_client(self) -> "openai.AsyncOpenAI":
+        """Lazily constructed async client sharing the same Fireworks configuration."""
+        if "async" not in self._clients:
+            with self._client_lock:
+                if "async" not in self._clients:
+                    import openai
+                    self._clients["async"] = openai.AsyncOpenAI(
+                        base_url=self.transport.base_url,
+                        api_key=self.api_key,
+                        http_client=self.transport.async_client,
+                        max_retries=0,
+                    )
+        return self._clients["async"]
+    
+    def with_options(self, **options) -> "LLMClient":
+        """
+        Return a copy of the client with some generation settings replaced, e.g.
+        ``client.with_options(model=..., max_tokens=1024, image_steps=12)``.
+        
+        The copy shares the connection pool, SDK clients, cache, scheduler and
+        metrics with the original, so it is cheap enough to make per request.
+        """
+        clone = copy.copy(self)
+        for name, value in options.items():
+            if not hasattr(self, name) or name.startswith("_"):
+                raise AttributeError(f"LLMClient has no option '{name}'")
+            setattr(clone, name, value)
+        return clone
+    
+    def warmup(self, connect: bool = False, use_async: bool = False) -> Dict[str, float]:
+        """
+        Import dependencies and build clients ahead of the first timed request.
+        
+        Args:
+            connect: Also open a pooled connection to the API (one cheap models request),
+                     so the first real request skips the TCP/TLS handshake
+            use_async: Build the async client as well
+            
+        Returns:
+            Seconds spent on each warm-up step
+        """
+        timings = {}
+        
+        start = time.perf_counter()
+        self.client
+        if use_async:
+            self.async_client
+        timings["clients"] = time.perf_counter() - start
+        
+        if self.image_backend == "sdk":
+            start = time.perf_counter()
+            self._image_client(self.image_model)
+            timings["image_client"] = time.perf_counter() - start
+        
+        if connect:
+            start = time.perf_counter()
+            try:
+                self.client.models.list()
+            except Exception as e:
+                print(f"Warm-up connection failed: {e}")
+            timings["connect"] = time.perf_counter() - start
         
-    def _create_message_with_documents(self, prompt: str, documents: Dict[str, str] = None) -> List[Dict]:
+        return timings
+    
+    def _estimate_tokens(self, messages: List[Dict]) -> int:
+        """
+        Upper-bound token estimate for rate limiting: roughly four characters per
+        prompt token plus the full completion budget. The scheduler corrects it
+        from response.usage once the call returns.
+        """
+        chars = 0
+        for message in messages:
+            content = message["content"]
+            if isinstance(content, str):
+                chars += len(content)
+            else:
+                chars += sum(len(part.get("text", "")) for part in content)
+        return chars // 4 + self.max_tokens
+    
+    @staticmethod
+    def _payload_size(messages: List[Dict]) -> int:
+        """Approximate request payload size in characters, including inlined documents."""
+        size = 0
+        for message in messages:
+            content = message["content"]
+            if isinstance(content, str):
+                size += len(content)
+            else:
+                for part in content:
+                    size += len(part.get("text", "")) + len(part.get("image_url", {}).get("url", ""))
+        return size
+    
+    def _record_request(self, request: Dict[str, Any], response: Any) -> None:
+        """Record payload size and token usage of a completed request."""
+        if not self.metrics.enabled:
+            return
+        operation = "stream" if request.get("stream") else "chat"
+        self.metrics.observe("llm_request_bytes", self._payload_size(request["messages"]), operation=operation)
+        usage = getattr(response, "usage", None)
+        if usage is not None:
+            self.metrics.inc("llm_prompt_tokens_total", usage.prompt_tokens or 0, model=self.model)
+            self.metrics.inc("llm_completion_tokens_total", usage.completion_tokens or 0, model=self.model)
+            # Prompt tokens the server reused from its prefix cache, where it reports them
+            details = getattr(usage, "prompt_tokens_details", None)
+            cached = getattr(details, "cached_tokens", None) if details is not None else None
+            if cached:
+                self.metrics.inc("llm_cached_prompt_tokens_total", cached, model=self.model)
+    
+    def _create(self, **request):
+        """Create a chat completion through the request scheduler."""
+        operation = "stream" if request.get("stream") else "chat"
+        with self.metrics.timer("llm_request_seconds", operation=operation):
+            response = self.scheduler.call(
+                lambda: self.client.chat.completions.create(**request),
+                estimated_tokens=self._estimate_tokens(request["messages"]),
+                # A stream is consumed as it arrives, so it cannot be raced against a duplicate
+                hedge=not request.get("stream")
+            )
+        self._record_request(request, response)
+        return response
+    
+    async def _acreate(self, **request):
+        """Async twin of _create."""
+        operation = "stream" if request.get("stream") else "chat"
+        with self.metrics.timer("llm_request_seconds", operation=operation):
+            response = await self.scheduler.acall(
+                lambda: self.async_client.chat.completions.create(**request),
+                estimated_tokens=self._estimate_tokens(request["messages"]),
+                # A stream is consumed as it arrives, so it cannot be raced against a duplicate
+                hedge=not request.get("stream")
+            )
+        self._record_request(request, response)
+        return response
+    
+    def _cache_get(self, cache_key: Optional[str]) -> Any:
+        """Look up a cached response and count the hit or miss."""
+        if not cache_key:
+            return None
+        cached = self.cache.get(cache_key)
+        self.metrics.inc("llm_cache_requests_total", result="miss" if cached is None else "hit")
+        return cached
+    
+    def _cache_key(self, messages: List[Dict], schema: Optional[Dict] = None) -> Optional[str]:
+        """Return the cache key for a request, or None when caching is disabled."""
+        if self.cache is None:
+            return None
+        return make_cache_key(self.model, self.temperature, self.max_tokens, messages, schema)
+    
+    def _create_message_with_documents(self, prompt: str, documents: Dict[str, str] = None,
+                                       system: Optional[str] = None) -> List[Dict]:
         """
         Create a message that includes document references using document inlining.
         
         Args:
             prompt: The text prompt
             documents: Dictionary of document paths and their file paths or base64 content
+            system: Optional system message sent ahead of the prompt
             
         Returns:
             List of message dictionaries for the API call
         """
+        messages = [{"role": "system", "content": system}] if system else []
         if not documents:
-            return [{"role": "user", "content": prompt}]
+            return messages + [{"role": "user", "content": prompt}]
         
         # Use the format from Approach 2 that was successful in testing
         content_parts = [{"type": "text", "text": prompt}]
         
         # Add each document as an image_url with proper nesting and transform in the URL
         for doc_name, doc_path in documents.items():
-            if os.path.exists(doc_path):
-                try:
-                    # For PDFs
-                    if doc_path.lower().endswith('.pdf'):
-                        with open(doc_path, 'rb') as file:
-                            base64_content = base64.b64encode(file.read()).decode('utf-8')
-                            # Use the successful approach: transform=inline in URL
-                            url_with_transform = f"data:application/pdf;base64,{base64_content}#transform=inline"
-                            
-                            # Add with the exact format from successful Approach 2
-                            content_parts.append({
-                                "type": "image_url",
-                                "image_url": {
-                                    "url": url_with_transform
-                                }
-                            })
-                            print(f"Added document: {doc_name} ({os.path.getsize(doc_path)/1024:.1f} KB)")
-                except Exception as e:
-                    print(f"Error processing document {doc_name}: {e}")
-        
-        return [{"role": "user", "content": content_parts}]
-        
-    def generate_text(self, prompt: str, documents: Dict[str, str] = None) -> str:
+            try:
+                # Encoded payloads are cached, so repeated documents are only encoded once
+                document = self.document_store.get(doc_path)
+                if document is None:
+                    continue
+                
+                # Add with the exact format from successful Approach 2
+                content_parts.append({
+                    "type": "image_url",
+                    "image_url": {
+                        "url": document.url
+                    }
+                })
+                if self.debug:
+                    print(f"Added document: {doc_name} ({document.size/1024:.1f} KB)")
+            except Exception as e:
+                print(f"Error processing document {doc_name}: {e}")
+        
+        return messages + [{"role": "user", "content": content_parts}]
+        
+    def generate_text(self, prompt: str, documents: Dict[str, str] = None,
+                      system: Optional[str] = None) -> str:
         """
         Generate free-form text from the LLM based on the prompt and optional documents.
         
         Args:
             prompt: The input prompt for the LLM
             documents: Dictionary of document names and their file paths or URLs
+            system: Optional static instructions, sent as the system message
             
         Returns:
             Generated text response
         """
         try:
-            messages = self._create_message_with_documents(prompt, documents)
+            messages = self._create_message_with_documents(prompt, documents, system)
+            cache_key = self._cache_key(messages)
+            cached = self._cache_get(cache_key)
+            if cached is not None:
+                return cached
             
-            response = self.client.chat.completions.create(
+            response = self._create(
                 model=self.model,
                 messages=messages,
                 max_tokens=self.max_tokens,
                 temperature=self.temperature
             )
-            return response.choices[0].message.content
+            content = response.choices[0].message.content
+            if cache_key:
+                self.cache.set(cache_key, content)
+            return content
         except Exception as e:
             print(f"Error generating text response: {e}")
+            self.metrics.inc("llm_errors_total", operation="text")
             return f"Error generating response: {str(e)}"
     
-    def generate_structured_json(self, prompt: str, schema_model: BaseModel, 
-                                documents: Dict[str, str] = None) -> Dict[str, Any]:
+    def generate_structured_json(self, prompt: str, schema_model: "BaseModel", 
+                                documents: Dict[str, str] = None,
+                                system: Optional[str] = None,
+                                as_model: bool = False) -> Union[Dict[str, Any], "BaseModel"]:
         """
         Generate a structured JSON response from the LLM based on a Pydantic schema.
         
         Args:
-            prompt: The input prompt for the LLM
+            prompt: The input prompt for the LLM (the per-request part)
             schema_model: Pydantic model defining the expected JSON structure
             documents: Dictionary of document names and their file paths or URLs
+            system: Optional static instructions; sent with the schema as a system
+                    message that forms a stable, cacheable prompt prefix
+            as_model: Return the validated schema_model instance instead of a dictionary,
+                      saving a round trip through a dict
             
         Returns:
-            Dictionary containing the parsed JSON response
+            Dictionary (or model instance) containing the parsed JSON response
         """
         # Set to True to bypass document processing temporarily
         DISABLE_DOCUMENTS = False
@@ -128,165 +457,661 @@ class LLMClient:
             documents = None
         
         try:
-            messages = self._create_message_with_documents(prompt, documents)
+            messages = self._structured_messages(prompt, schema_model, documents, system)
+            schema = schema_for(schema_model)
+            cache_key = self._cache_key(messages, schema)
+            cached = self._cache_get(cache_key)
+            if cached is not None:
+                return schema_model.model_validate(cached) if as_model else cached
             
-            response = self.client.chat.completions.create(
+            request = dict(
                 model=self.model,
                 messages=messages,
-                response_format={"type": "json_object", "schema": schema_model.model_json_schema()},
+                response_format={"type": "json_object", "schema": schema},
                 max_tokens=self.max_tokens,
                 temperature=self.temperature
             )
+            response = self._create(**request)
             
-            json_content = response.choices[0].message.content
+            try:
+                parsed_content = self._parse_structured_content(response.choices[0].message.content, schema_model)
+            except StructuredOutputError as e:
+                # Beyond local repair; a fresh sample is usually well-formed
+                self._structured_retry(e)
+                response = self._create(**request)
+                parsed_content = self._parse_structured_content(response.choices[0].message.content, schema_model)
+            # Only successful responses are cached; the error defaults below never are
+            if cache_key:
+                self.cache.set(cache_key, parsed_content.model_dump())
+            return parsed_content if as_model else parsed_content.model_dump()
+        except Exception as e:
+            print(f"Error generating structured JSON response: {e}")
+            self.metrics.inc("llm_errors_total", operation="structured_json")
+            defaults = self._default_values(schema_model, e)
+            # The defaults may not satisfy the schema, so the model is built without validation
+            return schema_model.model_construct(**defaults) if as_model else defaults
+    
+    async def agenerate_structured_json(self, prompt: str, schema_model: "BaseModel",
+                                        documents: Dict[str, str] = None,
+                                        system: Optional[str] = None,
+                                        as_model: bool = False) -> Union[Dict[str, Any], "BaseModel"]:
+        """
+        Async twin of generate_structured_json built on openai.AsyncOpenAI.
+        
+        Args:
+            prompt: The input prompt for the LLM (the per-request part)
+            schema_model: Pydantic model defining the expected JSON structure
+            documents: Dictionary of document names and their file paths or URLs
+            system: Optional static instructions, sent with the schema as the system message
+            as_model: Return the validated schema_model instance instead of a dictionary
             
-            # Debug print to see raw response
-            print(f"Raw JSON response: {json.dumps(json.loads(json_content), indent=2)}")
+        Returns:
+            Dictionary (or model instance) containing the parsed JSON response
+        """
+        try:
+            messages = self._structured_messages(prompt, schema_model, documents, system)
+            schema = schema_for(schema_model)
+            cache_key = self._cache_key(messages, schema)
+            cached = self._cache_get(cache_key)
+            if cached is not None:
+                return schema_model.model_validate(cached) if as_model else cached
             
-            parsed_content = json.loads(json_content)
+            request = dict(
+                model=self.model,
+                messages=messages,
+                response_format={"type": "json_object", "schema": schema},
+                max_tokens=self.max_tokens,
+                temperature=self.temperature
+            )
+            response = await self._acreate(**request)
             
-            # Ensure explanation field exists
-            if 'explanation' in schema_model.model_fields and 'explanation' not in parsed_content:
-                parsed_content['explanation'] = "No explanation provided by the model."
-                
-            return parsed_content
+            try:
+                parsed_content = self._parse_structured_content(response.choices[0].message.content, schema_model)
+            except StructuredOutputError as e:
+                self._structured_retry(e)
+                response = await self._acreate(**request)
+                parsed_content = self._parse_structured_content(response.choices[0].message.content, schema_model)
+            # Only successful responses are cached; the error defaults below never are
+            if cache_key:
+                self.cache.set(cache_key, parsed_content.model_dump())
+            return parsed_content if as_model else parsed_content.model_dump()
         except Exception as e:
             print(f"Error generating structured JSON response: {e}")
-            # Return empty dict with expected keys from the schema
-            default_values = {}
+            self.metrics.inc("llm_errors_total", operation="structured_json")
+            defaults = self._default_values(schema_model, e)
+            # The defaults may not satisfy the schema, so the model is built without validation
+            return schema_model.model_construct(**defaults) if as_model else defaults
+
+    def generate_structured_batch(self, prompts: Sequence[str], schema_model: "BaseModel",
+                                  system: Optional[str] = None) -> List["BaseModel"]:
+        """
+        Answer several structured requests with a single completion.
+
+        The prompts are numbered in one user message and the model returns a list
+        of schema_model objects, one per prompt, which is fanned back out. Every
+        prompt is looked up in and stored to the cache on its own, under the key
+        generate_structured_json would use. Prompts the batched response does not
+        cover (a short list, or an item that fails validation) are sent on their own.
+
+        Args:
+            prompts: The per-request prompts
+            schema_model: Pydantic model defining the structure of each answer
+            system: Optional static instructions shared by all prompts
+
+        Returns:
+            A schema_model instance per prompt, in order (built without validation
+            from the error defaults where generation failed)
+        """
+        from pydantic import ValidationError
+
+        schema = schema_for(schema_model)
+        results: List[Optional["BaseModel"]] = [None] * len(prompts)
+        cache_keys = []
+        for i, prompt in enumerate(prompts):
+            cache_key = self._cache_key(self._structured_messages(prompt, schema_model, None, system), schema)
+            cached = self._cache_get(cache_key)
+            if cached is not None:
+                results[i] = schema_model.model_validate(cached)
+            cache_keys.append(cache_key)
+        missing = [i for i, result in enumerate(results) if result is None]
+
+        if len(missing) > 1:
+            try:
+                items = self._request_batch([prompts[i] for i in missing], schema_model, system)
+            except StructuredOutputError as e:
+                # Beyond repair as a whole; the prompts are retried one by one below
+                print(f"Splitting structured JSON batch: {e}")
+                items = []
+            except Exception as e:
+                print(f"Error generating structured JSON batch: {e}")
+                self.metrics.inc("llm_errors_total", operation="structured_batch")
+                defaults = self._default_values(schema_model, e)
+                return [result or schema_model.model_construct(**defaults) for result in results]
+            for i, item in zip(missing, items):
+                try:
+                    try:
+                        results[i] = schema_model.model_validate(item)
+                    except ValidationError as e:
+                        results[i] = self._validate_repaired(item, schema_model, e)
+                except StructuredOutputError:
+                    continue
+                if cache_keys[i]:
+                    self.cache.set(cache_keys[i], results[i].model_dump())
+
+        for i, result in enumerate(results):
+            if result is None:
+                if len(missing) > 1:
+                    self.metrics.inc("llm_batch_fallbacks_total")
+                results[i] = self.generate_structured_json(prompts[i], schema_model, system=system, as_model=True)
+        return results
+
+    def _request_batch(self, prompts: Sequence[str], schema_model: "BaseModel",
+                       system: Optional[str]) -> List[Any]:
+        """
+        Send a batched structured request and return the raw (unvalidated) items.
+
+        The system message (instructions plus the batch schema) is identical for
+        every batch size, so it stays a cacheable prefix; the exact item count is
+        only enforced through the response format.
+        """
+        batch_model = batch_model_for(schema_model)
+        instructions = f"{system}\n\n{BATCH_INSTRUCTIONS}" if system else BATCH_INSTRUCTIONS
+        messages = [
+            {"role": "system", "content": structured_system_prompt(instructions, batch_model)},
+            {"role": "user", "content": "\n\n".join(f"### Request {number}\n{prompt}"
+                                                    for number, prompt in enumerate(prompts, 1))},
+        ]
+        schema = dict(schema_for(batch_model))
+        schema["properties"] = {"items": {**schema["properties"]["items"],
+                                          "minItems": len(prompts), "maxItems": len(prompts)}}
+
+        # Each answer gets the usual token budget, and the rate limiter reserves accordingly
+        client = self.with_options(max_tokens=self.max_tokens * len(prompts))
+        response = client._create(
+            model=self.model,
+            messages=messages,
+            response_format={"type": "json_object", "schema": schema},
+            max_tokens=client.max_tokens,
+            temperature=self.temperature
+        )
+        self.metrics.observe("llm_batch_size", len(prompts))
+        content = response.choices[0].message.content
+        self.metrics.observe("llm_response_bytes", len(content), operation="structured_batch")
+        try:
+            parsed_content = json.loads(content)
+        except ValueError:
+            try:
+                parsed_content = json.loads(repair_json(content))
+            except ValueError as e:
+                raise StructuredOutputError(f"Unparseable structured batch: {e}") from e
+        items = parsed_content.get("items") if isinstance(parsed_content, dict) else None
+        if not isinstance(items, list):
+            raise StructuredOutputError("Structured batch response has no items list")
+        if len(items) != len(prompts):
+            print(f"Structured JSON batch returned {len(items)} of {len(prompts)} items")
+        return items[:len(prompts)]
+
+    def _iter_stream_content(self, **request) -> Iterator[str]:
+        """Issue a streaming completion and yield the text of each delta."""
+        start = time.perf_counter()
+        first = True
+        stream = self._create(stream=True, **request)
+        for chunk in stream:
+            if chunk.choices and chunk.choices[0].delta.content:
+                if first:
+                    self.metrics.observe("llm_time_to_first_token_seconds", time.perf_counter() - start)
+                    first = False
+                yield chunk.choices[0].delta.content
+    
+    async def _aiter_stream_content(self, **request) -> AsyncIterator[str]:
+        """Async twin of _iter_stream_content."""
+        start = time.perf_counter()
+        first = True
+        stream = await self._acreate(stream=True, **request)
+        async for chunk in stream:
+            if chunk.choices and chunk.choices[0].delta.content:
+                if first:
+                    self.metrics.observe("llm_time_to_first_token_seconds", time.perf_counter() - start)
+                    first = False
+                yield chunk.choices[0].delta.content
+    
+    def stream_text(self, prompt: str, documents: Dict[str, str] = None,
+                    system: Optional[str] = None) -> Iterator[str]:
+        """
+        Stream free-form text from the LLM as it is generated.
+        
+        Args:
+            prompt: The input prompt for the LLM
+            documents: Dictionary of document names and their file paths or URLs
+            system: Optional static instructions, sent as the system message
+            
+        Yields:
+            Text deltas in generation order
+        """
+        try:
+            messages = self._create_message_with_documents(prompt, documents, system)
+            cache_key = self._cache_key(messages)
+            cached = self._cache_get(cache_key)
+            if cached is not None:
+                yield cached
+                return
+            
+            received = []
+            for delta in self._iter_stream_content(
+                model=self.model,
+                messages=messages,
+                max_tokens=self.max_tokens,
+                temperature=self.temperature
+            ):
+                received.append(delta)
+                yield delta
+            if cache_key:
+                self.cache.set(cache_key, "".join(received))
+        except Exception as e:
+            print(f"Error generating text response: {e}")
+            self.metrics.inc("llm_errors_total", operation="text")
+            yield f"Error generating response: {str(e)}"
+    
+    async def astream_text(self, prompt: str, documents: Dict[str, str] = None,
+                           system: Optional[str] = None) -> AsyncIterator[str]:
+        """Async twin of stream_text."""
+        try:
+            messages = self._create_message_with_documents(prompt, documents, system)
+            cache_key = self._cache_key(messages)
+            cached = self._cache_get(cache_key)
+            if cached is not None:
+                yield cached
+                return
+            
+            received = []
+            async for delta in self._aiter_stream_content(
+                model=self.model,
+                messages=messages,
+                max_tokens=self.max_tokens,
+                temperature=self.temperature
+            ):
+                received.append(delta)
+                yield delta
+            if cache_key:
+                self.cache.set(cache_key, "".join(received))
+        except Exception as e:
+            print(f"Error generating text response: {e}")
+            self.metrics.inc("llm_errors_total", operation="text")
+            yield f"Error generating response: {str(e)}"
+    
+    def _structured_messages(self, prompt: str, schema_model: "BaseModel",
+                             documents: Optional[Dict[str, str]], system: Optional[str]) -> List[Dict]:
+        """Messages for a structured request, with the schema appended to the system message."""
+        if system:
+            system = structured_system_prompt(system, schema_model)
+        return self._create_message_with_documents(prompt, documents, system)
+    
+    def _structured_stream_parts(self, prompt: str, schema_model: "BaseModel",
+                                 documents: Optional[Dict[str, str]], use_async: bool,
+                                 system: Optional[str] = None):
+        """Build the chunk source, finalizer and error handler for a structured stream."""
+        messages = self._structured_messages(prompt, schema_model, documents, system)
+        schema = schema_for(schema_model)
+        cache_key = self._cache_key(messages, schema)
+        cached = self._cache_get(cache_key)
+        
+        if cached is not None:
+            # Replay the cached object through the parser so consumers see the same deltas
+            text = json.dumps(cached)
+            
+            async def replay():
+                yield text
+            
+            chunks = replay() if use_async else iter([text])
+            return chunks, lambda _: cached, lambda e: self._default_values(schema_model, e)
+        
+        request = dict(
+            model=self.model,
+            messages=messages,
+            response_format={"type": "json_object", "schema": schema},
+            max_tokens=self.max_tokens,
+            temperature=self.temperature
+        )
+        chunks = self._aiter_stream_content(**request) if use_async else self._iter_stream_content(**request)
+        
+        def finalize(json_content: str) -> "BaseModel":
+            parsed_content = self._parse_structured_content(json_content, schema_model)
+            if cache_key:
+                self.cache.set(cache_key, parsed_content.model_dump())
+            return parsed_content
+        
+        def on_error(e: Exception) -> Dict[str, Any]:
+            print(f"Error generating structured JSON response: {e}")
+            self.metrics.inc("llm_errors_total", operation="structured_json")
+            return self._default_values(schema_model, e)
+        
+        return chunks, finalize, on_error
+    
+    def stream_structured_json(self, prompt: str, schema_model: "BaseModel",
+                               documents: Dict[str, str] = None,
+                               system: Optional[str] = None) -> StructuredStream:
+        """
+        Stream a structured JSON response, yielding per-field deltas as they arrive.
+        
+        Args:
+            prompt: The input prompt for the LLM (the per-request part)
+            schema_model: Pydantic model defining the expected JSON structure
+            documents: Dictionary of document names and their file paths or URLs
+            system: Optional static instructions, sent with the schema as the system message
+            
+        Returns:
+            An iterable of FieldDelta; once iteration is finished its ``result``
+            attribute holds the parsed dictionary and ``model`` the validated
+            schema_model instance (None if the result came from the cache or
+            from the error defaults)
+        """
+        return StructuredStream(*self._structured_stream_parts(prompt, schema_model, documents,
+                                                               use_async=False, system=system))
+    
+    def astream_structured_json(self, prompt: str, schema_model: "BaseModel",
+                                documents: Dict[str, str] = None,
+                                system: Optional[str] = None) -> AsyncStructuredStream:
+        """Async twin of stream_structured_json, consumed with ``async for``."""
+        return AsyncStructuredStream(*self._structured_stream_parts(prompt, schema_model, documents,
+                                                                    use_async=True, system=system))
+    
+    def _parse_structured_content(self, json_content: str, schema_model: "BaseModel") -> "BaseModel":
+        """
+        Parse and validate the raw JSON content returned by the model.
+        
+        Well-formed responses are parsed and validated in a single pass by
+        ``model_validate_json``. Anything else goes through repair_json (for
+        truncated or wrapped output) and missing explanations are filled in.
+        
+        Args:
+            json_content: Raw message content from the completion
+            schema_model: Pydantic model defining the expected JSON structure
+            
+        Returns:
+            The validated schema_model instance
+            
+        Raises:
+            StructuredOutputError: If the content cannot be repaired into a valid object
+        """
+        from pydantic import ValidationError
+        
+        self.metrics.observe("llm_response_bytes", len(json_content), operation="structured_json")
+        try:
+            model = schema_model.model_validate_json(json_content)
+        except ValidationError as e:
+            model = self._repair_structured_content(json_content, schema_model, e)
+        
+        # Debug print to see raw response (opt-in, it re-serializes the whole object)
+        if self.debug:
+            print(f"Raw JSON response: {model.model_dump_json(indent=2)}")
+        
+        return model
+    
+    def _repair_structured_content(self, json_content: str, schema_model: "BaseModel",
+                                   error: Exception) -> "BaseModel":
+        """Slow path of _parse_structured_content for responses that failed validation."""
+        try:
+            parsed_content = json.loads(repair_json(json_content))
+        except ValueError:
+            raise StructuredOutputError(f"Unparseable structured response: {error}") from error
+        return self._validate_repaired(parsed_content, schema_model, error)
+
+    def _validate_repaired(self, parsed_content: Any, schema_model: "BaseModel",
+                           error: Exception) -> "BaseModel":
+        """Validate a parsed object that failed validation once, filling in a missing explanation."""
+        from pydantic import ValidationError
+
+        if not isinstance(parsed_content, dict):
+            raise StructuredOutputError("Structured response is not a JSON object") from error
+        
+        # Ensure explanation field exists
+        if 'explanation' in schema_model.model_fields and 'explanation' not in parsed_content:
+            parsed_content['explanation'] = "No explanation provided by the model."
+        
+        try:
+            model = schema_model.model_validate(parsed_content)
+        except ValidationError as e:
+            raise StructuredOutputError(f"Invalid structured response: {e}") from e
+        self.metrics.inc("llm_json_repairs_total")
+        return model
+    
+    def _structured_retry(self, error: StructuredOutputError) -> None:
+        print(f"Retrying structured JSON request: {error}")
+        self.metrics.inc("llm_structured_retries_total")
+    
+    @staticmethod
+    def _default_values(schema_model: "BaseModel", error: Exception) -> Dict[str, Any]:
+        """
+        Build a dictionary of empty values for every field of the schema.
+        Used when generation fails so callers still receive the expected keys.
+        """
+        default_values = {name: factory() for name, factory in _default_factories(schema_model).items()}
+        if 'explanation' in default_values:
+            default_values['explanation'] = f"{ERROR_EXPLANATION_PREFIX}: {str(error)}"
+        return default_values
             
-            # Build default values from schema including explanation fields
-            for field_name, field in schema_model.model_fields.items():
-                if field_name == 'explanation':
-                    default_values[field_name] = f"Error generating explanation: {str(e)}"
-                elif field.annotation == str:
-                    default_values[field_name] = ""
-                elif field.annotation in (int, float):
-                    default_values[field_name] = 0
-                elif field.annotation == bool:
-                    default_values[field_name] = False
-                elif field.annotation == list:
-                    default_values[field_name] = []
-                elif field.annotation == dict:
-                    default_values[field_name] = {}
-                else:
-                    # Handle nested models by checking if they have default factories
-                    if hasattr(field, 'default_factory') and field.default_factory is not None:
-                        default_values[field_name] = field.default_factory()
-                    else:
-                        default_values[field_name] = None
-            return default_values 
+    def _image_client(self, model: str):
+        """Return the fireworks-ai ImageInference client for a model, creating it on first use."""
+        client = self._image_clients.get(model)
+        if client is None:
+            import fireworks.client
+            from fireworks.client.image import ImageInference
             
-    def generate_image(self, prompt: str, output_path: str = None) -> Union[str, bytes]:
+            with self._image_clients_lock:
+                client = self._image_clients.get(model)
+                if client is None:
+                    # Initialize the ImageInference client with our API key
+                    fireworks.client.api_key = self.api_key
+                    client = ImageInference(model=model)
+                    self._image_clients[model] = client
+        return client
+    
+    @staticmethod
+    def _image_sink(output_path: Optional[str]) -> Tuple[BinaryIO, Optional[str]]:
+        """
+        Open the file an image is written to while it downloads.
+        
+        With an output path this is a uniquely named temp file next to it, so each
+        attempt (retries and hedges included) writes its own copy and readers never
+        see a partial image. Without one it is a spooled file that only moves to
+        disk once the image outgrows IMAGE_SPOOL_BYTES.
+        """
+        if output_path is None:
+            return tempfile.SpooledTemporaryFile(max_size=IMAGE_SPOOL_BYTES), None
+        directory, name = os.path.split(os.path.abspath(output_path))
+        fd, temp_path = tempfile.mkstemp(prefix=f".{name}.", suffix=".part", dir=directory)
+        return os.fdopen(fd, "wb"), temp_path
+    
+    @staticmethod
+    def _discard_temp(temp_path: Optional[str]) -> None:
+        if temp_path:
+            try:
+                os.remove(temp_path)
+            except FileNotFoundError:
+                pass
+    
+    def _publish_image(self, sink: BinaryIO, temp_path: Optional[str], output_path: Optional[str],
+                       published: threading.Event) -> Union[str, BinaryIO]:
+        """
+        Hand over a fully written image: rename it into place, or rewind the spooled file.
+        
+        Only the first attempt to finish is published; a hedged attempt that
+        completes later drops its copy rather than replacing the winner's.
+        """
+        if temp_path is None:
+            with _publish_lock:
+                if published.is_set():
+                    sink.close()
+                    return None
+                published.set()
+            sink.seek(0)
+            return sink
+        sink.close()
+        with _publish_lock:
+            if published.is_set():
+                self._discard_temp(temp_path)
+                return output_path
+            # mkstemp creates the file private to this user; published images get the usual mode
+            os.chmod(temp_path, _default_file_mode())
+            os.replace(temp_path, output_path)
+            published.set()
+        return output_path
+    
+    def generate_image(self, prompt: str, output_path: str = None,
+                       as_file: bool = False) -> Union[str, bytes, BinaryIO, None]:
         """
         Generate an image using Fireworks AI image generation API.
         
+        The HTTP backend streams the response body to its destination in
+        IMAGE_CHUNK_BYTES chunks, so the image is never held in memory as a whole
+        when it is written to disk.
+        
         Args:
             prompt: Text description of the desired image
-            output_path: Path to save the image to (if None, returns bytes)
+            output_path: Path to save the image to; written to a temp file first and
+                         renamed into place once complete
+            as_file: Without output_path, return a binary file object positioned at the
+                     start of the image instead of bytes
             
         Returns:
             If output_path is provided, returns path to saved image.
-            Otherwise, returns the image as bytes.
+            Otherwise the image as a file object (as_file) or as bytes.
         """
         try:
-            # Default configuration for high-quality images
-            model = "stable-diffusion-xl-1024-v1-0"
-            width = 1024
-            height = 1024
-            steps = 30
-            cfg_scale = 7
-            seed = 0  # Random seed
+            model = self.image_model
+            width = self.image_width
+            height = self.image_height
+            steps = self.image_steps
+            cfg_scale = self.image_cfg_scale
+            seed = self.image_seed
             safety_check = True
             output_format = "PNG"
+            streamed = bool(output_path) or as_file
+            published = threading.Event()
             
-            # Import fireworks-ai client if available
-            try:
-                import fireworks.client
-                from fireworks.client.image import ImageInference, Answer
-                
-                # Initialize the ImageInference client with our API key
-                fireworks.client.api_key = self.api_key
-                inference_client = ImageInference(model=model)
+            if self.image_backend == "sdk":
+                from fireworks.client.image import Answer
                 
                 # Generate an image using the text_to_image method
-                answer: Answer = inference_client.text_to_image(
-                    prompt=prompt,
-                    height=height,
-                    width=width,
-                    seed=seed,
-                    safety_check=safety_check,
-                    output_image_format=output_format,
-                    steps=steps,
-                    cfg_scale=cfg_scale
-                )
+                with self.metrics.timer("image_request_seconds", backend="sdk"):
+                    answer: Answer = self.scheduler.call(lambda: self._image_client(model).text_to_image(
+                        prompt=prompt,
+                        height=height,
+                        width=width,
+                        seed=seed,
+                        safety_check=safety_check,
+                        output_image_format=output_format,
+                        steps=steps,
+                        cfg_scale=cfg_scale
+                    ), hedge=False)
                 
                 if answer.image is None:
                     raise RuntimeError(f"No return image, {answer.finish_reason}")
                 
-                # Save image to file or return bytes
-                if output_path:
-                    answer.image.save(output_path)
-                    print(f"Image saved to {output_path}")
-                    return output_path
-                else:
-                    # Convert to bytes if no output path provided
-                    import io
-                    img_bytes = io.BytesIO()
-                    answer.image.save(img_bytes, format=output_format)
-                    return img_bytes.getvalue()
-                
-            except ImportError:
-                # Fall back to using requests directly if fireworks-ai client is not available
-                import requests
-                
-                # Prepare the request
-                headers = {
-                    "Authorization": f"Bearer {self.api_key}",
-                    "Content-Type": "application/json"
-                }
-                
-                # Construct the base URL for Fireworks Image API
-                url = f"https://api.fireworks.ai/inference/v1/image/{simplified_model}"
-                
-                # Prepare the request payload
-                payload = {
-                    "prompt": prompt,
-                    "height": height,
-                    "width": width,
-                    "seed": seed,
-                    "output_format": output_format.lower(),
-                    "steps": steps,
-                    "cfg_scale": cfg_scale,
-                    "safety_check": safety_check
-                }
-                
-                # Make the API request
-                response = requests.post(url, headers=headers, json=payload)
-                
-                if response.status_code == 200:
-                    if output_path:
-                        # Save the image to the specified path
-                        with open(output_path, 'wb') as f:
-                            f.write(response.content)
+                # The SDK hands back a decoded image, so it is encoded exactly once, straight into its destination
+                if streamed:
+                    sink, temp_path = self._image_sink(output_path)
+                    try:
+                        answer.image.save(sink, format=output_format)
+                    except BaseException:
+                        sink.close()
+                        self._discard_temp(temp_path)
+                        raise
+                    result = self._publish_image(sink, temp_path, output_path, published)
+                    if output_path and self.debug:
                         print(f"Image saved to {output_path}")
-                        return output_path
-                    else:
-                        # Return the image bytes
-                        return response.content
-                else:
-                    # Handle error
-                    error_msg = f"Image generation failed with status code {response.status_code}"
+                    return result
+                # Convert to bytes if no output path provided
+                import io
+                img_bytes = io.BytesIO()
+                answer.image.save(img_bytes, format=output_format)
+                return img_bytes.getvalue()
+            
+            # Call the Fireworks image API over the pooled transport
+            headers = {
+                "Authorization": f"Bearer {self.api_key}",
+                "Accept": f"image/{output_format.lower()}"
+            }
+            
+            # Prepare the request payload
+            payload = {
+                "prompt": prompt,
+                "height": height,
+                "width": width,
+                "seed": seed,
+                "steps": steps,
+                "cfg_scale": cfg_scale,
+                "safety_check": safety_check
+            }
+            
+            def post_image():
+                with self.transport.client.stream(
+                    "POST",
+                    self.transport.url(f"image_generation/accounts/fireworks/models/{model}"),
+                    headers=headers,
+                    json=payload
+                ) as response:
+                    if response.status_code != 200:
+                        # Handle error
+                        response.read()
+                        error_msg = f"Image generation failed with status code {response.status_code}"
+                        try:
+                            error_details = response.json()
+                            error_msg += f": {error_details}"
+                        except ValueError:
+                            pass
+                        raise ImageGenerationError(error_msg, response)
+                    if not streamed:
+                        return response.read()
+                    # Each attempt writes its own file, so a failed or hedged attempt never touches another's
+                    sink, temp_path = self._image_sink(output_path)
                     try:
-                        error_details = response.json()
-                        error_msg += f": {error_details}"
-                    except:
-                        pass
-                    raise Exception(error_msg)
+                        for chunk in response.iter_bytes(IMAGE_CHUNK_BYTES):
+                            sink.write(chunk)
+                    except BaseException:
+                        sink.close()
+                        self._discard_temp(temp_path)
+                        raise
+                    return self._publish_image(sink, temp_path, output_path, published)
+            
+            with self.metrics.timer("image_request_seconds", backend="http"):
+                # A duplicate render would double the cost of the slowest call, so images are never hedged
+                result = self.scheduler.call(post_image, hedge=False)
+            
+            if output_path:
+                self.metrics.observe("image_response_bytes", os.path.getsize(output_path), backend="http")
+                if self.debug:
+                    print(f"Image saved to {output_path}")
+            elif as_file:
+                self.metrics.observe("image_response_bytes", result.seek(0, os.SEEK_END), backend="http")
+                result.seek(0)
+            else:
+                self.metrics.observe("image_response_bytes", len(result), backend="http")
+            return result
                     
         except Exception as e:
             print(f"Error generating image: {e}")
+            self.metrics.inc("llm_errors_total", operation="image")
             # Return empty bytes if failed and no output path
-            if not output_path:
+            if not output_path and not as_file:
                 return b''
-            return None 
\ No newline at end of file
+            return None 
+    
+    async def agenerate_image(self, prompt: str, output_path: str = None,
+                              as_file: bool = False) -> Union[str, bytes, BinaryIO, None]:
+        """
+        Async twin of generate_image.
+        
+        The Fireworks image SDK is synchronous, so the call runs in a worker
+        thread to keep the event loop free for other in-flight requests.
+        
+        Args:
+            prompt: Text description of the desired image
+            output_path: Path to save the image to (if None, returns bytes)
+            as_file: Without output_path, return a binary file object instead of bytes
+            
+        Returns:
+            If output_path is provided, returns path to saved image.
+            Otherwise the image as a file object (as_file) or as bytes.
+        """
+        return await asyncio.to_thread(self.generate_image, prompt, output_path, as_file)
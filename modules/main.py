@@ -1,7 +1,7 @@
 import os
 import argparse
-from .pipeline import DreamAnalysisPipeline
-from .llm_client import LLMClient
+
+from .images import thumbnail_sizes
 
 def main():
     """Main entry point for the Dream Analysis Application"""
@@ -14,19 +14,71 @@ def main():
                         help="Temperature for LLM generation (0.0-1.0)")
     parser.add_argument("--output", type=str, default="dream_results",
                         help="Output directory for saving results")
+    parser.add_argument("--cache-db", type=str, default=None,
+                        help="SQLite file for caching LLM responses across runs")
+    parser.add_argument("--no-stream", action="store_true",
+                        help="Print the analysis only after it is complete")
+    parser.add_argument("--debug", action="store_true",
+                        help="Print raw model responses, attached documents and image generation requests")
+    parser.add_argument("--metrics-file", type=str, default=None,
+                        help="Write performance metrics in Prometheus text format to this file")
+    parser.add_argument("--warmup", action="store_true",
+                        help="Load dependencies and connect to the API before the first question")
+    parser.add_argument("--dedup-index", type=str, default=None,
+                        help="File of previously analyzed dreams; near-duplicates reuse their analysis and image")
+    parser.add_argument("--dedup-threshold", type=float, default=0.92,
+                        help="Similarity (0-1) above which a previous analysis is reused")
+    parser.add_argument("--image-format", type=str, default="webp", choices=["webp", "avif", "jpeg", "png"],
+                        help="Format generated images are stored in")
+    parser.add_argument("--image-quality", type=int, default=80,
+                        help="Encoder quality (1-100) for webp, avif and jpeg images")
+    parser.add_argument("--thumbnails", type=thumbnail_sizes, default="",
+                        help="Comma-separated thumbnail sizes in pixels, e.g. 512,256")
     args = parser.parse_args()
     
+    # Heavy dependencies (pydantic, openai) are only imported once arguments are valid
+    from .pipeline import DreamAnalysisPipeline
+    from .llm_client import LLMClient
+    from .cache import ResponseCache
+    from .store import DreamStore
+    from .images import ImageProcessor
+    from .metrics import metrics, MetricsRegistry
+    
     # Ensure output directory exists
     os.makedirs(args.output, exist_ok=True)
     
+    # Metrics are only collected when a file to write them to is given
+    registry = metrics.add_sink(MetricsRegistry()) if args.metrics_file else None
+    
     # Initialize LLM client
     llm_client = LLMClient(
         model=args.model,
-        temperature=args.temperature
+        temperature=args.temperature,
+        cache=ResponseCache.with_sqlite(args.cache_db) if args.cache_db else None,
+        debug=args.debug
     )
     
+    # Every run is archived in the store instead of overwriting a single JSON file
+    store = DreamStore(args.output)
+    
+    # NumPy is only needed (and imported) when deduplication is enabled
+    dedup = None
+    if args.dedup_index:
+        from .dedup import DreamIndex
+        dedup = DreamIndex(threshold=args.dedup_threshold).load(args.dedup_index)
+    
+    # The API returns a PNG; re-encode it unless a plain PNG without thumbnails was asked for
+    image_processor = None
+    if args.image_format != "png" or args.thumbnails:
+        image_processor = ImageProcessor(format=args.image_format, quality=args.image_quality,
+                                         thumbnail_sizes=args.thumbnails)
+    
     # Initialize pipeline
-    pipeline = DreamAnalysisPipeline(llm_client=llm_client)
+    pipeline = DreamAnalysisPipeline(llm_client=llm_client, output_dir=args.output, store=store, dedup=dedup,
+                                     image_processor=image_processor)
+    
+    if args.warmup:
+        llm_client.warmup(connect=True)
     
     # Welcome message
     print("\n" + "="*50)
@@ -39,23 +91,29 @@ def main():
     
     try:
         # Run the pipeline
-        result = pipeline.run_pipeline()
-        
-        # Save results
-        output_file = os.path.join(args.output, "dream_analysis.json")
-        pipeline.save_dream_data(output_file)
+        # Results are saved while the image is still rendering
+        result = pipeline.run_pipeline(stream=not args.no_stream)
         
         # Completion message
         print("\n" + "="*50)
         print("  ANALYSIS COMPLETE")
         print("="*50)
-        print(f"\nYour dream analysis has been saved to: {output_file}")
+        print(f"\nYour dream analysis has been saved to {store.path} with ID: {pipeline.last_dream_id}")
         print("\nThank you for using the Dream Analysis Application!")
         
     except KeyboardInterrupt:
         print("\n\nProcess interrupted by user. Exiting...")
     except Exception as e:
         print(f"\nAn error occurred: {str(e)}")
+    finally:
+        store.close()
+        if image_processor:
+            image_processor.close()
+        if dedup is not None:
+            dedup.save(args.dedup_index)
+        if registry:
+            with open(args.metrics_file, 'w') as f:
+                f.write(registry.to_prometheus())
     
 if __name__ == "__main__":
     main()
@@ -0,0 +1,222 @@
+"""
+Performance instrumentation for the pipeline and LLM client.
+
+Code records measurements on a Metrics object, which forwards them to any number
+of sinks. With no sinks attached (the default) recording is a no-op. Attach a
+MetricsRegistry to aggregate counters and latency histograms in-process and dump
+them in the Prometheus text format:
+
+    from modules.metrics import metrics, MetricsRegistry
+
+    registry = MetricsRegistry()
+    metrics.add_sink(registry)
+    ...
+    print(registry.to_prometheus())
+"""
+
+import time
+import bisect
+import threading
+from contextlib import contextmanager
+from typing import Dict, Iterator, List, Optional, Sequence, Tuple
+
+# Histogram buckets for latencies, in seconds
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+# Histogram buckets for payload sizes, in bytes
+BYTE_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304, 16777216)
+
+LabelKey = Tuple[Tuple[str, str], ...]
+
+
+def _label_key(labels: Dict[str, str]) -> LabelKey:
+    return tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+
+def _format_number(value: float) -> str:
+    """Format a number without losing precision on large integers."""
+    return str(int(value)) if float(value).is_integer() else repr(float(value))
+
+
+class MetricsSink:
+    """Destination for measurements. Subclasses override the methods they need."""
+
+    def increment(self, name: str, amount: float, labels: Dict[str, str]) -> None:
+        pass
+
+    def observe(self, name: str, value: float, labels: Dict[str, str]) -> None:
+        pass
+
+
+class _Histogram:
+    def __init__(self, buckets: Sequence[float]):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def quantile(self, q: float) -> float:
+        """Estimate a quantile from the bucket counts (upper bound of the containing bucket)."""
+        if not self.count:
+            return 0.0
+        target = q * self.count
+        running = 0
+        for bound, count in zip(self.buckets, self.counts):
+            running += count
+            if running >= target:
+                return bound
+        return float("inf")
+
+
+class MetricsRegistry(MetricsSink):
+    """In-process sink that aggregates counters and histograms."""
+
+    def __init__(self, buckets: Optional[Dict[str, Sequence[float]]] = None):
+        """
+        Args:
+            buckets: Histogram buckets per metric name. Names ending in ``_bytes`` default
+                     to BYTE_BUCKETS, everything else to LATENCY_BUCKETS.
+        """
+        self._buckets = buckets or {}
+        self._counters: Dict[str, Dict[LabelKey, float]] = {}
+        self._histograms: Dict[str, Dict[LabelKey, _Histogram]] = {}
+        self._lock = threading.Lock()
+
+    def _buckets_for(self, name: str) -> Sequence[float]:
+        if name in self._buckets:
+            return self._buckets[name]
+        return BYTE_BUCKETS if name.endswith("_bytes") else LATENCY_BUCKETS
+
+    def increment(self, name: str, amount: float, labels: Dict[str, str]) -> None:
+        key = _label_key(labels)
+        with self._lock:
+            series = self._counters.setdefault(name, {})
+            series[key] = series.get(key, 0) + amount
+
+    def observe(self, name: str, value: float, labels: Dict[str, str]) -> None:
+        key = _label_key(labels)
+        with self._lock:
+            series = self._histograms.setdefault(name, {})
+            histogram = series.get(key)
+            if histogram is None:
+                histogram = series[key] = _Histogram(self._buckets_for(name))
+            histogram.observe(value)
+
+    def counter(self, name: str, **labels) -> float:
+        """Current value of a counter series."""
+        with self._lock:
+            return self._counters.get(name, {}).get(_label_key(labels), 0)
+
+    def snapshot(self) -> Dict[str, Dict]:
+        """
+        Return a plain-dict view of every series.
+
+        Counters map to their value; histograms map to count, sum, p50, p95 and p99.
+        """
+        def render(key: LabelKey) -> str:
+            return ",".join(f"{k}={v}" for k, v in key)
+
+        with self._lock:
+            counters = {
+                name: {render(key): value for key, value in series.items()}
+                for name, series in self._counters.items()
+            }
+            histograms = {
+                name: {
+                    render(key): {
+                        "count": h.count,
+                        "sum": h.sum,
+                        "p50": h.quantile(0.50),
+                        "p95": h.quantile(0.95),
+                        "p99": h.quantile(0.99),
+                    }
+                    for key, h in series.items()
+                }
+                for name, series in self._histograms.items()
+            }
+        return {"counters": counters, "histograms": histograms}
+
+    def to_prometheus(self) -> str:
+        """Render every series in the Prometheus text exposition format."""
+        def render(key: LabelKey, extra: Tuple[Tuple[str, str], ...] = ()) -> str:
+            pairs = key + extra
+            if not pairs:
+                return ""
+            return "{" + ",".join(f'{k}="{v}"' for k, v in pairs) + "}"
+
+        lines: List[str] = []
+        with self._lock:
+            for name, series in sorted(self._counters.items()):
+                lines.append(f"# TYPE {name} counter")
+                for key, value in series.items():
+                    lines.append(f"{name}{render(key)} {_format_number(value)}")
+            for name, series in sorted(self._histograms.items()):
+                lines.append(f"# TYPE {name} histogram")
+                for key, h in series.items():
+                    running = 0
+                    for bound, count in zip(h.buckets, h.counts):
+                        running += count
+                        lines.append(f"{name}_bucket{render(key, (('le', _format_number(bound)),))} {running}")
+                    lines.append(f"{name}_bucket{render(key, (('le', '+Inf'),))} {h.count}")
+                    lines.append(f"{name}_sum{render(key)} {_format_number(h.sum)}")
+                    lines.append(f"{name}_count{render(key)} {h.count}")
+        return "\n".join(lines) + "\n"
+
+    def reset(self) -> None:
+        with self._lock:
+            self._counters.clear()
+            self._histograms.clear()
+
+
+class Metrics:
+    """Front end used by instrumented code; forwards measurements to the attached sinks."""
+
+    def __init__(self, sinks: Optional[List[MetricsSink]] = None):
+        self.sinks: List[MetricsSink] = list(sinks or [])
+
+    @property
+    def enabled(self) -> bool:
+        """True if at least one sink is attached. Use to skip costly measurements."""
+        return bool(self.sinks)
+
+    def add_sink(self, sink: MetricsSink) -> MetricsSink:
+        self.sinks.append(sink)
+        return sink
+
+    def remove_sink(self, sink: MetricsSink) -> None:
+        self.sinks.remove(sink)
+
+    def inc(self, name: str, amount: float = 1, **labels) -> None:
+        """Increment a counter."""
+        for sink in self.sinks:
+            sink.increment(name, amount, labels)
+
+    def observe(self, name: str, value: float, **labels) -> None:
+        """Record a histogram observation."""
+        for sink in self.sinks:
+            sink.observe(name, value, labels)
+
+    @contextmanager
+    def timer(self, name: str, **labels) -> Iterator[None]:
+        """
+        Time the enclosed block and record it as a histogram observation,
+        labelled with outcome="ok" or outcome="error".
+        """
+        if not self.sinks:
+            yield
+            return
+        start = time.perf_counter()
+        outcome = "error"
+        try:
+            yield
+            outcome = "ok"
+        finally:
+            self.observe(name, time.perf_counter() - start, outcome=outcome, **labels)
+
+
+# Process-wide default used by LLMClient, RequestScheduler and DreamAnalysisPipeline
+metrics = Metrics()
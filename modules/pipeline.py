@@ -1,9 +1,28 @@
 import os
 import json
-from typing import Dict, Any, Optional, Union, List
+import time
+import uuid
+import asyncio
+import secrets
+import threading
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor
+from typing import (Dict, Any, Optional, Union, List, Iterable, Iterator, AsyncIterator, Callable, Tuple,
+                    NamedTuple, Sequence, TYPE_CHECKING)
 from pydantic import BaseModel, Field
-from .llm_client import LLMClient  # Fixed relative import
-from .prompts import format_analysis_prompt, format_image_prompt
+from .llm_client import LLMClient, ERROR_EXPLANATION_PREFIX  # Fixed relative import
+from .prompts import DREAM_ANALYSIS_SYSTEM_PROMPT, format_analysis_prompt, format_image_prompt
+from .stages import StageGraph, StageContext, StageResult, format_timings
+from .metrics import Metrics, metrics as default_metrics
+from .store import DreamStore
+from .images import ImageProcessor
+from .routing import RoutingPolicy, Route
+from .batching import MicroBatcher
+
+if TYPE_CHECKING:
+    from .dedup import DreamIndex
+    from .analytics import DreamAnalytics
+    from .symbols import SymbolIndex
 
 # 1. Define Pydantic models for our JSON structures
 
@@ -16,6 +35,10 @@ class DreamSchema(BaseModel):
     lifeConnection: str = Field(description="How the dream might relate to the user's waking life")
     analysis: str = Field(default="", description="The LLM's interpretation of the dream's meaning")
     imagePrompt: str = Field(default="", description="Description to generate a visual representation")
+    imagePath: str = Field(default="", description="Path to the generated dream image")
+    imageThumbnails: Dict[str, str] = Field(default_factory=dict,
+                                            description="Thumbnail paths keyed by longest-edge size")
+    userId: str = Field(default="", description="Optional ID of the dreamer, used to group analytics")
 
 class DreamAnalysis(BaseModel):
     """Schema for the analysis output."""
@@ -30,6 +53,35 @@ class DreamImageRequest(BaseModel):
     width: int = Field(default=1024, description="Image width")
     height: int = Field(default=1024, description="Image height")
 
+def analysis_failed(analysis: Union[DreamAnalysis, Dict[str, Any], None]) -> bool:
+    """True for the error defaults LLMClient returns when an analysis could not be generated."""
+    if analysis is None:
+        return True
+    if isinstance(analysis, BaseModel):
+        analysis = analysis.model_dump()
+    return (not analysis.get("analysis") or not analysis.get("imagePrompt")
+            or str(analysis.get("explanation", "")).startswith(ERROR_EXPLANATION_PREFIX))
+
+
+def failure_reason(result: Dict[str, Any]) -> Optional[str]:
+    """
+    Why a finished dream still counts as failed, or None if it succeeded.
+
+    The pipeline does not raise on upstream errors: the analysis comes back as
+    error defaults and a failed render leaves no image path. Callers that can
+    retry (the queue worker, the journal importer) treat these as failures.
+    """
+    if analysis_failed(result):
+        return f"analysis failed: {result.get('explanation') or 'empty analysis'}"
+    if not result.get("imagePath"):
+        return "image generation failed"
+    return None
+
+class ImageFrame(NamedTuple):
+    """One image delivered by progressive rendering: the quick preview, then the final image."""
+    phase: str
+    path: str
+
 # 2. Create the pipeline manager
 
 class DreamAnalysisPipeline:
@@ -40,10 +92,54 @@ class DreamAnalysisPipeline:
     3. Generate image from dream description
     """
     
-    def __init__(self, llm_client: Optional[LLMClient] = None):
-        """Initialize the pipeline with LLM client."""
+    def __init__(self, llm_client: Optional[LLMClient] = None, output_dir: str = "dream_results",
+                 on_stage_timings: Optional[Callable[[StageResult], None]] = None,
+                 metrics: Optional[Metrics] = None, store: Optional[DreamStore] = None,
+                 dedup: Optional["DreamIndex"] = None, image_processor: Optional[ImageProcessor] = None,
+                 router: Optional[RoutingPolicy] = None, preview_steps: int = 6,
+                 batcher: Optional[MicroBatcher] = None, analytics: Optional["DreamAnalytics"] = None,
+                 symbol_index: Optional["SymbolIndex"] = None):
+        """
+        Initialize the pipeline with LLM client.
+        
+        Args:
+            llm_client: Client used for analysis and image generation
+            output_dir: Directory where generated images are written
+            on_stage_timings: Optional callback receiving the stage timings of every dream
+            metrics: Instrumentation front end (defaults to the process-wide one)
+            store: Optional archive every analyzed dream is saved to; images are moved
+                   to content-addressed paths inside it
+            dedup: Optional index of analyzed dreams; near-duplicates reuse the earlier
+                   analysis and/or image instead of generating new ones
+            image_processor: Optional post-processing (re-encoding, thumbnails) of generated images
+            router: Optional policy choosing the model and generation settings per dream
+                    from user tier, load and latency budget
+            preview_steps: Diffusion steps of the preview rendered ahead of the final image
+                           when a caller asks for progressive images
+            batcher: Optional micro-batcher; non-interactive analyses arriving close together
+                     share one upstream request instead of being streamed one by one
+            analytics: Optional aggregates (emotion trends, intensity, symbol co-occurrence)
+                       every completed dream is added to
+            symbol_index: Optional cached interpretations of common symbols; the meanings of
+                          a dream's indexed symbols are included in its analysis prompt
+        """
         self.llm_client = llm_client or LLMClient()
+        self.output_dir = output_dir
+        self.on_stage_timings = on_stage_timings
+        self.metrics = metrics or default_metrics
+        self.store = store
+        self.dedup = dedup
+        self.image_processor = image_processor
+        self.router = router
+        self.preview_steps = preview_steps
+        self.batcher = batcher
+        self.analytics = analytics
+        self.symbol_index = symbol_index
+        self._in_flight = 0
+        self._in_flight_lock = threading.Lock()
         self.dream_data = None
+        self.last_stage_result: Optional[StageResult] = None
+        self.last_dream_id: Optional[str] = None
     
     def collect_dream_information(self) -> DreamSchema:
         """
@@ -92,61 +188,180 @@ class DreamAnalysisPipeline:
         self.dream_data = DreamSchema(**dream_data)
         return self.dream_data
     
-    def generate_analysis(self) -> DreamAnalysis:
+    def generate_analysis(self, on_delta: Optional[Callable[[str], None]] = None) -> DreamAnalysis:
         """
         Step 3: Generate dream analysis based on collected information.
         Returns the dream analysis.
+        
+        Args:
+            on_delta: Optional callback receiving the analysis text as it streams in.
+                      When omitted the response is fetched in a single request.
         """
         if not self.dream_data:
             raise ValueError("No dream data available. Please collect dream information first.")
         
-        # Create prompt for analysis using the prompts module
-        prompt = format_analysis_prompt(self.dream_data)
+        prompt = self._analysis_prompt(self.dream_data)
+        if on_delta is None:
+            return self._apply_analysis(
+                self.dream_data,
+                self.llm_client.generate_structured_json(prompt, DreamAnalysis, system=DREAM_ANALYSIS_SYSTEM_PROMPT,
+                                                         as_model=True)
+            )
         
-        # Generate structured analysis using the LLM
-        analysis_data = self.llm_client.generate_structured_json(prompt, DreamAnalysis)
+        stream = self.llm_client.stream_structured_json(prompt, DreamAnalysis, system=DREAM_ANALYSIS_SYSTEM_PROMPT)
+        for delta in stream:
+            if delta.field == "analysis" and delta.text:
+                on_delta(delta.text)
+        return self._apply_analysis(self.dream_data, self._stream_analysis(stream))
+    
+    def _analysis_prompt(self, dream_data: DreamSchema) -> str:
+        """The analysis prompt for a dream, with the cached meanings of its indexed symbols."""
+        meanings = self.symbol_index.meanings(dream_data.mainSymbols) if self.symbol_index is not None else None
+        return format_analysis_prompt(dream_data, meanings)
+    
+    def interpret_symbols(self, symbols: Sequence[str]) -> Dict[str, Optional[str]]:
+        """
+        Answer a question about symbols alone from the symbol index, without an LLM call.
         
+        Returns:
+            Each symbol's cached interpretation, or None for symbols that are not indexed
+        """
+        if self.symbol_index is None:
+            raise ValueError("No symbol index configured")
+        return {symbol: entry.interpretation if entry else None
+                for symbol, entry in self.symbol_index.interpret(symbols).items()}
+    
+    @staticmethod
+    def _stream_analysis(stream) -> Union[DreamAnalysis, Dict[str, Any]]:
+        """The validated model of a finished analysis stream, or its dictionary result."""
+        return stream.model if stream.model is not None else stream.result
+    
+    def _apply_analysis(self, dream_data: DreamSchema,
+                        analysis: Union[DreamAnalysis, Dict[str, Any]]) -> DreamAnalysis:
+        """Copy the generated analysis onto the dream data and return it as a model."""
+        if not isinstance(analysis, DreamAnalysis):
+            # Cached, reused or default values; models from LLMClient are already validated
+            analysis = DreamAnalysis.model_validate(analysis)
         # Update the dream data with the analysis and image prompt
-        self.dream_data.analysis = analysis_data.get("analysis", "")
-        self.dream_data.imagePrompt = analysis_data.get("imagePrompt", "")
+        dream_data.analysis = analysis.analysis
+        dream_data.imagePrompt = analysis.imagePrompt
         
-        return DreamAnalysis(**analysis_data)
+        return analysis
     
-    def generate_dream_image(self) -> str:
+    def generate_dream_image(self, on_preview: Optional[Callable[[str], None]] = None) -> str:
         """
         Step 4: Generate dream image using the Fireworks AI image generation API.
         Returns the path to the generated image.
+        
+        Args:
+            on_preview: Optional callback receiving the path of a quick low-step preview
+                        while the final image is still rendering. The preview file is
+                        deleted once the final image is ready.
         """
         if not self.dream_data or not self.dream_data.imagePrompt:
             raise ValueError("No image prompt available. Please generate analysis first.")
         
-        # Create image generation request with our prompt template
-        formatted_image_prompt = format_image_prompt(self.dream_data)
+        if on_preview is None:
+            return self._render_image(self.dream_data)
+        return self._render_progressive(self.dream_data, on_preview)
+    
+    async def astream_dream_image(self) -> AsyncIterator[ImageFrame]:
+        """
+        Async counterpart of generate_dream_image(on_preview=...): yields an ImageFrame
+        for the preview (unless the final image wins the race) and then for the final image.
+        """
+        if not self.dream_data or not self.dream_data.imagePrompt:
+            raise ValueError("No image prompt available. Please generate analysis first.")
         
+        async for frame in self._aprogressive_frames(self.dream_data):
+            yield frame
+    
+    def _new_image_path(self, suffix: str = "") -> str:
+        """Create a unique image path in the output directory."""
         # Create output directory if it doesn't exist
-        output_dir = "dream_results"
-        os.makedirs(output_dir, exist_ok=True)
+        os.makedirs(self.output_dir, exist_ok=True)
         
-        # Create a unique filename based on timestamp
-        import time
+        # Timestamp keeps files ordered, the random suffix keeps concurrent renders apart
         timestamp = int(time.time())
-        image_path = f"{output_dir}/dream_image_{timestamp}.png"
+        return f"{self.output_dir}/dream_image_{timestamp}_{uuid.uuid4().hex[:8]}{suffix}.png"
+    
+    def _progressive_clients(self, llm_client: LLMClient) -> Tuple[LLMClient, LLMClient]:
+        """
+        Clients for the preview and final render of one image.
+        
+        Both use the same seed, so the preview is a rough version of the final
+        composition, and both share the client's connection pool.
+        """
+        seed = llm_client.image_seed or secrets.randbelow(2 ** 31 - 1) + 1
+        preview = llm_client.with_options(image_seed=seed,
+                                          image_steps=min(self.preview_steps, llm_client.image_steps))
+        return preview, llm_client.with_options(image_seed=seed)
+    
+    def _render_progressive(self, dream_data: DreamSchema, on_preview: Callable[[str], None],
+                            llm_client: Optional[LLMClient] = None) -> str:
+        """Render a preview and the final image concurrently, handing the preview over first."""
+        preview_client, final_client = self._progressive_clients(llm_client or self.llm_client)
+        preview_path = self._new_image_path("_preview")
+        with ThreadPoolExecutor(max_workers=1) as executor:
+            final = executor.submit(self._render_image, dream_data, final_client)
+            with self.metrics.timer("pipeline_stage_seconds", stage="image_preview"):
+                preview = preview_client.generate_image(format_image_prompt(dream_data), preview_path)
+            # A preview that arrives after the final image would replace it, so drop it
+            if preview and not final.done():
+                on_preview(preview_path)
+            image_path = final.result()
+        self._discard_preview(preview_path)
+        return image_path
+    
+    async def _aprogressive_frames(self, dream_data: DreamSchema,
+                                   llm_client: Optional[LLMClient] = None) -> AsyncIterator[ImageFrame]:
+        """Async twin of _render_progressive, yielding the preview and final images as frames."""
+        preview_client, final_client = self._progressive_clients(llm_client or self.llm_client)
+        preview_path = self._new_image_path("_preview")
+        final = asyncio.create_task(self._arender_image(dream_data, final_client))
+        try:
+            with self.metrics.timer("pipeline_stage_seconds", stage="image_preview"):
+                preview = await preview_client.agenerate_image(format_image_prompt(dream_data), preview_path)
+            if preview and not final.done():
+                yield ImageFrame("preview", preview_path)
+            yield ImageFrame("final", await final)
+        finally:
+            # Also reached when the consumer stops iterating early
+            final.cancel()
+            await asyncio.to_thread(self._discard_preview, preview_path)
+    
+    @staticmethod
+    def _discard_preview(preview_path: str) -> None:
+        try:
+            os.remove(preview_path)
+        except FileNotFoundError:
+            pass
+    
+    def _render_image(self, dream_data: DreamSchema, llm_client: Optional[LLMClient] = None) -> str:
+        """Generate the image for a dream and record its path on the dream data."""
+        llm_client = llm_client or self.llm_client
+        # Create image generation request with our prompt template
+        formatted_image_prompt = format_image_prompt(dream_data)
+        image_path = self._new_image_path()
         
-        # Log the image generation request
-        print("\n=== Image Generation Request ===")
-        print(f"Prompt: {formatted_image_prompt}")
-        print(f"Style: dreamlike")
-        print(f"Dimensions: 1024x1024")
+        if llm_client.debug:
+            print("\n=== Image Generation Request ===")
+            print(f"Prompt: {formatted_image_prompt}")
+            print("Style: dreamlike")
+            print(f"Dimensions: {llm_client.image_width}x{llm_client.image_height}")
         
         # Use the simplified LLM client's image generation function
         try:
             # Generate the image using our client with the simplified method
-            result = self.llm_client.generate_image(
+            result = llm_client.generate_image(
                 prompt=formatted_image_prompt,
                 output_path=image_path
             )
             
-            print(f"\nDream image generated successfully at: {image_path}")
+            if result:
+                image_path = self._finish_image(dream_data, image_path)
+            if llm_client.debug:
+                print(f"\nDream image generated successfully at: {image_path}")
             return image_path
             
         except Exception as e:
@@ -154,36 +369,429 @@ class DreamAnalysisPipeline:
             # Return a placeholder path if generation fails
             return "generated_dream_image.png"
     
-    def save_dream_data(self, file_path: str) -> None:
-        """Save the complete dream data to a JSON file."""
+    async def _arender_image(self, dream_data: DreamSchema, llm_client: Optional[LLMClient] = None) -> str:
+        """Async twin of _render_image."""
+        formatted_image_prompt = format_image_prompt(dream_data)
+        image_path = self._new_image_path()
+        
+        result = await (llm_client or self.llm_client).agenerate_image(
+            prompt=formatted_image_prompt,
+            output_path=image_path
+        )
+        if not result:
+            return image_path
+        thumbnails = {}
+        if self.image_processor:
+            try:
+                thumbnails = await self.image_processor.aprocess(image_path)
+                image_path = thumbnails.pop("full")
+            except Exception as e:
+                self._encode_failed(e)
+        return await asyncio.to_thread(self._place_image, dream_data, image_path, thumbnails)
+    
+    def _finish_image(self, dream_data: DreamSchema, image_path: str) -> str:
+        """Post-process a freshly generated image and record it on the dream data."""
+        thumbnails = {}
+        if self.image_processor:
+            try:
+                thumbnails = self.image_processor.process(image_path)
+                image_path = thumbnails.pop("full")
+            except Exception as e:
+                self._encode_failed(e)
+        return self._place_image(dream_data, image_path, thumbnails)
+    
+    def _encode_failed(self, error: Exception) -> None:
+        # The original image is still usable, so keep it rather than failing the dream
+        print(f"Error post-processing dream image, keeping the original: {error}")
+        self.metrics.inc("pipeline_stage_errors_total", stage="image_encode")
+    
+    def _place_image(self, dream_data: DreamSchema, image_path: str, thumbnails: Dict[str, str]) -> str:
+        """Move an image and its thumbnails into the store (if any) and record their paths."""
+        if self.store:
+            image_path = self.store.store_image(image_path)
+            thumbnails = {size: self.store.store_image(path) for size, path in thumbnails.items()}
+        dream_data.imagePath = image_path
+        dream_data.imageThumbnails = thumbnails
+        return image_path
+    
+    def save_dream_data(self, file_path: Optional[str] = None) -> Optional[str]:
+        """
+        Save the complete dream data to a JSON file, or to the store when no path is given.
+        
+        Returns:
+            The dream's ID in the store, or None when written to a file
+        """
         if not self.dream_data:
             raise ValueError("No dream data available.")
         
+        if file_path is None:
+            if not self.store:
+                raise ValueError("No file path given and the pipeline has no store.")
+            # Saving again updates the same record instead of adding a duplicate
+            self.last_dream_id = self.store.save(self.dream_data, dream_id=self.last_dream_id)
+            print(f"Dream saved with ID {self.last_dream_id}")
+            return self.last_dream_id
+        
+        self._write_dream_data(self.dream_data, file_path)
+        return None
+    
+    def _write_dream_data(self, dream_data: DreamSchema, file_path: str) -> None:
+        """Write dream data to a JSON file."""
         with open(file_path, 'w') as f:
-            json.dump(self.dream_data.model_dump(), f, indent=2)
+            json.dump(dream_data.model_dump(), f, indent=2)
         
         print(f"Dream data saved to {file_path}")
     
-    def run_pipeline(self) -> Dict[str, Any]:
+    def _find_reusable(self, dream_data: DreamSchema) -> Tuple[Optional[Dict[str, Any]], Optional[Dict[str, Any]]]:
+        """
+        Look the dream up in the dedup index.
+        
+        Returns:
+            The earlier analysis (if similar enough to reuse outright) and the earlier
+            image fields, imagePath, imageThumbnails and the imagePrompt it was rendered
+            from (if similar enough and the image still exists)
+        """
+        if self.dedup is None:
+            return None, None
+        match = self.dedup.lookup(dream_data)
+        analysis, image = None, None
+        # Entries written before failed analyses were kept out of the index are skipped too
+        if match is not None and not analysis_failed(match.payload.get("analysis")):
+            stored = match.payload["analysis"]
+            if match.score >= self.dedup.threshold:
+                analysis = stored
+            image_path = match.payload.get("imagePath")
+            if image_path and os.path.exists(image_path):
+                # The image only goes with the prompt it was rendered from
+                image = {"imagePath": image_path, "imageThumbnails": match.payload.get("imageThumbnails", {}),
+                         "imagePrompt": stored["imagePrompt"]}
+        reuse = "analysis" if analysis else "image" if image else "none"
+        self.metrics.inc("pipeline_dedup_total", reuse=reuse)
+        return analysis, image
+    
+    @staticmethod
+    def _reuse_image(dream_data: DreamSchema, image: Dict[str, Any]) -> str:
+        """Take over an earlier dream's image, along with the image prompt it was rendered from."""
+        dream_data.imagePrompt = image["imagePrompt"]
+        dream_data.imagePath = image["imagePath"]
+        dream_data.imageThumbnails = image["imageThumbnails"]
+        return dream_data.imagePath
+    
+    def _index_dream(self, dream_data: DreamSchema, analysis: DreamAnalysis) -> None:
+        """Add a freshly analyzed dream to the dedup index, unless its analysis failed."""
+        if analysis_failed(analysis) or not dream_data.imagePath:
+            # Error defaults are never reused, just as they are never cached
+            self.metrics.inc("pipeline_dedup_skipped_total")
+            return
+        self.dedup.add(dream_data, {
+            # The prompt of the image actually stored, which differs when an earlier image was reused
+            "analysis": {**analysis.model_dump(), "imagePrompt": dream_data.imagePrompt},
+            "imagePath": dream_data.imagePath,
+            "imageThumbnails": dream_data.imageThumbnails,
+        })
+    
+    @contextmanager
+    def _track_in_flight(self) -> Iterator[None]:
+        """Count the dreams being analyzed, the load signal used for routing."""
+        with self._in_flight_lock:
+            self._in_flight += 1
+        try:
+            yield
+        finally:
+            with self._in_flight_lock:
+                self._in_flight -= 1
+    
+    def _route(self, dream_data: DreamSchema, user_tier: Optional[str] = None,
+               latency_budget: Optional[float] = None,
+               queue_depth: int = 0) -> Tuple[LLMClient, Optional[Route]]:
+        """
+        Pick the client settings for one dream.
+        
+        Returns:
+            The client to use (the shared one when there is no router) and the chosen route
+        """
+        if self.router is None:
+            return self.llm_client, None
+        route = self.router.choose(
+            narrative_chars=len(dream_data.narrative),
+            user_tier=user_tier,
+            queue_depth=queue_depth + self._in_flight,
+            latency_budget=latency_budget,
+        )
+        self.metrics.inc("pipeline_route_total", route=route.name)
+        return self.llm_client.with_options(**route.client_options()), route
+    
+    def _build_dream_graph(self, dream_data: DreamSchema,
+                           on_delta: Optional[Callable[[str], None]] = None,
+                           save_path: Optional[str] = None,
+                           llm_client: Optional[LLMClient] = None,
+                           dream_id: Optional[str] = None) -> StageGraph:
+        """
+        Build the stage graph that analyzes a single dream.
+        
+        The analysis is streamed, and the image stage starts as soon as the
+        imagePrompt field is complete rather than waiting for the whole response.
+        When a save path is given, the analysis is written as soon as it is ready
+        and rewritten with the image path once the image is done. With a store,
+        the same happens to the dream's store record (under ``dream_id`` if
+        given), and the "store" output is its ID, or None when the analysis
+        failed and nothing was stored. With a dedup index, a near-duplicate dream skips the analysis
+        and/or image generation. With analytics, the completed dream is counted
+        unless its analysis failed.
+        """
+        llm_client = llm_client or self.llm_client
+        reused_analysis, reused_image = self._find_reusable(dream_data)
+        
+        def analysis_stage(ctx: StageContext) -> DreamAnalysis:
+            if reused_analysis:
+                analysis = self._apply_analysis(dream_data, reused_analysis)
+                if on_delta:
+                    on_delta(dream_data.analysis)
+                ctx.publish("image_prompt", dream_data.imagePrompt)
+                return analysis
+            if self.batcher is not None and on_delta is None:
+                # Nobody watches the text arrive, so the dream can wait for a batch instead
+                analysis = self._apply_analysis(dream_data, self.batcher.generate(
+                    llm_client, self._analysis_prompt(dream_data), DreamAnalysis,
+                    system=DREAM_ANALYSIS_SYSTEM_PROMPT))
+                ctx.publish("image_prompt", dream_data.imagePrompt)
+                return analysis
+            stream = llm_client.stream_structured_json(self._analysis_prompt(dream_data), DreamAnalysis,
+                                                      system=DREAM_ANALYSIS_SYSTEM_PROMPT)
+            for delta in stream:
+                if delta.field == "analysis" and delta.text and on_delta:
+                    on_delta(delta.text)
+                elif delta.field == "imagePrompt" and delta.done:
+                    dream_data.imagePrompt = stream.parser.value["imagePrompt"]
+                    ctx.publish("image_prompt", dream_data.imagePrompt)
+            analysis = self._apply_analysis(dream_data, self._stream_analysis(stream))
+            if reused_image and dream_data.imagePrompt:
+                # The image stage may already have taken over the earlier image and its prompt
+                dream_data.imagePrompt = reused_image["imagePrompt"]
+            # No-op if the prompt was already published from the stream
+            ctx.publish("image_prompt", dream_data.imagePrompt)
+            return analysis
+        
+        def image_stage(ctx: StageContext) -> str:
+            if not ctx.get("image_prompt"):
+                return ""
+            if reused_image:
+                return self._reuse_image(dream_data, reused_image)
+            return self._render_image(dream_data, llm_client)
+        
+        graph = StageGraph()
+        graph.add_stage("analysis", analysis_stage, provides=["image_prompt"])
+        graph.add_stage("image", image_stage, requires=["image_prompt"])
+        if save_path:
+            graph.add_stage("save_analysis", lambda ctx: self._write_dream_data(dream_data, save_path),
+                            requires=["analysis"])
+            graph.add_stage("save", lambda ctx: self._write_dream_data(dream_data, save_path),
+                            requires=["image", "save_analysis"])
+        if self.store:
+            # A failed analysis is error defaults, not a dream worth keeping
+            graph.add_stage("store_analysis", lambda ctx: None if analysis_failed(dream_data)
+                            else self.store.save(dream_data, dream_id=dream_id), requires=["analysis"])
+            graph.add_stage("store", lambda ctx: ctx.get("store_analysis")
+                            and self.store.save(dream_data, dream_id=ctx.get("store_analysis")),
+                            requires=["image", "store_analysis"])
+        if self.dedup is not None and not reused_analysis:
+            graph.add_stage("index", lambda ctx: self._index_dream(dream_data, ctx.get("analysis")),
+                            requires=["analysis", "image"])
+        if self.analytics is not None:
+            # Failed analyses (error defaults, empty emotion) would skew the aggregates
+            graph.add_stage("analytics", lambda ctx: None if analysis_failed(dream_data)
+                            else self.analytics.record(dream_data), requires=["analysis", "image"])
+        return graph
+    
+    def _run_graph(self, graph: StageGraph) -> StageResult:
+        """Run a stage graph, report its timings and re-raise the first stage error."""
+        result = graph.run()
+        for name, timing in result.timings.items():
+            self.metrics.observe("pipeline_stage_seconds", timing.duration, stage=name)
+        for name in result.errors:
+            self.metrics.inc("pipeline_stage_errors_total", stage=name)
+        self.metrics.observe("pipeline_dream_seconds", result.wall_time)
+        if self.on_stage_timings:
+            self.on_stage_timings(result)
+        if result.errors:
+            raise next(iter(result.errors.values()))
+        return result
+    
+    def run_pipeline(self, stream: bool = True, save_path: Optional[str] = None) -> Dict[str, Any]:
         """
         Run the complete dream analysis pipeline.
         Returns the complete dream data.
+        
+        Args:
+            stream: Print the analysis as it is generated instead of after it completes
+            save_path: Optional JSON file the results are written to while the image renders
         """
         # Step 1: Collect dream information
         self.collect_dream_information()
         
         # Step 2 (internal): LLM processes and structures the information (already done in Step 1)
         
-        # Step 3: Generate analysis
-        analysis = self.generate_analysis()
+        # Steps 3 and 4: Generate analysis and image, overlapping where possible
         print("\n=== Dream Analysis ===")
-        print(analysis.analysis)
+        on_delta = (lambda text: print(text, end="", flush=True)) if stream else None
+        llm_client, route = self._route(self.dream_data)
+        self.last_stage_result = self._run_graph(
+            self._build_dream_graph(self.dream_data, on_delta=on_delta, save_path=save_path, llm_client=llm_client)
+        )
+        if route:
+            self.router.observe(route.name, self.last_stage_result.wall_time)
+        self.last_dream_id = self.last_stage_result.outputs.get("store")
+        if stream:
+            print()
+        else:
+            print(self.dream_data.analysis)
         
-        # Step 4: Generate image
-        image_path = self.generate_dream_image()
+        image_path = self.last_stage_result.outputs.get("image")
         print(f"\nDream image would be generated at: {image_path}")
         
+        print("\n=== Stage Timings ===")
+        print(format_timings(self.last_stage_result))
+        
         return self.dream_data.model_dump()
+    
+    def analyze_dream(self, dream: DreamSchema, user_tier: Optional[str] = None,
+                      latency_budget: Optional[float] = None, queue_depth: int = 0,
+                      dream_id: Optional[str] = None) -> Dict[str, Any]:
+        """
+        Non-interactive analysis of a single dream: analysis followed by image generation.
+        
+        The input model is copied, so the caller's object and the pipeline's
+        interactive state are left untouched.
+        
+        Args:
+            dream: The collected dream information
+            user_tier: Tier of the requesting user, used by the router
+            latency_budget: Seconds the caller is willing to wait, used by the router
+            queue_depth: Dreams queued ahead of this one, added to the in-flight count
+                         as the router's load signal
+            dream_id: Store ID to write under, so that retries of the same dream
+                      update one record instead of adding a new one each time
+            
+        Returns:
+            The completed dream data as a dictionary, with its store ``id`` when the
+            pipeline has a store (and the analysis succeeded) and the ``route`` used
+            when it has a router
+        """
+        dream_data = dream.model_copy()
+        with self._track_in_flight():
+            llm_client, route = self._route(dream_data, user_tier, latency_budget, queue_depth)
+            result = self._run_graph(self._build_dream_graph(dream_data, llm_client=llm_client,
+                                                             dream_id=dream_id))
+        data = dream_data.model_dump()
+        if result.outputs.get("store"):
+            data["id"] = result.outputs["store"]
+        if route:
+            self.router.observe(route.name, result.wall_time)
+            data["route"] = route.name
+        return data
+    
+    def analyze_many(self, dreams: Iterable[DreamSchema], max_concurrency: int = 8) -> List[Dict[str, Any]]:
+        """
+        Analyze many dreams concurrently using a thread pool.
+        
+        Args:
+            dreams: Dreams to analyze
+            max_concurrency: Maximum number of dreams in flight at once
+            
+        Returns:
+            Completed dream data for each dream, in input order
+        """
+        with ThreadPoolExecutor(max_workers=max_concurrency) as executor:
+            return list(executor.map(self.analyze_dream, dreams))
+    
+    async def aanalyze_dream(self, dream: DreamSchema,
+                             on_analysis: Optional[Callable[[DreamSchema], None]] = None,
+                             user_tier: Optional[str] = None, latency_budget: Optional[float] = None,
+                             queue_depth: int = 0,
+                             on_preview: Optional[Callable[[Optional[str]], None]] = None,
+                             dream_id: Optional[str] = None) -> Dict[str, Any]:
+        """
+        Async twin of analyze_dream.
+        
+        Args:
+            dream: The collected dream information
+            on_analysis: Optional callback invoked with the dream data once the analysis
+                         is ready, before the (slower) image render starts
+            user_tier: Tier of the requesting user, used by the router
+            latency_budget: Seconds the caller is willing to wait, used by the router
+            queue_depth: Dreams queued ahead of this one, used by the router
+            on_preview: Optional callback receiving the path of a low-step preview image
+                        while the final image renders (see generate_dream_image), and
+                        None once the final image has replaced (and deleted) it
+            dream_id: Store ID to write under (see analyze_dream)
+        """
+        dream_data = dream.model_copy()
+        start = time.perf_counter()
+        with self._track_in_flight(), self.metrics.timer("pipeline_dream_seconds"):
+            llm_client, route = self._route(dream_data, user_tier, latency_budget, queue_depth)
+            reused_analysis, reused_image = self._find_reusable(dream_data)
+            with self.metrics.timer("pipeline_stage_seconds", stage="analysis"):
+                if reused_analysis:
+                    analysis = self._apply_analysis(dream_data, reused_analysis)
+                elif self.batcher is not None:
+                    analysis = self._apply_analysis(dream_data, await self.batcher.agenerate(
+                        llm_client, self._analysis_prompt(dream_data), DreamAnalysis,
+                        system=DREAM_ANALYSIS_SYSTEM_PROMPT))
+                else:
+                    analysis = self._apply_analysis(dream_data, await llm_client.agenerate_structured_json(
+                        self._analysis_prompt(dream_data), DreamAnalysis, system=DREAM_ANALYSIS_SYSTEM_PROMPT,
+                        as_model=True))
+            if on_analysis:
+                on_analysis(dream_data)
+            failed = analysis_failed(dream_data)
+            if self.store and not failed:
+                dream_id = await asyncio.to_thread(self.store.save, dream_data, dream_id)
+            else:
+                dream_id = None
+            if dream_data.imagePrompt and reused_image:
+                self._reuse_image(dream_data, reused_image)
+            elif dream_data.imagePrompt:
+                with self.metrics.timer("pipeline_stage_seconds", stage="image"):
+                    if on_preview is None:
+                        await self._arender_image(dream_data, llm_client)
+                    else:
+                        async for frame in self._aprogressive_frames(dream_data, llm_client):
+                            # The preview file is deleted once the final image is in place
+                            on_preview(frame.path if frame.phase == "preview" else None)
+            # Index and analytics updates take locks and do NumPy work, so keep them off the loop
+            if self.dedup is not None and not reused_analysis:
+                await asyncio.to_thread(self._index_dream, dream_data, analysis)
+            if self.analytics is not None and not failed:
+                await asyncio.to_thread(self.analytics.record, dream_data)
+            if dream_id:
+                await asyncio.to_thread(self.store.save, dream_data, dream_id)
+        data = dream_data.model_dump()
+        if dream_id:
+            data["id"] = dream_id
+        if route:
+            self.router.observe(route.name, time.perf_counter() - start)
+            data["route"] = route.name
+        return data
+    
+    async def aanalyze_many(self, dreams: Iterable[DreamSchema], max_concurrency: int = 8) -> List[Dict[str, Any]]:
+        """
+        Async twin of analyze_many. A semaphore bounds the number of dreams in flight.
+        
+        Args:
+            dreams: Dreams to analyze
+            max_concurrency: Maximum number of dreams in flight at once
+            
+        Returns:
+            Completed dream data for each dream, in input order
+        """
+        semaphore = asyncio.Semaphore(max_concurrency)
+        
+        async def bounded(dream: DreamSchema) -> Dict[str, Any]:
+            async with semaphore:
+                return await self.aanalyze_dream(dream)
+        
+        # gather preserves the order of its arguments
+        return await asyncio.gather(*(bounded(dream) for dream in dreams))
 
 
 # Example usage
@@ -3,23 +3,38 @@ Prompts for the Dream Analysis Application.
 This module contains template prompts for the LLM at different stages of the pipeline.
 """
 
-# Prompt for generating the dream analysis
-DREAM_ANALYSIS_PROMPT = """
-As a dream interpreter, analyze the following dream information:
-
-Dream narrative: {narrative}
-Main symbols or elements: {symbols}
-Primary emotion felt: {emotion}
-Emotional intensity (1-5): {intensity}
-Connection to waking life: {life_connection}
+# Instructions for the dream analysis, sent as the system message. They contain no
+# per-dream data, so every analysis request starts with the same bytes and the
+# inference server can reuse its cached prefix instead of prefilling it again.
+DREAM_ANALYSIS_SYSTEM_PROMPT = """As a dream interpreter, analyze the dream information shared by the user.
 
 Provide a thoughtful analysis of what this dream might mean, focusing on emotional insights and 
 potential symbolism. Consider the personal context shared by the dreamer and avoid generic 
 interpretations. Be insightful yet concise.
 
 Also create an abstract visual representation that captures the essence of this dream using color blobs. 
-The visual description should be vivid, specific, and incorporate the emotional tone of the dream.
-"""
+The visual description should be vivid, specific, and incorporate the emotional tone of the dream."""
+
+# Prompt carrying the dream itself
+DREAM_ANALYSIS_PROMPT = """Dream narrative: {narrative}
+Main symbols or elements: {symbols}
+Primary emotion felt: {emotion}
+Emotional intensity (1-5): {intensity}
+Connection to waking life: {life_connection}"""
+
+# Appended to the dream prompt when some of its symbols are in the symbol index
+SYMBOL_CONTEXT_PROMPT = """
+Common meanings of some of these symbols (build on them for this dreamer rather than explaining them again):
+{meanings}"""
+
+# Instructions for building the symbol index offline, sent as the system message
+SYMBOL_INTERPRETATION_SYSTEM_PROMPT = """As a dream interpreter, explain what a single dream symbol 
+commonly means.
+
+Give the symbol's canonical name (singular, lowercase), a few other words dreamers use for the same 
+symbol (including its plural, if dreamers use it), and one or two sentences on its common emotional 
+and psychological meanings. Keep it general: the interpretation is reused as background for many 
+different dreams."""
 
 # Prompt for generating the image from the dream
 IMAGE_GENERATION_PROMPT = """
@@ -34,15 +49,25 @@ Style: Dreamlike, surreal, with rich symbolism
 """
 
 # Function to format prompts with dream data
-def format_analysis_prompt(dream_data):
-    """Format the analysis prompt with dream data."""
-    return DREAM_ANALYSIS_PROMPT.format(
+def format_analysis_prompt(dream_data, symbol_meanings=None):
+    """
+    Format the analysis prompt with dream data (send with DREAM_ANALYSIS_SYSTEM_PROMPT).
+    
+    symbol_meanings optionally maps symbols to their cached interpretations, which
+    are appended so the model does not interpret them from scratch.
+    """
+    prompt = DREAM_ANALYSIS_PROMPT.format(
         narrative=dream_data.narrative,
         symbols=", ".join(dream_data.mainSymbols),
         emotion=dream_data.primaryEmotion,
         intensity=dream_data.emotionalIntensity,
         life_connection=dream_data.lifeConnection
     )
+    if symbol_meanings:
+        prompt += SYMBOL_CONTEXT_PROMPT.format(
+            meanings="\n".join(f"- {symbol}: {meaning}" for symbol, meaning in symbol_meanings.items())
+        )
+    return prompt
 
 def format_image_prompt(dream_data):
     """Format the image generation prompt with dream data."""
@@ -0,0 +1,170 @@
+"""
+Per-request model and generation-parameter routing.
+
+Instead of sending every dream to the largest model with the largest budgets,
+a RoutingPolicy picks a Route (text model, token budget, image steps and
+resolution) for each dream from:
+
+- the user's tier: lower tiers start further down the route list
+- the current load: as the number of queued and in-flight dreams crosses
+  each threshold, requests move one route further towards the fast end
+- the latency budget: the best route whose observed latency fits is used;
+  an estimate that is not refreshed drifts back to the route's prior, so a
+  route skipped after a slow spell is tried again
+- the narrative length: long narratives get a larger token budget than the
+  route's own, never a smaller one, so the structured answer is not cut off,
+  but never more than the route's max_tokens_cap
+
+Under a traffic spike the service therefore degrades to smaller models and
+preview-quality renders instead of queueing everything behind the slowest path.
+
+Example:
+    policy = RoutingPolicy()
+    route = policy.choose(narrative_chars=800, user_tier="free", queue_depth=40)
+    client = llm_client.with_options(**route.client_options())
+"""
+
+import time
+import threading
+from typing import Any, Dict, NamedTuple, Optional, Sequence, Tuple
+
+
+class Route(NamedTuple):
+    """One set of generation settings, from the highest quality to the fastest."""
+    name: str
+    model: str
+    max_tokens: int
+    image_model: str = "stable-diffusion-xl-1024-v1-0"
+    image_width: int = 1024
+    image_height: int = 1024
+    image_steps: int = 30
+    # Prior estimate of the end-to-end seconds per dream, replaced by observations
+    expected_seconds: float = 20.0
+    # Most tokens a long narrative may raise max_tokens to
+    max_tokens_cap: int = 8192
+
+    def client_options(self) -> Dict[str, Any]:
+        """Keyword arguments for LLMClient.with_options."""
+        return {
+            "model": self.model,
+            "max_tokens": self.max_tokens,
+            "image_model": self.image_model,
+            "image_width": self.image_width,
+            "image_height": self.image_height,
+            "image_steps": self.image_steps,
+        }
+
+
+LARGE_MODEL = "accounts/fireworks/models/llama-v3p3-70b-instruct"
+SMALL_MODEL = "accounts/fireworks/models/llama-v3p1-8b-instruct"
+
+# SDXL only renders a fixed set of resolutions, so the cheaper routes save on steps
+DEFAULT_ROUTES = (
+    Route("full", LARGE_MODEL, 4096, image_steps=30, expected_seconds=20.0, max_tokens_cap=8192),
+    Route("balanced", LARGE_MODEL, 2048, image_steps=20, expected_seconds=12.0, max_tokens_cap=4096),
+    Route("fast", SMALL_MODEL, 1536, image_steps=12, expected_seconds=6.0, max_tokens_cap=2048),
+    Route("preview", SMALL_MODEL, 1024, image_steps=6, expected_seconds=3.0, max_tokens_cap=1536),
+)
+
+
+class RoutingPolicy:
+    """Chooses a Route per request from user tier, load, latency budget and input size."""
+
+    def __init__(self,
+                 routes: Sequence[Route] = DEFAULT_ROUTES,
+                 user_tiers: Optional[Dict[str, int]] = None,
+                 load_thresholds: Sequence[int] = (16, 48, 96),
+                 max_degrade: Optional[Dict[str, int]] = None,
+                 min_tokens: int = 512,
+                 tokens_per_char: float = 0.5,
+                 smoothing: float = 0.2,
+                 recovery_half_life: float = 60.0):
+        """
+        Args:
+            routes: Routes ordered from the highest quality to the fastest
+            user_tiers: Index of the best route each user tier may use; unknown tiers use
+                        the "standard" entry (default: premium 0, standard 0, free 1)
+            load_thresholds: Queued plus in-flight dreams at which requests move one
+                             more route towards the fast end
+            max_degrade: Most routes a tier can be moved down by load (default: premium 1)
+            min_tokens: Base of the narrative-length budget
+            tokens_per_char: Extra output tokens budgeted per narrative character; a long
+                             narrative's budget raises max_tokens above the route's own
+            smoothing: Weight of each new latency observation in the moving average
+            recovery_half_life: Seconds after which a route's estimate has moved halfway
+                                back to its prior without new observations (None never
+                                decays). Only chosen routes are observed, so without this a
+                                route skipped for one slow sample would stay skipped.
+        """
+        if not routes:
+            raise ValueError("RoutingPolicy needs at least one route")
+        self.routes = tuple(routes)
+        self.user_tiers = user_tiers if user_tiers is not None else {"premium": 0, "standard": 0, "free": 1}
+        self.load_thresholds = tuple(sorted(load_thresholds))
+        self.max_degrade = max_degrade if max_degrade is not None else {"premium": 1}
+        self.min_tokens = min_tokens
+        self.tokens_per_char = tokens_per_char
+        self.smoothing = smoothing
+        self.recovery_half_life = recovery_half_life
+        self._priors = {route.name: route.expected_seconds for route in self.routes}
+        # Route name -> (moving average, monotonic time of the last observation)
+        self._latency: Dict[str, Tuple[float, float]] = {}
+        self._lock = threading.Lock()
+
+    def _estimate(self, route_name: str, default: float) -> float:
+        """The moving average, decayed towards the prior by the time since it was observed."""
+        prior = self._priors.get(route_name, default)
+        if route_name not in self._latency:
+            return prior
+        average, observed_at = self._latency[route_name]
+        if not self.recovery_half_life:
+            return average
+        weight = 0.5 ** ((time.monotonic() - observed_at) / self.recovery_half_life)
+        return prior + (average - prior) * weight
+
+    def expected_seconds(self, route: Route) -> float:
+        """Moving average of the observed seconds per dream on a route."""
+        with self._lock:
+            return self._estimate(route.name, route.expected_seconds)
+
+    def observe(self, route_name: str, seconds: float) -> None:
+        """Feed back how long a dream on a route took."""
+        with self._lock:
+            previous = self._estimate(route_name, seconds)
+            self._latency[route_name] = (previous + self.smoothing * (seconds - previous), time.monotonic())
+
+    def choose(self, narrative_chars: int = 0, user_tier: Optional[str] = None,
+               queue_depth: int = 0, latency_budget: Optional[float] = None) -> Route:
+        """
+        Pick the route for one request.
+
+        Args:
+            narrative_chars: Length of the dream narrative
+            user_tier: Tier of the requesting user (e.g. "free", "standard", "premium")
+            queue_depth: Dreams queued or in flight, including this one
+            latency_budget: Seconds the caller is willing to wait, if limited
+
+        Returns:
+            The chosen route, with max_tokens raised for long narratives (up to
+            the route's max_tokens_cap)
+        """
+        tier = user_tier or "standard"
+        best = min(self.user_tiers.get(tier, self.user_tiers.get("standard", 0)), len(self.routes) - 1)
+
+        degrade = sum(1 for threshold in self.load_thresholds if queue_depth >= threshold)
+        if tier in self.max_degrade:
+            degrade = min(degrade, self.max_degrade[tier])
+        index = min(best + degrade, len(self.routes) - 1)
+
+        if latency_budget is not None:
+            # Move on to faster routes until one is expected to fit; the last one is the fallback
+            while index < len(self.routes) - 1 and self.expected_seconds(self.routes[index]) > latency_budget:
+                index += 1
+
+        route = self.routes[index]
+        # The route's max_tokens fits the whole structured answer; capping it by the narrative
+        # length would truncate the JSON of short dreams, so the length only ever adds to it,
+        # and only up to the route's ceiling so degraded routes stay cheap
+        budget = int(self.min_tokens + narrative_chars * self.tokens_per_char)
+        ceiling = max(route.max_tokens, route.max_tokens_cap)
+        return route._replace(max_tokens=min(max(budget, route.max_tokens), ceiling))
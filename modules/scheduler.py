@@ -0,0 +1,455 @@
+"""
+Request scheduler for calls to the Fireworks API.
+
+Every upstream call made by LLMClient goes through a RequestScheduler, which
+- throttles with token buckets for requests per second and tokens per minute,
+- retries transient failures with exponential backoff and jitter, honouring Retry-After,
+- fails fast through a circuit breaker while the upstream keeps failing,
+- optionally hedges slow calls with a duplicate request to cut tail latency.
+"""
+
+import time
+import random
+import asyncio
+import threading
+from email.utils import parsedate_to_datetime
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+from .metrics import Metrics, metrics as default_metrics
+
+# HTTP status codes worth retrying
+RETRYABLE_STATUS_CODES = {408, 409, 425, 429, 500, 502, 503, 504}
+
+
+class CircuitOpenError(Exception):
+    """Raised when a call is rejected because the circuit breaker is open."""
+
+
+def is_retryable(error: BaseException) -> bool:
+    """Return True if the error is transient and the call may be retried."""
+    status_code = getattr(error, "status_code", None)
+    if status_code is not None:
+        return status_code in RETRYABLE_STATUS_CODES
+    # Already loaded by the client that raised the error, so these imports are free
+    import httpx
+    import openai
+    return isinstance(error, (
+        openai.APIConnectionError,
+        httpx.TimeoutException,
+        httpx.TransportError,
+        TimeoutError,
+        ConnectionError,
+    ))
+
+
+def retry_after_seconds(error: BaseException) -> Optional[float]:
+    """Read the server's Retry-After hint from an error's HTTP response, if present."""
+    response = getattr(error, "response", None)
+    headers = getattr(response, "headers", None)
+    if not headers:
+        return None
+
+    retry_after_ms = headers.get("retry-after-ms")
+    if retry_after_ms:
+        try:
+            return float(retry_after_ms) / 1000
+        except ValueError:
+            pass
+
+    retry_after = headers.get("retry-after")
+    if not retry_after:
+        return None
+    try:
+        return max(0.0, float(retry_after))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(retry_after).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+class TokenBucket:
+    """
+    Token bucket that lets callers take tokens on credit.
+
+    A reservation always succeeds and returns how long the caller must wait for
+    the bucket to refill past its debt, so waiting callers are served in order.
+    """
+
+    def __init__(self, rate: float, capacity: Optional[float] = None):
+        """
+        Args:
+            rate: Tokens added per second
+            capacity: Maximum tokens the bucket holds (defaults to one second of rate)
+        """
+        self.rate = rate
+        self.capacity = capacity if capacity is not None else max(1.0, rate)
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def reserve(self, amount: float = 1.0) -> float:
+        """Take tokens and return the number of seconds to wait before using them."""
+        with self._lock:
+            self._refill()
+            self._tokens -= amount
+            if self._tokens >= 0:
+                return 0.0
+            return -self._tokens / self.rate
+
+    def try_acquire(self, amount: float = 1.0) -> bool:
+        """Take tokens only if they are available right now."""
+        with self._lock:
+            self._refill()
+            if self._tokens < amount:
+                return False
+            self._tokens -= amount
+            return True
+
+    def adjust(self, amount: float) -> None:
+        """Return (positive) or take (negative) tokens after the real cost is known."""
+        with self._lock:
+            self._refill()
+            self._tokens = min(self.capacity, self._tokens + amount)
+
+
+class RetryPolicy:
+    """Exponential backoff with full jitter."""
+
+    def __init__(self, max_attempts: int = 4, base_delay: float = 0.5,
+                 max_delay: float = 20.0, max_retry_after: float = 60.0):
+        """
+        Args:
+            max_attempts: Total attempts per call, including the first
+            base_delay: Backoff before the first retry, doubled on each further retry
+            max_delay: Upper bound on the computed backoff
+            max_retry_after: Upper bound on a server-provided Retry-After
+        """
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.max_retry_after = max_retry_after
+
+    def delay(self, attempt: int, error: BaseException) -> float:
+        """Seconds to wait before retry number ``attempt`` (0-based)."""
+        retry_after = retry_after_seconds(error)
+        if retry_after is not None:
+            # Add a little jitter so clients told the same time do not retry in lockstep
+            return min(retry_after, self.max_retry_after) + random.uniform(0, self.base_delay)
+        return random.uniform(0, min(self.max_delay, self.base_delay * (2 ** attempt)))
+
+
+class CircuitBreaker:
+    """
+    Opens after consecutive transient failures and rejects calls until a cool-down passes.
+    After the cool-down a single trial call is allowed; its outcome closes or re-opens the circuit.
+    """
+
+    def __init__(self, failure_threshold: int = 5, reset_timeout: float = 30.0):
+        """
+        Args:
+            failure_threshold: Consecutive failures that open the circuit
+            reset_timeout: Seconds the circuit stays open before a trial call is allowed
+        """
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = "closed"
+        self._failures = 0
+        self._opened_at = 0.0
+        self._trial_in_flight = False
+        self._lock = threading.Lock()
+
+    def before_call(self) -> None:
+        """Raise CircuitOpenError if the call must not be made."""
+        with self._lock:
+            if self.state == "closed":
+                return
+            if self.state == "open" and time.monotonic() - self._opened_at >= self.reset_timeout:
+                self.state = "half-open"
+            if self.state == "half-open" and not self._trial_in_flight:
+                self._trial_in_flight = True
+                return
+            raise CircuitOpenError("Circuit breaker is open; upstream is failing")
+
+    def record_success(self) -> None:
+        with self._lock:
+            self._failures = 0
+            self._trial_in_flight = False
+            self.state = "closed"
+
+    def record_failure(self) -> None:
+        with self._lock:
+            self._failures += 1
+            self._trial_in_flight = False
+            if self.state == "half-open" or self._failures >= self.failure_threshold:
+                self.state = "open"
+                self._opened_at = time.monotonic()
+
+    def release(self) -> None:
+        """Release a trial slot after a call that neither succeeded nor failed transiently."""
+        with self._lock:
+            self._trial_in_flight = False
+
+
+def _usage_tokens(result: Any) -> Optional[int]:
+    """Total tokens reported by a completion response, if any."""
+    usage = getattr(result, "usage", None)
+    return getattr(usage, "total_tokens", None)
+
+
+class RequestScheduler:
+    """Rate limiting, retries, circuit breaking and hedging for upstream calls."""
+
+    def __init__(self,
+                 requests_per_second: Optional[float] = None,
+                 tokens_per_minute: Optional[float] = None,
+                 retry: Optional[RetryPolicy] = None,
+                 breaker: Optional[CircuitBreaker] = None,
+                 hedge_after: Optional[float] = None,
+                 max_hedge_workers: int = 8,
+                 metrics: Optional[Metrics] = None):
+        """
+        Args:
+            requests_per_second: Request rate limit (None disables it)
+            tokens_per_minute: Token rate limit (None disables it)
+            retry: Retry policy (defaults to RetryPolicy())
+            breaker: Circuit breaker (defaults to CircuitBreaker())
+            hedge_after: Seconds after which a slow call is duplicated (None disables hedging).
+                         Hedges are only sent when the request rate limit has spare capacity.
+            max_hedge_workers: Hedge threads for synchronous calls, and the most async hedge
+                               requests in flight; calls beyond that are not hedged
+            metrics: Instrumentation front end; counters are exported as scheduler_<name>_total
+        """
+        self.request_bucket = TokenBucket(requests_per_second) if requests_per_second else None
+        self.token_bucket = (
+            TokenBucket(tokens_per_minute / 60.0, capacity=tokens_per_minute) if tokens_per_minute else None
+        )
+        self.retry = retry or RetryPolicy()
+        self.breaker = breaker or CircuitBreaker()
+        self.hedge_after = hedge_after
+        self.max_hedge_workers = max_hedge_workers
+        self.metrics = metrics or default_metrics
+        self._hedge_executor: Optional[ThreadPoolExecutor] = None
+        # One slot per executor thread (or in-flight async hedge), so hedged attempts start
+        # at once instead of queueing
+        self._hedge_slots = threading.BoundedSemaphore(max_hedge_workers)
+        self._stats = {"calls": 0, "retries": 0, "failures": 0, "hedges": 0,
+                       "rejected": 0, "throttled_seconds": 0.0}
+        self._lock = threading.Lock()
+
+    def _count(self, name: str, amount: float = 1) -> None:
+        with self._lock:
+            self._stats[name] += amount
+        self.metrics.inc(f"scheduler_{name}_total", amount)
+
+    def stats(self) -> Dict[str, float]:
+        """Return call, retry, hedge and throttling counters."""
+        with self._lock:
+            return dict(self._stats)
+
+    def _throttle_delay(self, estimated_tokens: int) -> float:
+        """Reserve one request and ``estimated_tokens`` tokens; returns the wait before sending."""
+        delay = 0.0
+        if self.request_bucket:
+            delay = max(delay, self.request_bucket.reserve(1))
+        if self.token_bucket and estimated_tokens:
+            delay = max(delay, self.token_bucket.reserve(estimated_tokens))
+        if delay:
+            self._count("throttled_seconds", delay)
+        return delay
+
+    def _settle_tokens(self, estimated_tokens: int, result: Any) -> None:
+        actual = _usage_tokens(result)
+        if self.token_bucket and actual is not None:
+            self.token_bucket.adjust(estimated_tokens - actual)
+
+    def _take_hedge_slot(self) -> bool:
+        """
+        Take a hedge slot and a spare request token for a duplicate attempt.
+
+        The slot is checked first, so a request token is only spent on a hedge that
+        actually goes out; the caller releases the slot when the attempt finishes.
+        """
+        if not self._hedge_slots.acquire(blocking=False):
+            return False
+        if self.request_bucket is None or self.request_bucket.try_acquire(1):
+            return True
+        self._hedge_slots.release()
+        return False
+
+    def _before_attempt(self) -> None:
+        try:
+            self.breaker.before_call()
+        except CircuitOpenError:
+            self._count("rejected")
+            raise
+
+    def _handle_failure(self, error: Exception, attempt: int) -> Optional[float]:
+        """Record a failed attempt and return the backoff delay, or None if it should not be retried."""
+        if not is_retryable(error):
+            self.breaker.release()
+            return None
+        self.breaker.record_failure()
+        if attempt + 1 >= self.retry.max_attempts:
+            self._count("failures")
+            return None
+        self._count("retries")
+        return self.retry.delay(attempt, error)
+
+    # Synchronous API
+
+    @staticmethod
+    def _discard(result: Any) -> None:
+        """Close the result of a losing attempt (a stream or response) so its connection is released."""
+        close = getattr(result, "close", None)
+        if callable(close):
+            try:
+                close()
+            except Exception:
+                pass
+
+    def _discard_late(self, future: Future) -> None:
+        if not future.cancelled() and future.exception() is None:
+            self._discard(future.result())
+
+    def _submit_hedged(self, fn: Callable[[], Any]) -> Future:
+        """Start an attempt on a hedge thread; the caller already holds its slot."""
+        if self._hedge_executor is None:
+            with self._lock:
+                if self._hedge_executor is None:
+                    self._hedge_executor = ThreadPoolExecutor(max_workers=self.max_hedge_workers,
+                                                              thread_name_prefix="hedge")
+
+        def attempt() -> Any:
+            try:
+                return fn()
+            finally:
+                self._hedge_slots.release()
+
+        return self._hedge_executor.submit(attempt)
+
+    def _run_hedged(self, fn: Callable[[], Any], hedge: bool = True) -> Any:
+        if not self.hedge_after or not hedge:
+            return fn()
+        # A blocking call cannot be abandoned once it runs on the caller's thread, so a hedged
+        # call needs its attempts on hedge threads. When none is free the call runs here,
+        # unhedged, rather than waiting in a queue whose delay would count towards hedge_after.
+        if not self._hedge_slots.acquire(blocking=False):
+            return fn()
+
+        pending = {self._submit_hedged(fn)}
+        done, pending = wait(pending, timeout=self.hedge_after)
+        if not done and self._take_hedge_slot():
+            self._count("hedges")
+            pending.add(self._submit_hedged(fn))
+
+        # The first successful response wins; the loser finishes in the background and is closed
+        first_error = None
+        while True:
+            for future in done:
+                if future.exception() is None:
+                    for other in done - {future}:
+                        self._discard_late(other)
+                    for other in pending:
+                        other.add_done_callback(self._discard_late)
+                    return future.result()
+                first_error = first_error or future.exception()
+            if not pending:
+                raise first_error
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+
+    def call(self, fn: Callable[[], Any], estimated_tokens: int = 0, hedge: bool = True) -> Any:
+        """
+        Run a call under the scheduler's rate limits, retries and circuit breaker.
+
+        Args:
+            fn: Zero-argument function performing the upstream request
+            estimated_tokens: Expected token cost, reserved once against the tokens-per-minute
+                              limit and corrected from ``response.usage`` afterwards
+            hedge: Whether a slow call may be duplicated; pass False for streams and for
+                   calls that are not idempotent
+
+        Returns:
+            The function's result
+        """
+        self._count("calls")
+        attempt = 0
+        while True:
+            self._before_attempt()
+            # Retries take a request slot each, but the call's tokens are only reserved once
+            delay = self._throttle_delay(estimated_tokens if attempt == 0 else 0)
+            if delay:
+                time.sleep(delay)
+            try:
+                result = self._run_hedged(fn, hedge)
+            except Exception as e:
+                backoff = self._handle_failure(e, attempt)
+                if backoff is None:
+                    raise
+                time.sleep(backoff)
+                attempt += 1
+                continue
+            self.breaker.record_success()
+            self._settle_tokens(estimated_tokens, result)
+            return result
+
+    # Asynchronous API
+
+    async def _arun_hedged(self, fn: Callable[[], Awaitable[Any]], hedge: bool = True) -> Any:
+        if not self.hedge_after or not hedge:
+            return await fn()
+
+        tasks = {asyncio.ensure_future(fn())}
+        done, pending = await asyncio.wait(tasks, timeout=self.hedge_after)
+        if not done and self._take_hedge_slot():
+            self._count("hedges")
+            hedge_task = asyncio.ensure_future(fn())
+            hedge_task.add_done_callback(lambda _: self._hedge_slots.release())
+            pending.add(hedge_task)
+
+        first_error = None
+        try:
+            while True:
+                for task in done:
+                    if task.exception() is None:
+                        for other in done - {task}:
+                            if other.exception() is None:
+                                self._discard(other.result())
+                        return task.result()
+                    first_error = first_error or task.exception()
+                if not pending:
+                    raise first_error
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+        finally:
+            # Unlike threads, the losing coroutine can be cancelled
+            for task in pending:
+                task.cancel()
+
+    async def acall(self, fn: Callable[[], Awaitable[Any]], estimated_tokens: int = 0, hedge: bool = True) -> Any:
+        """Async twin of call; ``fn`` returns an awaitable."""
+        self._count("calls")
+        attempt = 0
+        while True:
+            self._before_attempt()
+            delay = self._throttle_delay(estimated_tokens if attempt == 0 else 0)
+            if delay:
+                await asyncio.sleep(delay)
+            try:
+                result = await self._arun_hedged(fn, hedge)
+            except Exception as e:
+                backoff = self._handle_failure(e, attempt)
+                if backoff is None:
+                    raise
+                await asyncio.sleep(backoff)
+                attempt += 1
+                continue
+            self.breaker.record_success()
+            self._settle_tokens(estimated_tokens, result)
+            return result
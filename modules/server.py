@@ -0,0 +1,326 @@
+"""
+Headless HTTP service for the dream analysis pipeline.
+
+Accepts DreamSchema JSON, queues it on a bounded work queue and processes it with
+a pool of async workers that share one LLMClient. Clients poll the job for its
+status; the analysis is available as soon as it is ready, before the image render
+finishes, followed by a low-step preview image and then the final image.
+
+Endpoints:
+    POST /dreams              Submit a dream (202 with a job id, 503 when the queue is full);
+                              ?tier=free|standard|premium and ?budget=<seconds> feed the router
+    GET  /dreams/{job_id}     Job status, analysis and preview or final image URL
+    GET  /images/{name}       Generated images
+    GET  /analytics           Emotion trends, intensity and top symbols (with --analytics);
+                              ?user=<userId>, ?days=<window> and ?top=<symbols>
+    GET  /symbols?q=a,b       Cached symbol interpretations, without an LLM call (with --symbols)
+    GET  /metrics             Prometheus metrics
+    GET  /healthz             Queue depth and worker count
+
+Run with:
+    python -m modules.server --port 8080 --workers 16 --queue-size 256
+
+With --routing, each dream is routed to a model and image quality according to
+its tier, latency budget and the current queue depth (see modules/routing.py).
+With --batch-size, analyses submitted within --batch-wait milliseconds of each
+other share one upstream request (see modules/batching.py).
+With --symbols, the cached meanings of known symbols are added to analysis
+prompts (see modules/symbols.py).
+"""
+
+import os
+import time
+import uuid
+import asyncio
+import argparse
+from collections import OrderedDict
+from typing import Any, Dict, Optional
+
+from aiohttp import web
+from pydantic import ValidationError
+
+from .pipeline import DreamAnalysisPipeline, DreamSchema
+from .llm_client import LLMClient
+from .metrics import metrics, MetricsRegistry
+from .store import DreamStore
+from .images import ImageProcessor, thumbnail_sizes
+from .routing import RoutingPolicy
+from .batching import MicroBatcher
+
+
+class Job:
+    """State of one submitted dream."""
+
+    def __init__(self, dream: DreamSchema, user_tier: Optional[str] = None,
+                 latency_budget: Optional[float] = None):
+        self.id = uuid.uuid4().hex
+        self.dream = dream
+        self.user_tier = user_tier
+        self.latency_budget = latency_budget
+        self.preview_path: Optional[str] = None
+        self.status = "queued"
+        self.result: Optional[Dict[str, Any]] = None
+        self.error: Optional[str] = None
+        self.created_at = time.time()
+        self.finished_at: Optional[float] = None
+        self.done = asyncio.Event()
+
+    def to_dict(self) -> Dict[str, Any]:
+        data = {"id": self.id, "status": self.status, "createdAt": self.created_at}
+        if self.preview_path is not None:
+            data["previewUrl"] = f"/images/{os.path.basename(self.preview_path)}"
+        if self.result is not None:
+            data["result"] = self.result
+            if self.result.get("imagePath"):
+                data["imageUrl"] = f"/images/{os.path.basename(self.result['imagePath'])}"
+            if self.result.get("imageThumbnails"):
+                data["thumbnailUrls"] = {size: f"/images/{os.path.basename(path)}"
+                                         for size, path in self.result["imageThumbnails"].items()}
+        if self.error is not None:
+            data["error"] = self.error
+        if self.finished_at is not None:
+            data["finishedAt"] = self.finished_at
+        return data
+
+
+class DreamService:
+    """Bounded job queue and worker pool around a single DreamAnalysisPipeline."""
+
+    def __init__(self, pipeline: DreamAnalysisPipeline, workers: int = 8,
+                 queue_size: int = 128, max_retained_jobs: int = 10_000):
+        """
+        Args:
+            pipeline: Pipeline shared by every worker (and with it, one LLMClient)
+            workers: Number of dreams processed concurrently
+            queue_size: Maximum number of queued dreams before submissions are rejected
+            max_retained_jobs: Finished jobs kept for polling before the oldest are dropped
+        """
+        self.pipeline = pipeline
+        self.workers = workers
+        self.queue: "asyncio.Queue[Job]" = asyncio.Queue(maxsize=queue_size)
+        self.jobs: "OrderedDict[str, Job]" = OrderedDict()
+        self.max_retained_jobs = max_retained_jobs
+        self._tasks = []
+
+    def submit(self, dream: DreamSchema, user_tier: Optional[str] = None,
+               latency_budget: Optional[float] = None) -> Job:
+        """Queue a dream. Raises asyncio.QueueFull when the service is saturated."""
+        job = Job(dream, user_tier, latency_budget)
+        self.queue.put_nowait(job)
+        self.jobs[job.id] = job
+        self._trim_jobs()
+        return job
+
+    def _trim_jobs(self) -> None:
+        while len(self.jobs) > self.max_retained_jobs:
+            oldest_id = next(iter(self.jobs))
+            if not self.jobs[oldest_id].done.is_set():
+                break
+            del self.jobs[oldest_id]
+
+    async def _worker(self) -> None:
+        while True:
+            job = await self.queue.get()
+            job.status = "analyzing"
+
+            def on_analysis(dream_data: DreamSchema) -> None:
+                # Expose the analysis while the image is still rendering
+                job.result = dream_data.model_dump()
+                job.status = "rendering"
+
+            def on_preview(path: Optional[str]) -> None:
+                # None once the final image has replaced the (deleted) preview
+                job.preview_path = path
+
+            try:
+                job.result = await self.pipeline.aanalyze_dream(
+                    job.dream, on_analysis=on_analysis, user_tier=job.user_tier,
+                    latency_budget=job.latency_budget, queue_depth=self.queue.qsize(),
+                    on_preview=on_preview if self.pipeline.preview_steps > 0 else None)
+                job.status = "done"
+            except Exception as e:
+                job.error = str(e)
+                job.status = "failed"
+                metrics.inc("server_jobs_failed_total")
+            finally:
+                job.preview_path = None
+                job.finished_at = time.time()
+                job.done.set()
+                self.queue.task_done()
+
+    async def start(self, app: web.Application = None) -> None:
+        self._tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+
+    async def stop(self, app: web.Application = None) -> None:
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        if self.pipeline.batcher:
+            self.pipeline.batcher.close()
+        await self.pipeline.llm_client.transport.aclose()
+        if self.pipeline.store:
+            self.pipeline.store.close()
+        if self.pipeline.image_processor:
+            self.pipeline.image_processor.close()
+
+
+def create_app(service: DreamService, registry: Optional[MetricsRegistry] = None) -> web.Application:
+    """Build the aiohttp application for a service."""
+    routes = web.RouteTableDef()
+
+    @routes.post("/dreams")
+    async def submit_dream(request: web.Request) -> web.Response:
+        try:
+            dream = DreamSchema.model_validate_json(await request.read())
+        except ValidationError as e:
+            return web.json_response({"error": "invalid dream", "details": e.errors(include_url=False)},
+                                     status=400)
+        try:
+            budget = float(request.query["budget"]) if "budget" in request.query else None
+            timeout = float(request.query.get("timeout", 120))
+        except ValueError:
+            return web.json_response({"error": "budget and timeout must be numbers of seconds"}, status=400)
+        try:
+            job = service.submit(dream, user_tier=request.query.get("tier"), latency_budget=budget)
+        except asyncio.QueueFull:
+            # Backpressure: tell the client to come back instead of queueing without bound
+            metrics.inc("server_rejected_total")
+            return web.json_response({"error": "queue full"}, status=503, headers={"Retry-After": "5"})
+
+        if request.query.get("wait"):
+            try:
+                await asyncio.wait_for(job.done.wait(), timeout=timeout)
+            except asyncio.TimeoutError:
+                pass
+            return web.json_response(job.to_dict(), status=200 if job.done.is_set() else 202)
+        return web.json_response(job.to_dict(), status=202, headers={"Location": f"/dreams/{job.id}"})
+
+    @routes.get("/dreams/{job_id}")
+    async def get_job(request: web.Request) -> web.Response:
+        job = service.jobs.get(request.match_info["job_id"])
+        if job is None:
+            return web.json_response({"error": "unknown job"}, status=404)
+        return web.json_response(job.to_dict())
+
+    @routes.get("/images/{name}")
+    async def get_image(request: web.Request) -> web.StreamResponse:
+        name = os.path.basename(request.match_info["name"])
+        store = service.pipeline.store
+        path = os.path.join(service.pipeline.output_dir, name)
+        if store and not os.path.isfile(path):
+            # Content-addressed layout: images/<first two hash digits>/<hash>.png;
+            # previews stay in the output directory until the final image replaces them
+            path = os.path.join(store.image_dir, name[:2], name)
+        if not os.path.isfile(path):
+            return web.json_response({"error": "unknown image"}, status=404)
+        return web.FileResponse(path)
+
+    @routes.get("/analytics")
+    async def get_analytics(request: web.Request) -> web.Response:
+        analytics = service.pipeline.analytics
+        if analytics is None:
+            return web.json_response({"error": "analytics are disabled"}, status=404)
+        try:
+            days = int(request.query.get("days", 30))
+            top = int(request.query.get("top", 10))
+        except ValueError:
+            return web.json_response({"error": "days and top must be integers"}, status=400)
+        return web.json_response(analytics.summary(request.query.get("user"), days=days, k=top))
+
+    @routes.get("/symbols")
+    async def get_symbols(request: web.Request) -> web.Response:
+        if service.pipeline.symbol_index is None:
+            return web.json_response({"error": "the symbol index is disabled"}, status=404)
+        symbols = [symbol.strip() for symbol in request.query.get("q", "").split(",") if symbol.strip()]
+        if not symbols:
+            return web.json_response({"error": "q must list one or more symbols"}, status=400)
+        entries = service.pipeline.symbol_index.interpret(symbols)
+        return web.json_response({"symbols": {symbol: entry._asdict() if entry else None
+                                              for symbol, entry in entries.items()}})
+
+    @routes.get("/metrics")
+    async def get_metrics(request: web.Request) -> web.Response:
+        return web.Response(text=registry.to_prometheus() if registry else "", content_type="text/plain")
+
+    @routes.get("/healthz")
+    async def healthz(request: web.Request) -> web.Response:
+        return web.json_response({"queued": service.queue.qsize(), "workers": service.workers})
+
+    app = web.Application(client_max_size=1024 * 1024)
+    app.add_routes(routes)
+    app.on_startup.append(service.start)
+    app.on_cleanup.append(service.stop)
+    return app
+
+
+def main():
+    """Entry point for the HTTP service"""
+
+    parser = argparse.ArgumentParser(description="Dream Analysis HTTP Service")
+    parser.add_argument("--host", type=str, default="127.0.0.1", help="Interface to listen on")
+    parser.add_argument("--port", type=int, default=8080, help="Port to listen on")
+    parser.add_argument("--workers", type=int, default=8,
+                        help="Number of dreams processed concurrently")
+    parser.add_argument("--queue-size", type=int, default=128,
+                        help="Maximum queued dreams before new submissions get 503")
+    parser.add_argument("--model", type=str,
+                        default="accounts/fireworks/models/llama-v3p3-70b-instruct",
+                        help="LLM model to use for analysis")
+    parser.add_argument("--temperature", type=float, default=0.6,
+                        help="Temperature for LLM generation (0.0-1.0)")
+    parser.add_argument("--output", type=str, default="dream_results",
+                        help="Directory holding the dream store and generated images")
+    parser.add_argument("--image-format", type=str, default="webp", choices=["webp", "avif", "jpeg", "png"],
+                        help="Format generated images are stored in")
+    parser.add_argument("--image-quality", type=int, default=80,
+                        help="Encoder quality (1-100) for webp, avif and jpeg images")
+    parser.add_argument("--thumbnails", type=thumbnail_sizes, default="512,256,128",
+                        help="Comma-separated thumbnail sizes in pixels for the web UI")
+    parser.add_argument("--preview-steps", type=int, default=6,
+                        help="Diffusion steps of the preview shown before the final image (0 disables previews)")
+    parser.add_argument("--routing", action="store_true",
+                        help="Route each dream to a model and image quality by tier, budget and load")
+    parser.add_argument("--batch-size", type=int, default=0,
+                        help="Most analyses sent as one upstream request (0 disables micro-batching)")
+    parser.add_argument("--batch-wait", type=float, default=20,
+                        help="Milliseconds an analysis waits for others to batch with")
+    parser.add_argument("--analytics", action="store_true",
+                        help="Keep emotion, intensity and symbol aggregates for GET /analytics (requires NumPy)")
+    parser.add_argument("--symbols", type=str, default=None,
+                        help="Symbol index built with `python -m modules.symbols build` (e.g. dream_results/symbols.json)")
+    args = parser.parse_args()
+    if args.symbols and not os.path.exists(args.symbols):
+        parser.error(f"--symbols: no symbol index at {args.symbols}")
+
+    registry = metrics.add_sink(MetricsRegistry())
+    store = DreamStore(args.output)
+    analytics = None
+    if args.analytics:
+        # NumPy is only needed (and imported) when analytics are enabled
+        from .analytics import DreamAnalytics
+        analytics = DreamAnalytics().rebuild(store)
+    symbol_index = None
+    if args.symbols:
+        from .symbols import SymbolIndex
+        symbol_index = SymbolIndex().load(args.symbols, missing_ok=False)
+    llm_client = LLMClient(model=args.model, temperature=args.temperature)
+    image_processor = ImageProcessor(format=args.image_format, quality=args.image_quality,
+                                     thumbnail_sizes=args.thumbnails)
+    pipeline = DreamAnalysisPipeline(llm_client=llm_client, output_dir=args.output,
+                                     store=store, image_processor=image_processor, analytics=analytics,
+                                     router=RoutingPolicy() if args.routing else None,
+                                     preview_steps=args.preview_steps, symbol_index=symbol_index,
+                                     batcher=MicroBatcher(max_batch_size=args.batch_size,
+                                                          max_wait=args.batch_wait / 1000)
+                                     if args.batch_size > 0 else None)
+
+    async def build() -> web.Application:
+        # The queue must be created inside the running event loop
+        service = DreamService(pipeline, workers=args.workers, queue_size=args.queue_size)
+        return create_app(service, registry)
+
+    web.run_app(build(), host=args.host, port=args.port)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,197 @@
+"""
+Small stage graph (DAG) executor for the dream pipeline.
+
+Each stage is a function that receives a StageContext and returns its output.
+A stage starts as soon as every output it requires is available. Besides its
+return value, a stage may publish additional outputs early, which lets
+downstream stages start before the producing stage has finished (for example,
+image generation can start once the image prompt has streamed in, while the
+rest of the analysis is still being generated).
+"""
+
+import time
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, Callable, Dict, Iterable, List, NamedTuple
+
+
+class StageTiming(NamedTuple):
+    """Timing of one stage, in seconds relative to the start of the graph run."""
+    start: float
+    duration: float
+    waited: float
+
+
+class StageResult(NamedTuple):
+    """Outputs and timings of a completed graph run."""
+    outputs: Dict[str, Any]
+    errors: Dict[str, BaseException]
+    timings: Dict[str, StageTiming]
+    wall_time: float
+
+
+class StageContext:
+    """Handle passed to each stage for reading inputs and publishing early outputs."""
+
+    def __init__(self, futures: Dict[str, Future]):
+        self._futures = futures
+
+    def get(self, name: str) -> Any:
+        """Return the value of an output, waiting for it if necessary."""
+        return self._futures[name].result()
+
+    def publish(self, name: str, value: Any) -> None:
+        """Make an output available before the stage finishes. Later publishes are ignored."""
+        future = self._futures[name]
+        if not future.done():
+            try:
+                future.set_result(value)
+            except Exception:
+                # Another thread resolved it first
+                pass
+
+
+class _Stage(NamedTuple):
+    name: str
+    func: Callable[[StageContext], Any]
+    requires: List[str]
+    provides: List[str]
+
+
+class StageGraph:
+    """
+    A set of stages connected by the outputs they require and provide.
+
+    Example:
+        graph = StageGraph()
+        graph.add_stage("analysis", analyze, provides=["image_prompt"])
+        graph.add_stage("image", render, requires=["image_prompt"])
+        graph.add_stage("save", save, requires=["analysis"])
+        result = graph.run()
+    """
+
+    def __init__(self):
+        self._stages: Dict[str, _Stage] = {}
+        self._outputs: List[str] = []
+
+    def add_stage(self, name: str, func: Callable[[StageContext], Any],
+                  requires: Iterable[str] = (), provides: Iterable[str] = ()) -> "StageGraph":
+        """
+        Register a stage.
+
+        Args:
+            name: Stage name; the stage's return value is published under this name
+            func: Function run with a StageContext once all requirements are available
+            requires: Output names that must be available before the stage starts
+            provides: Extra output names the stage publishes via StageContext.publish
+
+        Returns:
+            The graph, to allow chaining
+        """
+        if name in self._stages:
+            raise ValueError(f"Stage '{name}' is already defined")
+        stage = _Stage(name, func, list(requires), list(provides))
+        for output in [name] + stage.provides:
+            if output in self._outputs:
+                raise ValueError(f"Output '{output}' is provided by more than one stage")
+            self._outputs.append(output)
+        self._stages[name] = stage
+        return self
+
+    def _validate(self) -> None:
+        for stage in self._stages.values():
+            missing = [r for r in stage.requires if r not in self._outputs]
+            if missing:
+                raise ValueError(f"Stage '{stage.name}' requires unknown outputs: {missing}")
+
+        # Detect cycles with a depth-first search over stage dependencies
+        producer = {}
+        for stage in self._stages.values():
+            for output in [stage.name] + stage.provides:
+                producer[output] = stage.name
+        visiting, visited = set(), set()
+
+        def visit(name: str) -> None:
+            if name in visited:
+                return
+            if name in visiting:
+                raise ValueError(f"Stage graph has a cycle through '{name}'")
+            visiting.add(name)
+            for required in self._stages[name].requires:
+                if producer[required] != name:
+                    visit(producer[required])
+            visiting.discard(name)
+            visited.add(name)
+
+        for name in self._stages:
+            visit(name)
+
+    def run(self) -> StageResult:
+        """
+        Run every stage, each on its own worker thread, and wait for all of them.
+
+        A stage whose requirement failed is not run; it fails with the same error.
+
+        Returns:
+            Outputs, per-stage errors and per-stage timings
+        """
+        self._validate()
+        futures = {output: Future() for output in self._outputs}
+        context = StageContext(futures)
+        timings: Dict[str, StageTiming] = {}
+        errors: Dict[str, BaseException] = {}
+        lock = threading.Lock()
+        graph_start = time.perf_counter()
+
+        def run_stage(stage: _Stage) -> None:
+            wait_start = time.perf_counter()
+            try:
+                for required in stage.requires:
+                    futures[required].result()
+                start = time.perf_counter()
+                try:
+                    value = stage.func(context)
+                finally:
+                    end = time.perf_counter()
+                    with lock:
+                        timings[stage.name] = StageTiming(
+                            start=start - graph_start,
+                            duration=end - start,
+                            waited=start - wait_start,
+                        )
+                futures[stage.name].set_result(value)
+                for output in stage.provides:
+                    if not futures[output].done():
+                        futures[output].set_exception(
+                            RuntimeError(f"Stage '{stage.name}' finished without publishing '{output}'")
+                        )
+            except BaseException as e:
+                with lock:
+                    errors[stage.name] = e
+                for output in [stage.name] + stage.provides:
+                    if not futures[output].done():
+                        futures[output].set_exception(e)
+
+        # One thread per stage: stages block while waiting for inputs, so the
+        # pool must be large enough that a waiting stage never starves a producer
+        with ThreadPoolExecutor(max_workers=max(1, len(self._stages))) as executor:
+            for stage in self._stages.values():
+                executor.submit(run_stage, stage)
+
+        outputs = {
+            name: future.result()
+            for name, future in futures.items()
+            if future.done() and future.exception() is None
+        }
+        return StageResult(outputs, errors, timings, time.perf_counter() - graph_start)
+
+
+def format_timings(result: StageResult) -> str:
+    """Render stage timings as a short human-readable table."""
+    lines = [f"Total: {result.wall_time * 1000:.0f} ms"]
+    for name, timing in sorted(result.timings.items(), key=lambda item: item[1].start):
+        lines.append(
+            f"  {name:<14} start {timing.start * 1000:7.0f} ms   "
+            f"took {timing.duration * 1000:7.0f} ms"
+        )
+    return "\n".join(lines)
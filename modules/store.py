@@ -0,0 +1,354 @@
+"""
+Durable archive of analyzed dreams.
+
+Every dream gets its own time-ordered ID and row in a SQLite database instead of
+overwriting a single JSON file. Writes from any number of threads are funnelled
+through one writer thread that commits them in batches, so a burst of pipeline
+workers shares a single fsync. WAL mode lets readers run alongside the writer
+(and alongside writers in other processes).
+
+Secondary indexes cover the fields dreams are looked up by: primary emotion,
+intensity, symbols and creation date. Images are moved to content-addressed
+paths (images/<hash prefix>/<sha256>.png), so concurrent renders never collide
+and identical images are stored once.
+
+Example:
+    store = DreamStore("dream_results")
+    dream_id = store.save(dream_data)
+    recent_fear = store.find(emotion="fear", min_intensity=4, limit=20)
+"""
+
+import os
+import json
+import time
+import queue
+import hashlib
+import secrets
+import sqlite3
+import threading
+from concurrent.futures import Future
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+_SCHEMA = (
+    "CREATE TABLE IF NOT EXISTS dreams ("
+    "id TEXT PRIMARY KEY, created_at REAL NOT NULL, updated_at REAL NOT NULL, "
+    "emotion TEXT NOT NULL, intensity INTEGER NOT NULL, image_path TEXT NOT NULL, "
+    "data TEXT NOT NULL)",
+    "CREATE TABLE IF NOT EXISTS dream_symbols ("
+    "symbol TEXT NOT NULL, created_at REAL NOT NULL, dream_id TEXT NOT NULL, "
+    "PRIMARY KEY (symbol, created_at, dream_id)) WITHOUT ROWID",
+    "CREATE INDEX IF NOT EXISTS dreams_emotion ON dreams(emotion, created_at)",
+    "CREATE INDEX IF NOT EXISTS dreams_intensity ON dreams(intensity, created_at)",
+    "CREATE INDEX IF NOT EXISTS dreams_created ON dreams(created_at)",
+    "CREATE INDEX IF NOT EXISTS dream_symbols_dream ON dream_symbols(dream_id)",
+)
+
+_STOP = object()
+
+
+def new_dream_id() -> str:
+    """
+    Return a unique, time-ordered dream ID: 12 hex digits of milliseconds since
+    the epoch followed by 12 random hex digits.
+    """
+    return f"{int(time.time() * 1000):012x}{secrets.token_hex(6)}"
+
+
+def _normalize(value: str) -> str:
+    return " ".join(str(value).lower().split())
+
+
+def _as_dict(dream: Any) -> Dict[str, Any]:
+    return dream.model_dump() if hasattr(dream, "model_dump") else dict(dream)
+
+
+class DreamStore:
+    """SQLite-backed dream archive with batched, durable writes and indexed lookups."""
+
+    def __init__(self, root: str = "dream_results", db_name: str = "dreams.db",
+                 max_batch: int = 256, flush_interval: float = 0.01):
+        """
+        Args:
+            root: Directory holding the database and the images/ tree
+            db_name: File name of the SQLite database inside root
+            max_batch: Maximum number of writes committed in one transaction
+            flush_interval: Seconds the writer waits for more writes before committing a batch
+        """
+        self.root = root
+        self.path = os.path.join(root, db_name)
+        self.image_dir = os.path.join(root, "images")
+        self.max_batch = max_batch
+        self.flush_interval = flush_interval
+        os.makedirs(self.image_dir, exist_ok=True)
+
+        conn = self._connect()
+        for statement in _SCHEMA:
+            conn.execute(statement)
+        conn.commit()
+        conn.close()
+
+        self._local = threading.local()
+        self._queue: "queue.Queue" = queue.Queue()
+        self._writer = threading.Thread(target=self._write_loop, name="DreamStoreWriter", daemon=True)
+        self._writer.start()
+        self._closed = False
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.path, timeout=30, check_same_thread=False)
+        conn.execute("PRAGMA journal_mode=WAL")
+        # FULL makes every commit durable; batching keeps the number of fsyncs low
+        conn.execute("PRAGMA synchronous=FULL")
+        return conn
+
+    def _reader(self) -> sqlite3.Connection:
+        """Per-thread read connection, so lookups never wait on each other or the writer."""
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = self._local.conn = self._connect()
+        return conn
+
+    # Writes
+
+    def save(self, dream: Any, dream_id: Optional[str] = None, wait: bool = True) -> str:
+        """
+        Insert a dream, or update it if ``dream_id`` is already stored.
+
+        Args:
+            dream: DreamSchema (or a dict with the same fields)
+            dream_id: ID to write under (a new one is generated if omitted)
+            wait: Block until the write is committed to disk
+
+        Returns:
+            The dream ID
+        """
+        if self._closed:
+            raise RuntimeError("DreamStore is closed")
+        dream_id = dream_id or new_dream_id()
+        future: Future = Future()
+        self._queue.put((dream_id, _as_dict(dream), time.time(), future))
+        if wait:
+            future.result()
+        return dream_id
+
+    def flush(self) -> None:
+        """Block until every write queued so far is committed."""
+        future: Future = Future()
+        self._queue.put((None, None, None, future))
+        future.result()
+
+    def _write_loop(self) -> None:
+        conn = self._connect()
+        while True:
+            item = self._queue.get()
+            if item is _STOP:
+                break
+            batch = [item]
+            # Collect whatever else arrives within the flush interval into the same transaction
+            deadline = time.monotonic() + self.flush_interval
+            stop = False
+            while len(batch) < self.max_batch:
+                timeout = deadline - time.monotonic()
+                try:
+                    item = self._queue.get(timeout=timeout) if timeout > 0 else self._queue.get_nowait()
+                except queue.Empty:
+                    break
+                if item is _STOP:
+                    stop = True
+                    break
+                batch.append(item)
+            self._commit(conn, batch)
+            if stop:
+                break
+        conn.close()
+
+    def _commit(self, conn: sqlite3.Connection, batch: List[Tuple]) -> None:
+        writes = [item for item in batch if item[0] is not None]
+        try:
+            with conn:
+                for dream_id, data, now, _ in writes:
+                    conn.execute(
+                        "INSERT INTO dreams (id, created_at, updated_at, emotion, intensity, image_path, data) "
+                        "VALUES (?, ?, ?, ?, ?, ?, ?) "
+                        "ON CONFLICT(id) DO UPDATE SET updated_at = excluded.updated_at, "
+                        "emotion = excluded.emotion, intensity = excluded.intensity, "
+                        "image_path = excluded.image_path, data = excluded.data",
+                        (dream_id, now, now, _normalize(data.get("primaryEmotion", "")),
+                         int(data.get("emotionalIntensity") or 0), data.get("imagePath", ""),
+                         json.dumps(data)),
+                    )
+                    created_at = conn.execute("SELECT created_at FROM dreams WHERE id = ?",
+                                              (dream_id,)).fetchone()[0]
+                    conn.execute("DELETE FROM dream_symbols WHERE dream_id = ?", (dream_id,))
+                    conn.executemany(
+                        "INSERT OR IGNORE INTO dream_symbols (symbol, created_at, dream_id) VALUES (?, ?, ?)",
+                        [(symbol, created_at, dream_id)
+                         for symbol in {_normalize(s) for s in data.get("mainSymbols", [])} if symbol],
+                    )
+        except Exception as e:
+            for *_, future in batch:
+                future.set_exception(e)
+        else:
+            for *_, future in batch:
+                future.set_result(None)
+
+    # Images
+
+    def store_image(self, path: str) -> str:
+        """
+        Move an image to its content-addressed location and return the new path.
+
+        If an identical image is already stored, the new file is discarded.
+        """
+        digest = hashlib.sha256()
+        with open(path, "rb") as f:
+            for chunk in iter(lambda: f.read(1024 * 1024), b""):
+                digest.update(chunk)
+        name = digest.hexdigest()
+        extension = os.path.splitext(path)[1] or ".png"
+        directory = os.path.join(self.image_dir, name[:2])
+        os.makedirs(directory, exist_ok=True)
+        target = os.path.join(directory, name + extension)
+        if os.path.exists(target):
+            os.remove(path)
+        else:
+            # Atomic on the same filesystem, so readers never see a partial file
+            os.replace(path, target)
+        return target
+
+    # Reads
+
+    def get(self, dream_id: str) -> Optional[Dict[str, Any]]:
+        """Return a stored dream, or None if the ID is unknown."""
+        row = self._reader().execute("SELECT data FROM dreams WHERE id = ?", (dream_id,)).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def _where(self, emotion: Optional[str], symbol: Optional[str], min_intensity: Optional[int],
+               max_intensity: Optional[int], since: Optional[float], until: Optional[float],
+               before: Optional[str] = None) -> Tuple[str, List[Any]]:
+        # The symbol table carries created_at so date ranges stay on its primary key
+        table = "dream_symbols s JOIN dreams d ON d.id = s.dream_id" if symbol else "dreams d"
+        created = "s.created_at" if symbol else "d.created_at"
+        clauses, params = [], []
+        if symbol:
+            clauses.append("s.symbol = ?")
+            params.append(_normalize(symbol))
+        if emotion:
+            clauses.append("d.emotion = ?")
+            params.append(_normalize(emotion))
+        if min_intensity is not None:
+            clauses.append("d.intensity >= ?")
+            params.append(min_intensity)
+        if max_intensity is not None:
+            clauses.append("d.intensity <= ?")
+            params.append(max_intensity)
+        if since is not None:
+            clauses.append(f"{created} >= ?")
+            params.append(since)
+        if until is not None:
+            clauses.append(f"{created} < ?")
+            params.append(until)
+        if before is not None:
+            clauses.append(f"({created}, d.id) < (SELECT created_at, id FROM dreams WHERE id = ?)")
+            params.append(before)
+        where = f" WHERE {' AND '.join(clauses)}" if clauses else ""
+        return f"FROM {table}{where}", params
+
+    def find(self, emotion: Optional[str] = None, symbol: Optional[str] = None,
+             min_intensity: Optional[int] = None, max_intensity: Optional[int] = None,
+             since: Optional[float] = None, until: Optional[float] = None,
+             limit: int = 100, before: Optional[str] = None) -> List[Dict[str, Any]]:
+        """
+        Return stored dreams matching every given filter, newest first.
+
+        Args:
+            emotion: Primary emotion (case-insensitive)
+            symbol: A symbol that must appear in mainSymbols (case-insensitive)
+            min_intensity: Lowest emotional intensity
+            max_intensity: Highest emotional intensity
+            since: Earliest creation time (Unix timestamp, inclusive)
+            until: Latest creation time (Unix timestamp, exclusive)
+            limit: Maximum number of dreams returned
+            before: ID of the last dream of the previous page, for keyset pagination
+
+        Returns:
+            Dream dicts, each with its ``id`` and ``createdAt`` added
+        """
+        source, params = self._where(emotion, symbol, min_intensity, max_intensity, since, until, before)
+        created = "s.created_at" if symbol else "d.created_at"
+        rows = self._reader().execute(
+            f"SELECT d.id, d.created_at, d.data {source} ORDER BY {created} DESC, d.id DESC LIMIT ?",
+            params + [limit],
+        ).fetchall()
+        results = []
+        for dream_id, created_at, data in rows:
+            dream = json.loads(data)
+            dream["id"] = dream_id
+            dream["createdAt"] = created_at
+            results.append(dream)
+        return results
+
+    def count(self, emotion: Optional[str] = None, symbol: Optional[str] = None,
+              min_intensity: Optional[int] = None, max_intensity: Optional[int] = None,
+              since: Optional[float] = None, until: Optional[float] = None) -> int:
+        """Return the number of stored dreams matching the filters (see find)."""
+        source, params = self._where(emotion, symbol, min_intensity, max_intensity, since, until)
+        return self._reader().execute(f"SELECT COUNT(*) {source}", params).fetchone()[0]
+
+    def symbol_counts(self, limit: Optional[int] = None, min_count: int = 1) -> List[Tuple[str, int]]:
+        """Return (symbol, dreams) pairs for the most common normalized symbols, most common first."""
+        return self._reader().execute(
+            "SELECT symbol, COUNT(*) AS dreams FROM dream_symbols GROUP BY symbol HAVING dreams >= ? "
+            "ORDER BY dreams DESC, symbol LIMIT ?",
+            (min_count, -1 if limit is None else limit),
+        ).fetchall()
+
+    def scan(self, chunk_size: int = 5000) -> Iterator[List[Tuple[float, str, int, str, List[str]]]]:
+        """
+        Read the indexed fields of every stored dream in creation order, one chunk at a time.
+
+        Args:
+            chunk_size: Dreams per chunk
+
+        Yields:
+            Lists of (created_at, emotion, intensity, userId, symbols) tuples, with the
+            emotion and symbols normalized as in the indexes
+        """
+        conn = self._reader()
+        after: Tuple[float, str] = (float("-inf"), "")
+        while True:
+            rows = conn.execute(
+                "SELECT id, created_at, emotion, intensity, COALESCE(json_extract(data, '$.userId'), '') "
+                "FROM dreams WHERE (created_at, id) > (?, ?) ORDER BY created_at, id LIMIT ?",
+                (*after, chunk_size),
+            ).fetchall()
+            if not rows:
+                return
+            last = (rows[-1][1], rows[-1][0])
+            symbols: Dict[str, List[str]] = {}
+            for dream_id, symbol in conn.execute(
+                "SELECT s.dream_id, s.symbol FROM dreams d JOIN dream_symbols s ON s.dream_id = d.id "
+                "WHERE (d.created_at, d.id) > (?, ?) AND (d.created_at, d.id) <= (?, ?)",
+                (*after, *last),
+            ):
+                symbols.setdefault(dream_id, []).append(symbol)
+            yield [(created_at, emotion, intensity, user_id, symbols.get(dream_id, []))
+                   for dream_id, created_at, emotion, intensity, user_id in rows]
+            after = last
+
+    def close(self) -> None:
+        """Commit pending writes and stop the writer thread."""
+        if self._closed:
+            return
+        self._closed = True
+        self._queue.put(_STOP)
+        self._writer.join()
+        conn = getattr(self._local, "conn", None)
+        if conn is not None:
+            conn.close()
+            self._local.conn = None
+
+    def __enter__(self) -> "DreamStore":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
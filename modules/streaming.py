@@ -0,0 +1,401 @@
+"""
+Streaming helpers for the LLM client.
+
+The model streams its JSON response a few characters at a time. PartialJSONParser
+turns that stream into per-field text deltas, so the analysis can be shown while
+the rest of the object is still being generated. repair_json salvages responses
+that were cut off or wrapped in extra text.
+"""
+
+import re
+import json
+from typing import Any, AsyncIterator, Callable, Dict, Iterable, Iterator, List, NamedTuple, Optional
+
+# Characters that end a run of plain string content
+_STRING_SPECIAL = re.compile(r'["\\]')
+# A complete high-surrogate escape must wait for its low-surrogate partner
+_HIGH_SURROGATE_TAIL = re.compile(r'\\u[dD][89abAB][0-9a-fA-F]{2}$')
+_DECODER = json.JSONDecoder(strict=False)
+
+# Parser states
+_BEFORE_OBJECT = 0
+_EXPECT_KEY = 1
+_IN_KEY = 2
+_EXPECT_COLON = 3
+_EXPECT_VALUE = 4
+_IN_STRING = 5
+_IN_RAW = 6
+_AFTER_VALUE = 7
+_DONE = 8
+
+
+# Markdown code fences some models wrap JSON in
+_FENCE_START = re.compile(r'^\s*```(?:json)?\s*', re.IGNORECASE)
+_FENCE_END = re.compile(r'\s*```\s*$')
+# An object member cut off before its value: the key, with or without the colon
+_DANGLING_KEY = re.compile(r'(?:,|(?<=\{))\s*"(?:[^"\\]|\\.)*"\s*:?\s*$')
+# A number cut off after its sign, decimal point or exponent marker
+_DANGLING_NUMBER_TAIL = re.compile(r'(?<=[\d\s:\[,])[-+.eE]+$')
+_LITERAL_PREFIX = re.compile(r'(?<![\w"])(t|tr|tru|f|fa|fal|fals|n|nu|nul)$')
+_LITERALS = {"t": "true", "f": "false", "n": "null"}
+_HEX_DIGITS = frozenset("0123456789abcdefABCDEF")
+
+
+def repair_json(text: str) -> str:
+    """
+    Best-effort repair of a malformed or truncated JSON object.
+
+    Strips Markdown fences and any text around the object, drops trailing commas
+    and closes an unterminated string, array or object, so a response cut off by
+    the token limit still yields the fields it completed. The result is not
+    guaranteed to be valid JSON; callers still parse it.
+    """
+    text = _FENCE_END.sub("", _FENCE_START.sub("", text))
+    start = text.find("{")
+    if start < 0:
+        return text
+    out: List[str] = []
+    closers: List[str] = []
+    in_string = False
+    escaped = False
+    # Where the last escape in the string starts, and the \\uXXXX hex digits still due
+    escape_at = 0
+    hex_left = 0
+    for c in text[start:]:
+        if in_string:
+            out.append(c)
+            if hex_left and c in _HEX_DIGITS:
+                hex_left -= 1
+                continue
+            hex_left = 0
+            if escaped:
+                escaped = False
+                if c == "u":
+                    hex_left = 4
+            elif c == '\\':
+                escaped = True
+                escape_at = len(out) - 1
+            elif c == '"':
+                in_string = False
+            continue
+        if c == '"':
+            in_string = True
+        elif c in "{[":
+            closers.append("}" if c == "{" else "]")
+        elif c in "}]":
+            _strip_trailing_comma(out)
+            if closers:
+                closers.pop()
+            out.append(c)
+            if not closers:
+                # Anything after the top-level object is commentary
+                break
+            continue
+        out.append(c)
+    if not closers:
+        return "".join(out)
+
+    if in_string:
+        if escaped or hex_left:
+            # A cut-off escape ("\\" or "\\u00") is not valid inside the closed string
+            del out[escape_at:]
+        out.append('"')
+    repaired = "".join(out).rstrip()
+    if closers[-1] == "}":
+        repaired = _DANGLING_KEY.sub("", repaired)
+    repaired = _LITERAL_PREFIX.sub(lambda m: _LITERALS[m.group(1)[0]], repaired)
+    repaired = _DANGLING_NUMBER_TAIL.sub("", repaired)
+    repaired = repaired.rstrip()
+    if repaired.endswith(","):
+        repaired = repaired[:-1]
+    elif repaired.endswith(":"):
+        # A value cut off entirely
+        repaired += "null"
+    return repaired + "".join(reversed(closers))
+
+
+def _strip_trailing_comma(out: List[str]) -> None:
+    i = len(out) - 1
+    while i >= 0 and out[i].isspace():
+        i -= 1
+    if i >= 0 and out[i] == ",":
+        del out[i]
+
+
+class FieldDelta(NamedTuple):
+    """A piece of a top-level field value as it arrives from the stream."""
+    field: str
+    text: str
+    done: bool
+
+
+def _safe_cut(raw: str) -> int:
+    """Return the length of the prefix of an escaped string that can be decoded now."""
+    n = len(raw)
+    k = raw.rfind('\\', max(0, n - 12))
+    if k < 0:
+        return n
+    start = k
+    while start > 0 and raw[start - 1] == '\\':
+        start -= 1
+    if (k - start + 1) % 2 == 0:
+        # The trailing backslash is itself escaped, so every escape is complete
+        cut = n
+    elif k + 1 >= n:
+        cut = k
+    elif raw[k + 1] == 'u' and n - k < 6:
+        cut = k
+    else:
+        cut = n
+    if _HIGH_SURROGATE_TAIL.search(raw, 0, cut):
+        cut -= 6
+    return cut
+
+
+class PartialJSONParser:
+    """
+    Incremental parser for a single top-level JSON object.
+
+    String fields are reported as text deltas while they stream in; other values
+    (numbers, booleans, arrays, nested objects) are reported once they are complete.
+    """
+
+    def __init__(self):
+        self.value: Dict[str, Any] = {}
+        self.completed = set()
+        self._state = _BEFORE_OBJECT
+        self._key = ""
+        self._key_raw: List[str] = []
+        self._pending = ""
+        self._in_escape = False
+        self._raw: List[str] = []
+        self._raw_depth = 0
+        self._raw_in_string = False
+        self._raw_escape = False
+
+    @property
+    def done(self) -> bool:
+        """True once the closing brace of the top-level object has been seen."""
+        return self._state == _DONE
+
+    def _consume_string(self, chunk: str, i: int):
+        """Consume string content starting at i. Returns (segment, next_index, closed)."""
+        n = len(chunk)
+        start = i
+        if self._in_escape:
+            if i >= n:
+                return "", n, False
+            i += 1
+            self._in_escape = False
+        while True:
+            match = _STRING_SPECIAL.search(chunk, i)
+            if match is None:
+                return chunk[start:], n, False
+            j = match.start()
+            if chunk[j] == '"':
+                return chunk[start:j], j + 1, True
+            if j + 1 < n:
+                i = j + 2
+            else:
+                self._in_escape = True
+                return chunk[start:], n, False
+
+    def _decode_pending(self, final: bool) -> str:
+        raw = self._pending
+        cut = len(raw) if final else _safe_cut(raw)
+        if cut <= 0:
+            return ""
+        self._pending = raw[cut:]
+        return _DECODER.decode('"' + raw[:cut] + '"')
+
+    def _finish_raw(self, deltas: List[FieldDelta]) -> None:
+        text = "".join(self._raw).strip()
+        self._raw = []
+        try:
+            self.value[self._key] = json.loads(text)
+        except ValueError:
+            self.value[self._key] = text
+        self.completed.add(self._key)
+        deltas.append(FieldDelta(self._key, text, True))
+
+    def feed(self, chunk: str) -> List[FieldDelta]:
+        """
+        Feed the next piece of the stream.
+
+        Args:
+            chunk: Raw text received from the model
+
+        Returns:
+            Deltas for every field that advanced in this chunk
+        """
+        deltas: List[FieldDelta] = []
+        i = 0
+        n = len(chunk)
+        while i < n:
+            state = self._state
+            if state == _IN_STRING:
+                segment, i, closed = self._consume_string(chunk, i)
+                self._pending += segment
+                text = self._decode_pending(final=closed)
+                if text:
+                    self.value[self._key] += text
+                if closed:
+                    self.completed.add(self._key)
+                    deltas.append(FieldDelta(self._key, text, True))
+                    self._state = _AFTER_VALUE
+                elif text:
+                    deltas.append(FieldDelta(self._key, text, False))
+                continue
+            if state == _IN_KEY:
+                segment, i, closed = self._consume_string(chunk, i)
+                self._key_raw.append(segment)
+                if closed:
+                    self._key = _DECODER.decode('"' + "".join(self._key_raw) + '"')
+                    self._state = _EXPECT_COLON
+                continue
+
+            c = chunk[i]
+            i += 1
+            if state == _BEFORE_OBJECT:
+                if c == '{':
+                    self._state = _EXPECT_KEY
+            elif state == _EXPECT_KEY:
+                if c == '"':
+                    self._key_raw = []
+                    self._state = _IN_KEY
+                elif c == '}':
+                    self._state = _DONE
+            elif state == _EXPECT_COLON:
+                if c == ':':
+                    self._state = _EXPECT_VALUE
+            elif state == _EXPECT_VALUE:
+                if c == '"':
+                    self.value[self._key] = ""
+                    self._pending = ""
+                    self._state = _IN_STRING
+                elif not c.isspace():
+                    self._raw = []
+                    self._raw_depth = 0
+                    self._raw_in_string = False
+                    self._raw_escape = False
+                    self._state = _IN_RAW
+                    # Re-process this character as the start of the raw value
+                    i -= 1
+            elif state == _IN_RAW:
+                if self._raw_in_string:
+                    if self._raw_escape:
+                        self._raw_escape = False
+                    elif c == '\\':
+                        self._raw_escape = True
+                    elif c == '"':
+                        self._raw_in_string = False
+                    self._raw.append(c)
+                elif c == '"':
+                    self._raw_in_string = True
+                    self._raw.append(c)
+                elif c in '[{':
+                    self._raw_depth += 1
+                    self._raw.append(c)
+                elif c in ']}':
+                    if self._raw_depth == 0:
+                        # Closing brace of the top-level object ends a scalar value
+                        self._finish_raw(deltas)
+                        self._state = _DONE
+                    else:
+                        self._raw_depth -= 1
+                        self._raw.append(c)
+                        if self._raw_depth == 0:
+                            self._finish_raw(deltas)
+                            self._state = _AFTER_VALUE
+                elif c == ',' and self._raw_depth == 0:
+                    self._finish_raw(deltas)
+                    self._state = _EXPECT_KEY
+                else:
+                    self._raw.append(c)
+            elif state == _AFTER_VALUE:
+                if c == ',':
+                    self._state = _EXPECT_KEY
+                elif c == '}':
+                    self._state = _DONE
+        return deltas
+
+
+class _StreamResult:
+    """Result of a structured stream: a validated model and/or a plain dictionary."""
+
+    def __init__(self, finalize: Callable[[str], Any], on_error: Callable[[Exception], Dict[str, Any]]):
+        self._finalize = finalize
+        self._on_error = on_error
+        self.parser = PartialJSONParser()
+        self.model: Any = None
+        self._result: Optional[Dict[str, Any]] = None
+
+    @property
+    def result(self) -> Optional[Dict[str, Any]]:
+        """The final dictionary; built from ``model`` on first access."""
+        if self._result is None and self.model is not None:
+            self._result = self.model.model_dump()
+        return self._result
+
+    def _finish(self, text: str) -> None:
+        value = self._finalize(text)
+        if isinstance(value, dict):
+            self._result = value
+        else:
+            self.model = value
+
+    def _fail(self, error: Exception) -> None:
+        self.model = None
+        self._result = self._on_error(error)
+
+
+class StructuredStream(_StreamResult):
+    """
+    Iterable of FieldDelta for a streamed structured response.
+
+    After iteration finishes, ``result`` holds the final parsed dictionary, or the
+    value produced by ``on_error`` if the stream failed part way through. When
+    ``finalize`` returns a Pydantic model rather than a dictionary, it is kept in
+    ``model`` and ``result`` is derived from it only if asked for.
+    """
+
+    def __init__(self, chunks: Iterable[str], finalize: Callable[[str], Any],
+                 on_error: Callable[[Exception], Dict[str, Any]]):
+        """
+        Args:
+            chunks: Raw text chunks from the model
+            finalize: Turns the full response text into the result dictionary or model
+            on_error: Produces the result dictionary when streaming fails
+        """
+        super().__init__(finalize, on_error)
+        self._chunks = chunks
+
+    def __iter__(self) -> Iterator[FieldDelta]:
+        received: List[str] = []
+        try:
+            for chunk in self._chunks:
+                received.append(chunk)
+                yield from self.parser.feed(chunk)
+            self._finish("".join(received))
+        except Exception as e:
+            self._fail(e)
+
+
+class AsyncStructuredStream(_StreamResult):
+    """Async twin of StructuredStream."""
+
+    def __init__(self, chunks: AsyncIterator[str], finalize: Callable[[str], Any],
+                 on_error: Callable[[Exception], Dict[str, Any]]):
+        super().__init__(finalize, on_error)
+        self._chunks = chunks
+
+    async def __aiter__(self) -> AsyncIterator[FieldDelta]:
+        received: List[str] = []
+        try:
+            async for chunk in self._chunks:
+                received.append(chunk)
+                for delta in self.parser.feed(chunk):
+                    yield delta
+            self._finish("".join(received))
+        except Exception as e:
+            self._fail(e)
@@ -0,0 +1,278 @@
+"""
+Symbol interpretation index.
+
+Most dreams share a small vocabulary of symbols (water, falling, teeth, a boss,
+being chased), and every analysis request would otherwise have the model
+interpret them from scratch. A SymbolIndex holds a short, general
+interpretation of each common symbol, built offline in bulk from the symbols
+in the dream store, and keyed by normalized name and synonyms so a lookup is a
+single dictionary access.
+
+The pipeline appends the cached meanings of a dream's known symbols to its
+analysis prompt, and questions about symbols alone ("what does water mean?")
+are answered from the index without an LLM call.
+
+Example:
+    python -m modules.symbols build --output dream_results --limit 500
+    python -m modules.symbols lookup water "falling down"
+
+    index = SymbolIndex().load("dream_results/symbols.json")
+    pipeline = DreamAnalysisPipeline(symbol_index=index)
+"""
+
+import os
+import re
+import json
+import argparse
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Iterable, Iterator, List, NamedTuple, Optional, Sequence, Tuple, TYPE_CHECKING
+
+from pydantic import BaseModel, Field
+
+from .metrics import Metrics, metrics as default_metrics
+from .prompts import SYMBOL_INTERPRETATION_SYSTEM_PROMPT
+
+if TYPE_CHECKING:
+    from .llm_client import LLMClient
+    from .store import DreamStore
+
+DEFAULT_INDEX_NAME = "symbols.json"
+
+# Leading words that do not change which symbol is meant ("my teeth", "a snake")
+_FILLER_WORDS = {"a", "an", "the", "my", "your", "his", "her", "their", "our", "some"}
+_NON_WORD = re.compile(r"[^\w\s]+")
+
+
+def symbol_key(symbol: str) -> str:
+    """Normalize a symbol for lookup: lowercase, no punctuation, no leading articles or possessives."""
+    words = _NON_WORD.sub(" ", str(symbol).lower()).split()
+    while len(words) > 1 and words[0] in _FILLER_WORDS:
+        words.pop(0)
+    return " ".join(words)
+
+
+class SymbolInterpretation(BaseModel):
+    """Schema for one symbol's entry, as produced when building the index."""
+    symbol: str = Field(description="Canonical name of the symbol, singular and lowercase")
+    synonyms: List[str] = Field(default_factory=list,
+                                description="Other words or short phrases dreamers use for the same symbol")
+    interpretation: str = Field(description="One or two sentences on the symbol's common meanings in dreams")
+
+
+class SymbolEntry(NamedTuple):
+    """An indexed symbol and its cached interpretation."""
+    symbol: str
+    interpretation: str
+    synonyms: Tuple[str, ...] = ()
+
+
+class SymbolIndex:
+    """Cached interpretations of common dream symbols, looked up by normalized name or synonym."""
+
+    def __init__(self, metrics: Optional[Metrics] = None):
+        """
+        Args:
+            metrics: Instrumentation front end (defaults to the process-wide one)
+        """
+        self.metrics = metrics or default_metrics
+        self._entries: Dict[str, SymbolEntry] = {}
+        # Normalized symbol or synonym -> key of its entry
+        self._keys: Dict[str, str] = {}
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def __iter__(self) -> Iterator[SymbolEntry]:
+        return iter(list(self._entries.values()))
+
+    def __contains__(self, symbol: str) -> bool:
+        return self._find(symbol) is not None
+
+    def add(self, symbol: str, interpretation: str, synonyms: Iterable[str] = ()) -> SymbolEntry:
+        """
+        Add or replace a symbol's entry.
+
+        A synonym already claimed by another symbol keeps pointing at that symbol.
+        """
+        key = symbol_key(symbol)
+        if not key:
+            raise ValueError(f"Symbol {symbol!r} has no name left after normalization")
+        synonym_keys = [k for k in dict.fromkeys(symbol_key(s) for s in synonyms) if k and k != key]
+        entry = SymbolEntry(key, " ".join(interpretation.split()), tuple(synonym_keys))
+        with self._lock:
+            self._entries[key] = entry
+            self._keys[key] = key
+            for synonym in synonym_keys:
+                self._keys.setdefault(synonym, key)
+        return entry
+
+    def _find(self, symbol: str) -> Optional[SymbolEntry]:
+        # No suffix stripping ("news" is not "new", "glasses" are not "glass"): singular
+        # and plural forms are synonyms the model gave when the entry was built
+        found = self._keys.get(symbol_key(symbol))
+        return None if found is None else self._entries[found]
+
+    def lookup(self, symbol: str) -> Optional[SymbolEntry]:
+        """Return the entry for a symbol, matched by name or synonym, or None if it is not indexed."""
+        entry = self._find(symbol)
+        self.metrics.inc("symbol_index_lookups_total", result="miss" if entry is None else "hit")
+        return entry
+
+    def meanings(self, symbols: Sequence[str], limit: Optional[int] = None) -> Dict[str, str]:
+        """
+        Cached interpretations of the indexed symbols among ``symbols``, for an analysis prompt.
+
+        Keyed by the symbol as the dreamer wrote it, in the dreamer's order, with
+        symbols sharing an entry listed once.
+
+        Args:
+            symbols: The dream's main symbols
+            limit: Most symbols to include (None for all)
+        """
+        meanings: Dict[str, str] = {}
+        seen = set()
+        for symbol in symbols:
+            if limit is not None and len(meanings) >= limit:
+                break
+            entry = self.lookup(symbol)
+            if entry is not None and entry.symbol not in seen:
+                seen.add(entry.symbol)
+                meanings[symbol.strip()] = entry.interpretation
+        return meanings
+
+    def interpret(self, symbols: Sequence[str]) -> Dict[str, Optional[SymbolEntry]]:
+        """Answer a symbol-only question from the index: each symbol's entry, or None if it is unknown."""
+        return {symbol: self.lookup(symbol) for symbol in symbols}
+
+    def missing(self, symbols: Iterable[str]) -> List[str]:
+        """The symbols (deduplicated, in order) that have no entry yet."""
+        keys = dict.fromkeys(symbol_key(s) for s in symbols)
+        return [key for key in keys if key and self._find(key) is None]
+
+    def save(self, path: str) -> None:
+        """Write the entries to ``path`` as JSON (atomically replaced)."""
+        entries = [{"symbol": e.symbol, "synonyms": list(e.synonyms), "interpretation": e.interpretation}
+                   for e in sorted(self, key=lambda e: e.symbol)]
+        temp_path = f"{path}.tmp"
+        with open(temp_path, "w", encoding="utf-8") as f:
+            json.dump({"symbols": entries}, f, indent=1, ensure_ascii=False)
+        os.replace(temp_path, path)
+
+    def load(self, path: str, missing_ok: bool = True) -> "SymbolIndex":
+        """
+        Add the entries saved at ``path``.
+
+        A missing file is ignored, unless ``missing_ok`` is False (for a path the
+        user gave explicitly), in which case FileNotFoundError is raised.
+        """
+        if not os.path.exists(path):
+            if not missing_ok:
+                raise FileNotFoundError(f"Symbol index not found: {path}")
+            return self
+        with open(path, encoding="utf-8") as f:
+            data = json.load(f)
+        for entry in data.get("symbols", []):
+            self.add(entry["symbol"], entry["interpretation"], entry.get("synonyms", ()))
+        return self
+
+
+def build_symbol_index(llm_client: "LLMClient", symbols: Iterable[str], index: Optional[SymbolIndex] = None,
+                       batch_size: int = 16, concurrency: int = 4) -> SymbolIndex:
+    """
+    Interpret every symbol not yet in the index and add it.
+
+    Symbols are sent ``batch_size`` to a request (LLMClient.generate_structured_batch),
+    with ``concurrency`` requests in flight. Symbols the model could not interpret
+    are left out, so running the build again retries them.
+
+    Args:
+        llm_client: Client the interpretations are generated with
+        symbols: Symbols to cover, most important first
+        index: Index to extend (defaults to a new one)
+        batch_size: Symbols interpreted per request
+        concurrency: Requests in flight at once
+
+    Returns:
+        The extended index
+    """
+    index = index if index is not None else SymbolIndex()
+    missing = index.missing(symbols)
+    batches = [missing[i:i + batch_size] for i in range(0, len(missing), batch_size)]
+
+    def interpret(batch: List[str]) -> List[SymbolInterpretation]:
+        return llm_client.generate_structured_batch([f"Symbol: {symbol}" for symbol in batch],
+                                                    SymbolInterpretation,
+                                                    system=SYMBOL_INTERPRETATION_SYSTEM_PROMPT)
+
+    with ThreadPoolExecutor(max_workers=max(1, concurrency)) as executor:
+        for batch, results in zip(batches, executor.map(interpret, batches)):
+            for requested, result in zip(batch, results):
+                # Failed items come back with empty fields
+                interpretation = getattr(result, "interpretation", "")
+                if not interpretation:
+                    continue
+                # The entry is stored under the name the dreams use, the model's name becomes a synonym
+                index.add(requested, interpretation, [getattr(result, "symbol", ""), *getattr(result, "synonyms", [])])
+    return index
+
+
+def frequent_symbols(store: "DreamStore", limit: Optional[int] = None, min_count: int = 2) -> List[str]:
+    """The store's most common symbols, most common first."""
+    return [symbol for symbol, _ in store.symbol_counts(limit=limit, min_count=min_count)]
+
+
+def main():
+    """Entry point for building and querying the symbol index"""
+
+    parser = argparse.ArgumentParser(description="Build and query the dream symbol index")
+    parser.add_argument("--index", type=str, default=None,
+                        help=f"Index file (defaults to {DEFAULT_INDEX_NAME} in the output directory)")
+    parser.add_argument("--output", type=str, default="dream_results",
+                        help="Directory holding the dream store")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    build_parser = commands.add_parser("build", help="Interpret the most common stored symbols not yet indexed")
+    build_parser.add_argument("--limit", type=int, default=500, help="Most common symbols to cover")
+    build_parser.add_argument("--min-count", type=int, default=2,
+                              help="Only symbols appearing in at least this many dreams")
+    build_parser.add_argument("--symbol", action="append", default=[],
+                              help="Also cover this symbol (repeatable)")
+    build_parser.add_argument("--batch-size", type=int, default=16, help="Symbols interpreted per request")
+    build_parser.add_argument("--concurrency", type=int, default=4, help="Requests in flight at once")
+    build_parser.add_argument("--model", type=str,
+                              default="accounts/fireworks/models/llama-v3p3-70b-instruct",
+                              help="LLM model to use for the interpretations")
+
+    lookup_parser = commands.add_parser("lookup", help="Print the cached interpretation of symbols")
+    lookup_parser.add_argument("symbols", nargs="+", help="Symbols to look up")
+    args = parser.parse_args()
+
+    path = args.index or os.path.join(args.output, DEFAULT_INDEX_NAME)
+    index = SymbolIndex().load(path)
+
+    if args.command == "lookup":
+        for symbol, entry in index.interpret(args.symbols).items():
+            if entry is None:
+                print(f"{symbol}: not indexed")
+            else:
+                print(f"{symbol} ({entry.symbol}): {entry.interpretation}")
+        return
+
+    from .store import DreamStore
+    from .llm_client import LLMClient
+
+    with DreamStore(args.output) as store:
+        symbols = args.symbol + frequent_symbols(store, limit=args.limit, min_count=args.min_count)
+    before = len(index)
+    llm_client = LLMClient(model=args.model, temperature=0.2)
+    build_symbol_index(llm_client, symbols, index, batch_size=args.batch_size, concurrency=args.concurrency)
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    index.save(path)
+    print(f"Indexed {len(index) - before} new symbols ({len(index)} total) in {path}; "
+          f"{len(index.missing(symbols))} could not be interpreted")
+
+
+if __name__ == "__main__":
+    main()
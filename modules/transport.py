@@ -0,0 +1,94 @@
+"""
+Pooled HTTP transport shared by the chat and image endpoints.
+
+One keep-alive connection pool per process avoids a fresh TCP/TLS handshake for
+every request. The base URL is configurable, so the whole client can be pointed
+at a local stand-in server.
+"""
+
+import threading
+from typing import Optional, TYPE_CHECKING
+
+from config.config import Config
+
+if TYPE_CHECKING:
+    import httpx
+
+
+class HTTPTransport:
+    """Lazily created, shared sync and async httpx clients with connection pooling."""
+
+    def __init__(self,
+                 base_url: Optional[str] = None,
+                 max_connections: int = 32,
+                 max_keepalive_connections: int = 16,
+                 keepalive_expiry: float = 30.0,
+                 timeout: float = 120.0,
+                 connect_timeout: float = 10.0):
+        """
+        Args:
+            base_url: Root of the Fireworks inference API (defaults to Config.FIREWORKS_BASE_URL)
+            max_connections: Maximum number of concurrent connections in the pool
+            max_keepalive_connections: Maximum number of idle connections kept open
+            keepalive_expiry: Seconds an idle connection is kept open
+            timeout: Read/write timeout in seconds (image renders can take a while)
+            connect_timeout: Timeout in seconds for establishing a connection
+        """
+        self.base_url = (base_url or Config.FIREWORKS_BASE_URL).rstrip("/")
+        self.max_connections = max_connections
+        self.max_keepalive_connections = max_keepalive_connections
+        self.keepalive_expiry = keepalive_expiry
+        self.timeout = timeout
+        self.connect_timeout = connect_timeout
+        self._client: Optional["httpx.Client"] = None
+        self._async_client: Optional["httpx.AsyncClient"] = None
+        self._lock = threading.Lock()
+    
+    def _client_options(self) -> dict:
+        # httpx is imported here rather than at module import time to keep startup fast
+        import httpx
+        return {
+            "limits": httpx.Limits(
+                max_connections=self.max_connections,
+                max_keepalive_connections=self.max_keepalive_connections,
+                keepalive_expiry=self.keepalive_expiry,
+            ),
+            "timeout": httpx.Timeout(self.timeout, connect=self.connect_timeout),
+        }
+
+    @property
+    def client(self) -> "httpx.Client":
+        """The shared synchronous client."""
+        if self._client is None:
+            with self._lock:
+                if self._client is None:
+                    import httpx
+                    self._client = httpx.Client(**self._client_options())
+        return self._client
+
+    @property
+    def async_client(self) -> "httpx.AsyncClient":
+        """The shared asynchronous client."""
+        if self._async_client is None:
+            with self._lock:
+                if self._async_client is None:
+                    import httpx
+                    self._async_client = httpx.AsyncClient(**self._client_options())
+        return self._async_client
+
+    def url(self, path: str) -> str:
+        """Join a path onto the base URL."""
+        return f"{self.base_url}/{path.lstrip('/')}"
+
+    def close(self) -> None:
+        """Close the synchronous pool. The async pool is closed with aclose()."""
+        if self._client is not None:
+            self._client.close()
+            self._client = None
+
+    async def aclose(self) -> None:
+        """Close both pools."""
+        self.close()
+        if self._async_client is not None:
+            await self._async_client.aclose()
+            self._async_client = None
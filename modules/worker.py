@@ -0,0 +1,319 @@
+"""
+Pipeline workers fed by a durable job queue.
+
+A single process running DreamAnalysisPipeline is bound by the GIL for its CPU
+work (JSON validation, document encoding, image encoding) and limited to one
+host. Here jobs go through a JobQueue (modules/jobqueue.py) instead. Any number
+of worker processes, on one machine or on several that share the queue, lease
+dreams from it. Each process has its own pooled LLMClient, and each runs
+``--concurrency`` dreams at once. Jobs are acknowledged with their result, and
+failures are retried with backoff. A job that keeps failing, or keeps killing
+its worker, ends up dead-lettered.
+
+    python -m modules.worker submit journal.jsonl --queue dream_results/jobs.db
+    python -m modules.worker run --queue dream_results/jobs.db --processes 4 --concurrency 8
+    python -m modules.worker stats --queue dream_results/jobs.db --dead
+    python -m modules.worker retry-dead --queue dream_results/jobs.db
+
+Every worker writes to the dream store in --output. SQLite allows several
+writer processes, but they must share the file through a local filesystem, not
+a network mount. The same holds for the SQLite queue. Workers on several hosts
+need a JobQueue backend built on a network service.
+"""
+
+import os
+import signal
+import asyncio
+import hashlib
+import argparse
+import multiprocessing
+from typing import Any, Dict, List, Optional, TYPE_CHECKING
+
+from .jobqueue import JobQueue, QueuedJob, SQLiteJobQueue
+from .metrics import Metrics, metrics as default_metrics
+
+if TYPE_CHECKING:
+    # The pipeline (and pydantic) is imported in the worker processes, not by the supervisor
+    from .pipeline import DreamAnalysisPipeline
+
+
+class PipelineWorker:
+    """Leases dream jobs from a queue and runs them through a pipeline, several at a time."""
+
+    def __init__(self, queue: JobQueue, pipeline: "DreamAnalysisPipeline", concurrency: int = 8,
+                 visibility_timeout: float = 300.0, poll_interval: float = 0.5, max_poll_interval: float = 5.0,
+                 metrics: Optional[Metrics] = None):
+        """
+        Args:
+            queue: Queue the jobs are leased from
+            pipeline: Pipeline analyzing each dream
+            concurrency: Jobs processed at once
+            visibility_timeout: Seconds a lease lasts; it is renewed every third of that while
+                                the job runs, so it only expires if the worker stalls or dies
+            poll_interval: Initial wait before polling an empty queue again
+            max_poll_interval: Longest wait between polls of an empty queue
+            metrics: Instrumentation front end (defaults to the process-wide one)
+        """
+        self.queue = queue
+        self.pipeline = pipeline
+        self.concurrency = concurrency
+        self.visibility_timeout = visibility_timeout
+        self.poll_interval = poll_interval
+        self.max_poll_interval = max_poll_interval
+        self.metrics = metrics or default_metrics
+
+    def run(self) -> None:
+        """Process jobs until SIGINT or SIGTERM, then finish the jobs in flight."""
+        asyncio.run(self.arun())
+
+    async def arun(self, stop: Optional[asyncio.Event] = None) -> None:
+        """
+        Async form of run.
+
+        Args:
+            stop: Event that ends the worker once set (SIGINT and SIGTERM set it too)
+        """
+        stop = stop or asyncio.Event()
+        loop = asyncio.get_running_loop()
+        for signum in (signal.SIGINT, signal.SIGTERM):
+            try:
+                loop.add_signal_handler(signum, stop.set)
+            except (NotImplementedError, RuntimeError):
+                # Not available on Windows or outside the main thread
+                pass
+        await asyncio.gather(*(self._consume(stop) for _ in range(self.concurrency)))
+
+    async def _consume(self, stop: asyncio.Event) -> None:
+        idle = self.poll_interval
+        while not stop.is_set():
+            job = await asyncio.to_thread(self.queue.get, self.visibility_timeout)
+            if job is None:
+                # Back off while the queue is empty, waking early on shutdown
+                try:
+                    await asyncio.wait_for(stop.wait(), idle)
+                except asyncio.TimeoutError:
+                    pass
+                idle = min(idle * 2, self.max_poll_interval)
+                continue
+            idle = self.poll_interval
+            await self._process(job)
+
+    async def _process(self, job: QueuedJob) -> None:
+        from .pipeline import DreamSchema, failure_reason
+
+        try:
+            dream = DreamSchema.model_validate(job.payload["dream"])
+        except (KeyError, TypeError, ValueError) as e:
+            # Retrying cannot fix a malformed payload
+            await asyncio.to_thread(self.queue.nack, job, f"invalid job: {e}", False)
+            self.metrics.inc("worker_jobs_total", result="invalid")
+            return
+
+        heartbeat = asyncio.create_task(self._heartbeat(job))
+        try:
+            with self.metrics.timer("worker_job_seconds"):
+                result = await self.pipeline.aanalyze_dream(
+                    dream, user_tier=job.payload.get("userTier"), latency_budget=job.payload.get("latencyBudget"),
+                    # Retries of a job update the same store record
+                    dream_id=job.id)
+            failure = failure_reason(result)
+            if failure:
+                raise RuntimeError(failure)
+        except Exception as e:
+            print(f"Job {job.id} failed (attempt {job.attempts}): {e}")
+            acknowledged = await asyncio.to_thread(self.queue.nack, job, str(e))
+            self.metrics.inc("worker_jobs_total", result="failed")
+        else:
+            acknowledged = await asyncio.to_thread(self.queue.ack, job, result)
+            self.metrics.inc("worker_jobs_total", result="done")
+        finally:
+            heartbeat.cancel()
+        if not acknowledged:
+            # The lease ran out and the job was handed to another worker, whose outcome counts
+            print(f"Lost the lease on job {job.id}")
+            self.metrics.inc("worker_lost_leases_total")
+
+    async def _heartbeat(self, job: QueuedJob) -> None:
+        """Renew the lease of a running job until it is cancelled."""
+        while True:
+            await asyncio.sleep(self.visibility_timeout / 3)
+            if not await asyncio.to_thread(self.queue.extend, job, self.visibility_timeout):
+                return
+
+
+def _worker_process(options: Dict[str, Any]) -> None:
+    """Entry point of one worker process: builds its own client, pipeline and queue connection."""
+    from .llm_client import LLMClient
+    from .pipeline import DreamAnalysisPipeline
+    from .store import DreamStore
+    from .images import ImageProcessor
+    from .routing import RoutingPolicy
+    from .symbols import SymbolIndex
+
+    llm_client = LLMClient(model=options["model"], temperature=options["temperature"])
+    image_processor = None
+    if options["image_format"]:
+        # Already one worker per core, so images are encoded in-process rather than in a nested pool
+        image_processor = ImageProcessor(format=options["image_format"], thumbnail_sizes=options["thumbnails"],
+                                         max_workers=0)
+    queue = SQLiteJobQueue(options["queue"], max_attempts=options["max_attempts"])
+    with DreamStore(options["output"]) as store:
+        pipeline = DreamAnalysisPipeline(llm_client=llm_client, output_dir=options["output"], store=store,
+                                         image_processor=image_processor,
+                                         router=RoutingPolicy() if options["routing"] else None,
+                                         symbol_index=SymbolIndex().load(options["symbols"], missing_ok=False)
+                                         if options["symbols"] else None)
+        worker = PipelineWorker(queue, pipeline, concurrency=options["concurrency"],
+                                visibility_timeout=options["visibility_timeout"])
+
+        async def work() -> None:
+            try:
+                await worker.arun()
+            finally:
+                # The async pool belongs to this event loop
+                await llm_client.transport.aclose()
+
+        asyncio.run(work())
+    queue.close()
+
+
+def run_workers(options: Dict[str, Any], processes: int) -> None:
+    """
+    Start ``processes`` worker processes and supervise them until interrupted.
+
+    A worker that exits with an error (a crash, or a job that brought the process
+    down) is replaced. Its job's lease then runs out, and the job is retried or
+    dead-lettered.
+    """
+    # spawn rather than fork: forking a process that runs threads can deadlock
+    context = multiprocessing.get_context("spawn")
+    stopping = False
+
+    def start() -> multiprocessing.Process:
+        process = context.Process(target=_worker_process, args=(options,), daemon=False)
+        process.start()
+        return process
+
+    def stop(signum, frame) -> None:
+        nonlocal stopping
+        stopping = True
+        for process in workers:
+            if process.is_alive():
+                # Each worker finishes its jobs in flight and exits
+                os.kill(process.pid, signal.SIGTERM)
+
+    workers = [start() for _ in range(processes)]
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, stop)
+    print(f"Started {processes} workers on {options['queue']}")
+    while True:
+        for index, process in enumerate(workers):
+            process.join(timeout=0.5 / len(workers))
+            if process.exitcode not in (None, 0) and not stopping:
+                print(f"Worker {process.pid} exited with {process.exitcode}; restarting it")
+                workers[index] = start()
+        if all(process.exitcode is not None for process in workers):
+            break
+
+
+def submit_journal(queue: JobQueue, source: str, **payload: Any) -> List[str]:
+    """
+    Queue every valid dream of a CSV or JSONL journal export.
+
+    Job IDs are derived from the file and row, so submitting the same file again
+    does not queue its dreams twice.
+
+    Returns:
+        The job IDs, in row order
+    """
+    from .ingest import read_journal, parse_dream
+
+    prefix = hashlib.sha1(os.path.abspath(source).encode()).hexdigest()[:12]
+    job_ids = []
+    for row, record in read_journal(source):
+        try:
+            dream = parse_dream(record)
+        except ValueError as e:
+            print(f"Skipping row {row}: {e}")
+            continue
+        job_ids.append(queue.put({"dream": dream.model_dump(), **payload}, job_id=f"{prefix}-{row}"))
+    return job_ids
+
+
+def main():
+    """Entry point for the queue-fed pipeline workers"""
+    from .images import thumbnail_sizes
+
+    parser = argparse.ArgumentParser(description="Dream analysis workers fed by a durable job queue")
+    parser.add_argument("--queue", type=str, default=os.path.join("dream_results", "jobs.db"),
+                        help="SQLite job queue shared by the workers")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    run_parser = commands.add_parser("run", help="Process queued dreams")
+    run_parser.add_argument("--processes", type=int, default=os.cpu_count() or 1,
+                            help="Worker processes (defaults to the CPU count)")
+    run_parser.add_argument("--concurrency", type=int, default=8, help="Dreams in flight per process")
+    run_parser.add_argument("--visibility-timeout", type=float, default=300,
+                            help="Seconds before a stalled worker's job is handed to another worker")
+    run_parser.add_argument("--max-attempts", type=int, default=5,
+                            help="Attempts before a job is dead-lettered")
+    run_parser.add_argument("--model", type=str, default="accounts/fireworks/models/llama-v3p3-70b-instruct",
+                            help="LLM model to use for analysis")
+    run_parser.add_argument("--temperature", type=float, default=0.6,
+                            help="Temperature for LLM generation (0.0-1.0)")
+    run_parser.add_argument("--output", type=str, default="dream_results",
+                            help="Directory holding the dream store and generated images")
+    run_parser.add_argument("--image-format", type=str, default=None, choices=["webp", "avif", "jpeg", "png"],
+                            help="Re-encode generated images into this format")
+    run_parser.add_argument("--thumbnails", type=thumbnail_sizes, default="",
+                            help="Comma-separated thumbnail sizes in pixels")
+    run_parser.add_argument("--routing", action="store_true",
+                            help="Route each dream to a model and image quality by tier and budget")
+    run_parser.add_argument("--symbols", type=str, default=None,
+                            help="Symbol index built with `python -m modules.symbols build`")
+
+    submit_parser = commands.add_parser("submit", help="Queue the dreams of a CSV or JSONL journal export")
+    submit_parser.add_argument("source", help="Journal export (.csv, .jsonl or .ndjson)")
+    submit_parser.add_argument("--tier", type=str, default=None, help="User tier passed to the router")
+
+    stats_parser = commands.add_parser("stats", help="Show the number of jobs in each state")
+    stats_parser.add_argument("--dead", action="store_true", help="Also list dead-lettered jobs")
+
+    commands.add_parser("retry-dead", help="Requeue every dead-lettered job")
+    args = parser.parse_args()
+
+    if args.command == "run":
+        # Checked here, not in the workers, so a typo fails once instead of every restart
+        if args.symbols and not os.path.exists(args.symbols):
+            parser.error(f"--symbols: no symbol index at {args.symbols}")
+        options = {
+            "queue": args.queue, "concurrency": args.concurrency, "visibility_timeout": args.visibility_timeout,
+            "max_attempts": args.max_attempts, "model": args.model, "temperature": args.temperature,
+            "output": args.output, "image_format": args.image_format, "routing": args.routing,
+            "symbols": args.symbols,
+            "thumbnails": args.thumbnails,
+        }
+        # Create the queue (and its directory) before the workers race to do it
+        os.makedirs(os.path.dirname(os.path.abspath(args.queue)), exist_ok=True)
+        SQLiteJobQueue(args.queue).close()
+        run_workers(options, args.processes)
+        return
+
+    os.makedirs(os.path.dirname(os.path.abspath(args.queue)), exist_ok=True)
+    with SQLiteJobQueue(args.queue) as queue:
+        if args.command == "submit":
+            payload = {"userTier": args.tier} if args.tier else {}
+            job_ids = submit_journal(queue, args.source, **payload)
+            print(f"Queued {len(job_ids)} dreams on {args.queue}")
+        elif args.command == "stats":
+            for state, count in queue.stats().items():
+                print(f"{state:<8}{count:>8}")
+            if args.dead:
+                for job in queue.dead_letters():
+                    print(f"{job['id']}  attempts={job['attempts']}  {job['error']}")
+        else:
+            print(f"Requeued {queue.retry_dead()} dead-lettered jobs")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,77 @@
+import asyncio
+
+import numpy as np
+
+from modules.analytics import DreamAnalytics
+from modules.llm_client import LLMClient
+from modules.metrics import Metrics
+from modules.pipeline import DreamAnalysisPipeline, DreamSchema
+from modules.scheduler import RequestScheduler, RetryPolicy
+from modules.store import DreamStore
+from modules.transport import HTTPTransport
+
+DREAMS = [
+    {"primaryEmotion": "Fear", "emotionalIntensity": 5, "mainSymbols": ["water", "Teeth", "falling"], "userId": "ana"},
+    {"primaryEmotion": "fear", "emotionalIntensity": 4, "mainSymbols": ["water", "falling"], "userId": "ben"},
+    {"primaryEmotion": "joy", "emotionalIntensity": 2, "mainSymbols": ["flying"], "userId": "ana"},
+    {"primaryEmotion": "awe", "emotionalIntensity": 0, "mainSymbols": ["water", "flying", "teeth"]},
+    {"primaryEmotion": "joy", "emotionalIntensity": 9, "mainSymbols": [], "userId": "ben"},
+]
+
+
+def pairs(analytics, user=None):
+    names, rows, cols, counts = analytics.cooccurrence_matrix(user)
+    return {(names[a], names[b]): int(count) for a, b, count in zip(rows, cols, counts)}
+
+
+def test_incremental_record_matches_a_rebuild_from_the_store(tmp_path):
+    incremental = DreamAnalytics()
+    with DreamStore(str(tmp_path)) as store:
+        for dream in DREAMS:
+            store.save({"narrative": "a dream", "imagePath": "", **dream})
+            incremental.record(dream)
+        rebuilt = DreamAnalytics().rebuild(store, chunk_size=2)
+
+    for user in (None, "ana", "ben"):
+        assert incremental.dream_count(user) == rebuilt.dream_count(user)
+        assert incremental.emotion_counts(user) == rebuilt.emotion_counts(user)
+        assert np.array_equal(incremental.intensity_distribution(user), rebuilt.intensity_distribution(user))
+        assert dict(incremental.top_symbols(user)) == dict(rebuilt.top_symbols(user))
+        assert pairs(incremental, user) == pairs(rebuilt, user)
+    assert incremental.users() == rebuilt.users() == ["ana", "ben"]
+
+    assert incremental.emotion_counts() == {"fear": 2, "joy": 2, "awe": 1}
+    # Out-of-range intensities are clipped to the scale
+    assert incremental.intensity_distribution().tolist() == [1, 0, 1, 0, 1, 2]
+    assert dict(incremental.co_occurring("water")) == {"falling": 2, "teeth": 2, "flying": 1}
+    assert pairs(incremental, "ana") == {("water", "teeth"): 1, ("teeth", "water"): 1, ("water", "falling"): 1,
+                                         ("falling", "water"): 1, ("teeth", "falling"): 1, ("falling", "teeth"): 1}
+
+
+def test_emotion_trend_counts_per_bucket():
+    analytics = DreamAnalytics(bucket_seconds=100)
+    analytics.record(DREAMS[0], created_at=1000)
+    analytics.record(DREAMS[2], created_at=1050)
+    analytics.record(DREAMS[1], created_at=1250)
+    starts, names, counts = analytics.emotion_trend()
+    assert starts.tolist() == [1000, 1100, 1200]
+    by_emotion = {name: counts[:, i].tolist() for i, name in enumerate(names)}
+    assert by_emotion == {"fear": [1, 0, 1], "joy": [1, 0, 0]}
+    assert analytics.intensity_distribution(since=1200).tolist() == [0, 0, 0, 0, 1, 0]
+
+
+def test_failed_analyses_are_not_counted(tmp_path):
+    metrics = Metrics([])
+    # Nothing listens on the discard port, so the analysis comes back as error defaults
+    llm_client = LLMClient(api_key="test", transport=HTTPTransport(base_url="http://127.0.0.1:9/v1"),
+                           scheduler=RequestScheduler(retry=RetryPolicy(max_attempts=1), metrics=metrics),
+                           metrics=metrics)
+    analytics = DreamAnalytics()
+    pipeline = DreamAnalysisPipeline(llm_client=llm_client, output_dir=str(tmp_path), metrics=metrics,
+                                     analytics=analytics)
+    dream = DreamSchema(narrative="I was falling", mainSymbols=["falling"], primaryEmotion="fear",
+                        emotionalIntensity=3, lifeConnection="exams")
+
+    pipeline.analyze_dream(dream)
+    asyncio.run(pipeline.aanalyze_dream(dream))
+    assert analytics.dream_count() == 0
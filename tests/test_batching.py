@@ -0,0 +1,118 @@
+import threading
+import time
+from concurrent.futures import wait
+
+import pytest
+from pydantic import BaseModel
+
+from modules.batching import MicroBatcher
+from modules.llm_client import LLMClient
+from modules.metrics import Metrics
+from modules.transport import HTTPTransport
+
+
+class Answer(BaseModel):
+    text: str
+
+
+class FakeClient:
+    """Records the batches it is asked for and answers each prompt with its own text."""
+
+    def __init__(self, model="small", transport=None):
+        self.transport = transport or object()
+        self.model = model
+        self.temperature = 0.6
+        self.max_tokens = 1024
+        self.batches = []
+        self._lock = threading.Lock()
+
+    def generate_structured_json(self, prompt, schema_model, system=None, as_model=False):
+        return self.generate_structured_batch([prompt], schema_model, system)[0]
+
+    def generate_structured_batch(self, prompts, schema_model, system=None):
+        with self._lock:
+            self.batches.append(list(prompts))
+        return [schema_model(text=prompt) for prompt in prompts]
+
+
+def make_batcher(**options) -> MicroBatcher:
+    return MicroBatcher(metrics=Metrics([]), **options)
+
+
+def test_a_full_batch_is_sent_without_waiting():
+    client = FakeClient()
+    with make_batcher(max_batch_size=3, max_wait=10) as batcher:
+        start = time.monotonic()
+        futures = [batcher.submit(client, f"dream {n}", Answer) for n in range(3)]
+        assert [future.result(timeout=5).text for future in futures] == ["dream 0", "dream 1", "dream 2"]
+        assert time.monotonic() - start < 5
+    assert client.batches == [["dream 0", "dream 1", "dream 2"]]
+
+
+def test_a_partial_batch_is_sent_when_its_wait_expires():
+    client = FakeClient()
+    with make_batcher(max_batch_size=8, max_wait=0.05) as batcher:
+        start = time.monotonic()
+        futures = [batcher.submit(client, f"dream {n}", Answer) for n in range(2)]
+        wait(futures, timeout=5)
+        assert 0.04 <= time.monotonic() - start < 2
+        assert client.batches == [["dream 0", "dream 1"]]
+        # The next request opens a new batch
+        assert batcher.generate(client, "dream 2", Answer).text == "dream 2"
+    assert client.batches == [["dream 0", "dream 1"], ["dream 2"]]
+
+
+def test_requests_with_different_settings_are_batched_apart():
+    transport = object()
+    small, large = FakeClient("small", transport), FakeClient("large", transport)
+    with make_batcher(max_batch_size=8, max_wait=0.02) as batcher:
+        futures = [batcher.submit(small, "a", Answer), batcher.submit(large, "b", Answer),
+                   batcher.submit(small, "c", Answer), batcher.submit(small, "d", Answer, system="other")]
+        assert [future.result(timeout=5).text for future in futures] == ["a", "b", "c", "d"]
+    assert sorted(small.batches) == [["a", "c"], ["d"]]
+    assert large.batches == [["b"]]
+
+
+def test_an_upstream_error_fails_every_request_of_its_batch_only():
+    class FailingClient(FakeClient):
+        def generate_structured_batch(self, prompts, schema_model, system=None):
+            raise ConnectionError("upstream down")
+
+    with make_batcher(max_batch_size=2, max_wait=0.02) as batcher:
+        failing = [batcher.submit(FailingClient(), prompt, Answer) for prompt in ("a", "b")]
+        ok = batcher.submit(FakeClient(), "c", Answer)
+        for future in failing:
+            with pytest.raises(ConnectionError):
+                future.result(timeout=5)
+        assert ok.result(timeout=5).text == "c"
+
+
+def test_one_bad_item_does_not_fail_the_rest_of_its_batch():
+    class BatchClient(LLMClient):
+        """A real client whose batched answer has one malformed item."""
+
+        singles = []
+
+        def _request_batch(self, prompts, schema_model, system):
+            return [{"text": prompts[0]}, {"wrong": "field"}, {"text": prompts[2]}]
+
+        def generate_structured_json(self, prompt, schema_model, system=None, as_model=False):
+            self.singles.append(prompt)
+            return schema_model(text=f"{prompt} (retried)")
+
+    metrics = Metrics([])
+    client = BatchClient(api_key="test", transport=HTTPTransport(base_url="http://127.0.0.1:9/v1"), metrics=metrics)
+    with make_batcher(max_batch_size=3, max_wait=10) as batcher:
+        futures = [batcher.submit(client, prompt, Answer) for prompt in ("a", "b", "c")]
+        assert [future.result(timeout=5).text for future in futures] == ["a", "b (retried)", "c"]
+    assert BatchClient.singles == ["b"]
+
+
+def test_closed_batcher_sends_pending_requests_and_rejects_new_ones():
+    client = FakeClient()
+    batcher = make_batcher(max_batch_size=8, max_wait=60)
+    future = batcher.submit(client, "a", Answer)
+    batcher.close()
+    assert future.result(timeout=5).text == "a"
+    with pytest.raises(RuntimeError):
+        batcher.submit(client, "b", Answer)
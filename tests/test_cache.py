@@ -0,0 +1,119 @@
+import itertools
+
+import pytest
+
+from modules import cache as cache_module
+from modules.cache import MemoryCache, ResponseCache, SQLiteCache
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    """A fake time.time that only moves when the test advances it."""
+    now = [1000.0]
+    monkeypatch.setattr(cache_module.time, "time", lambda: now[0])
+    return now
+
+
+def test_memory_cache_evicts_the_least_recently_used():
+    cache = MemoryCache(max_entries=2)
+    cache.set("a", "1")
+    cache.set("b", "2")
+    assert cache.get("a") == "1"
+    cache.set("c", "3")
+    assert cache.get("b") is None
+    assert cache.get("a") == "1" and cache.get("c") == "3"
+    assert len(cache) == 2
+
+
+def test_memory_cache_entries_expire(clock):
+    cache = MemoryCache(ttl=10)
+    cache.set("a", "1")
+    clock[0] += 5
+    assert cache.get("a") == "1"
+    clock[0] += 6
+    assert cache.get("a") is None
+    assert len(cache) == 0
+
+
+def test_sqlite_cache_persists_across_instances(tmp_path):
+    path = str(tmp_path / "cache.db")
+    cache = SQLiteCache(path)
+    cache.set("a", "1")
+    cache.close()
+    reopened = SQLiteCache(path)
+    assert reopened.get("a") == "1"
+    assert reopened.get("b") is None
+    reopened.close()
+
+
+def test_sqlite_cache_evicts_the_least_recently_read(tmp_path, clock):
+    ticks = itertools.count()
+    cache = SQLiteCache(str(tmp_path / "cache.db"), max_entries=10)
+    for n in range(10):
+        clock[0] = 1000 + next(ticks)
+        cache.set(f"k{n}", str(n))
+    clock[0] = 1000 + next(ticks)
+    assert cache.get("k0") == "0"
+    clock[0] = 1000 + next(ticks)
+    cache.set("k10", "10")
+    # k0 was read after k1 and k2 were written, so they go first
+    assert len(cache) == 9
+    assert cache.get("k1") is None and cache.get("k2") is None
+    assert cache.get("k0") == "0" and cache.get("k10") == "10"
+    cache.close()
+
+
+def test_sqlite_cache_evicts_in_batches(tmp_path):
+    cache = SQLiteCache(str(tmp_path / "cache.db"), max_entries=100)
+    for n in range(101):
+        cache.set(f"k{n}", str(n))
+    # Going one over the cap makes room for a batch of new rows
+    assert len(cache) == 95
+    cache.close()
+
+
+def test_sqlite_cache_hits_do_not_write_until_the_batch_fills(tmp_path, clock):
+    cache = SQLiteCache(str(tmp_path / "cache.db"), touch_batch=3)
+    for key in "abc":
+        cache.set(key, "1")
+    clock[0] += 1
+    cache.get("a")
+    cache.get("b")
+
+    def accessed_at(key):
+        return cache._conn.execute("SELECT accessed_at FROM responses WHERE key = ?", (key,)).fetchone()[0]
+
+    assert accessed_at("a") == 1000.0
+    cache.get("c")
+    assert [accessed_at(key) for key in "abc"] == [1001.0] * 3
+    cache.close()
+
+
+def test_sqlite_cache_entries_expire(tmp_path, clock):
+    cache = SQLiteCache(str(tmp_path / "cache.db"), ttl=10)
+    cache.set("a", "1")
+    clock[0] += 11
+    assert cache.get("a") is None
+    assert len(cache) == 0
+    cache.close()
+
+
+def test_response_cache_counts_hits_and_misses(tmp_path):
+    path = str(tmp_path / "cache.db")
+    cache = ResponseCache.with_sqlite(path)
+    assert cache.get("key") is None
+    cache.set("key", {"analysis": "water"})
+    value = cache.get("key")
+    assert value == {"analysis": "water"}
+    # Every hit is a fresh object
+    value["analysis"] = "changed"
+    assert cache.get("key") == {"analysis": "water"}
+    cache.close()
+
+    # A new process finds the response on disk and promotes it to memory
+    reopened = ResponseCache.with_sqlite(path)
+    assert reopened.get("key") == {"analysis": "water"}
+    assert reopened.get("key") == {"analysis": "water"}
+    assert reopened.stats() == {"hits": 2, "misses": 0, "disk_hits": 1, "memory_entries": 1}
+    reopened.close()
+    assert cache.stats()["hits"] == 2 and cache.stats()["misses"] == 1
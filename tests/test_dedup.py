@@ -0,0 +1,61 @@
+from types import SimpleNamespace
+
+from modules.dedup import DreamIndex
+
+
+def dream(narrative, *symbols):
+    return SimpleNamespace(narrative=narrative, mainSymbols=list(symbols))
+
+
+WOLF = dream("I was being chased through a dark forest by a huge wolf and could not run", "wolf", "forest")
+WOLF_AGAIN = dream("I was being chased through a dark forest by a huge wolf and couldn't run", "wolf", "forest")
+BEAR = dream("I was being chased through a dark forest by a big bear and could not move at all", "bear", "forest")
+TEETH = dream("My teeth fell out during an exam at school", "teeth")
+
+
+def test_lookup_matches_above_the_threshold_only():
+    index = DreamIndex(threshold=0.9, image_threshold=0.6)
+    index.add(WOLF, {"analysis": "wolf"})
+    match = index.lookup(WOLF_AGAIN)
+    assert match.score >= 0.9 and match.payload == {"analysis": "wolf"}
+    # Close enough for image-only reuse, not for the whole analysis
+    match = index.lookup(BEAR)
+    assert 0.6 <= match.score < 0.9
+    assert index.lookup(TEETH) is None
+
+    strict = DreamIndex(threshold=0.9, image_threshold=None)
+    strict.add(WOLF, {"analysis": "wolf"})
+    assert strict.lookup(BEAR) is None
+    assert DreamIndex().lookup(WOLF) is None
+
+
+def test_search_ranks_the_closest_dreams_first():
+    index = DreamIndex()
+    for name, entry in (("teeth", TEETH), ("bear", BEAR), ("wolf", WOLF)):
+        index.add(entry, {"name": name})
+    assert [match.payload["name"] for match in index.search(WOLF_AGAIN, k=2)] == ["wolf", "bear"]
+
+
+def test_save_and_load_round_trip(tmp_path):
+    path = str(tmp_path / "dedup.npz")
+    index = DreamIndex(threshold=0.9)
+    index.add(WOLF, {"analysis": "wolf", "imagePath": "wolf.png"})
+    index.add(TEETH, {"analysis": "teeth"})
+    index.save(path)
+
+    loaded = DreamIndex(threshold=0.9).load(path)
+    assert len(loaded) == 2
+    assert loaded.lookup(WOLF_AGAIN).payload == {"analysis": "wolf", "imagePath": "wolf.png"}
+    assert len(DreamIndex().load(str(tmp_path / "missing.npz"))) == 0
+
+
+def test_lsh_search_still_finds_near_duplicates():
+    # Past exact_limit the search only scores candidates sharing an LSH bucket
+    index = DreamIndex(threshold=0.9, exact_limit=10, lsh_bits=4)
+    for n in range(30):
+        index.add(dream(f"Dream number {n} about a house with {n} rooms", "house"), {"n": n})
+    index.add(WOLF, {"analysis": "wolf"})
+    assert index._buckets
+    assert index.lookup(WOLF).payload == {"analysis": "wolf"}
+    assert index.lookup(WOLF_AGAIN).payload == {"analysis": "wolf"}
+    assert index.lookup(TEETH) is None
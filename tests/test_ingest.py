@@ -0,0 +1,119 @@
+import asyncio
+import json
+
+from modules.ingest import JournalImporter
+from modules.llm_client import LLMClient
+from modules.metrics import Metrics
+from modules.pipeline import DreamAnalysisPipeline
+from modules.scheduler import RequestScheduler, RetryPolicy
+from modules.transport import HTTPTransport
+
+
+class StallingPipeline:
+    """Answers every dream at once, except the first, which waits until released."""
+
+    def __init__(self):
+        self.release = asyncio.Event()
+        self.started = []
+
+    async def aanalyze_dream(self, dream):
+        self.started.append(dream.narrative)
+        if dream.narrative == "dream 0":
+            await self.release.wait()
+        return {"narrative": dream.narrative, "analysis": "a", "imagePrompt": "p", "imagePath": "dream.png"}
+
+
+def write_journal(path, count):
+    with open(path, "w") as f:
+        for n in range(count):
+            f.write(json.dumps({"narrative": f"dream {n}", "mainSymbols": ["water"], "primaryEmotion": "calm",
+                                "emotionalIntensity": 3, "lifeConnection": "work"}) + "\n")
+
+
+def test_a_stalled_row_bounds_how_far_the_reader_runs_ahead(tmp_path):
+    source, output = str(tmp_path / "journal.jsonl"), str(tmp_path / "results.jsonl")
+    write_journal(source, 200)
+
+    async def run():
+        pipeline = StallingPipeline()
+        importer = JournalImporter(pipeline, concurrency=4, checkpoint_every=1, window=20)
+        task = asyncio.create_task(importer.arun(source, output))
+        for _ in range(50):
+            await asyncio.sleep(0.01)
+        assert len(pipeline.started) == 20
+        with open(f"{output}.checkpoint") as f:
+            checkpoint = json.load(f)
+        assert checkpoint["row"] == 0 and len(checkpoint["done"]) == 19
+        pipeline.release.set()
+        return await task
+
+    stats = asyncio.run(run())
+    assert stats.analyzed == 200
+    with open(output) as f:
+        assert sorted(json.loads(line)["row"] for line in f) == list(range(200))
+
+
+class FlakyPipeline:
+    """Fails the listed dreams the way the real pipeline does: with error defaults, not exceptions."""
+
+    def __init__(self, failing=()):
+        self.failing = set(failing)
+        self.analyzed = []
+
+    async def aanalyze_dream(self, dream):
+        self.analyzed.append(dream.narrative)
+        if dream.narrative in self.failing:
+            return {"narrative": dream.narrative, "analysis": "", "imagePrompt": "",
+                    "explanation": "Error generating explanation: upstream unavailable", "imagePath": ""}
+        return {"narrative": dream.narrative, "analysis": "a", "imagePrompt": "p", "imagePath": "dream.png"}
+
+
+def last_lines(output):
+    lines = {}
+    with open(output) as f:
+        for line in f:
+            data = json.loads(line)
+            lines[data["row"]] = data
+    return lines
+
+
+def test_rows_that_failed_upstream_are_retried_on_resume(tmp_path):
+    source, output = str(tmp_path / "journal.jsonl"), str(tmp_path / "results.jsonl")
+    write_journal(source, 6)
+    with open(source, "a") as f:
+        f.write(json.dumps({"narrative": "no other fields"}) + "\n")
+
+    first = FlakyPipeline(failing={"dream 1", "dream 4"})
+    stats = JournalImporter(first, concurrency=2, checkpoint_every=1).run(source, output)
+    assert (stats.analyzed, stats.invalid, stats.failed) == (4, 1, 2)
+    lines = last_lines(output)
+    assert lines[1]["retryable"] and lines[1]["error"].startswith("analysis failed")
+    assert "retryable" not in lines[6]
+
+    second = FlakyPipeline()
+    stats = JournalImporter(second, concurrency=2, checkpoint_every=1).run(source, output)
+    assert sorted(second.analyzed) == ["dream 1", "dream 4"]
+    assert (stats.analyzed, stats.invalid, stats.failed, stats.skipped) == (2, 0, 0, 4)
+    lines = last_lines(output)
+    assert all("result" in lines[row] for row in range(6))
+
+    # Nothing is left to retry
+    third = FlakyPipeline()
+    JournalImporter(third, concurrency=2).run(source, output)
+    assert third.analyzed == []
+
+
+def test_an_unreachable_upstream_leaves_every_row_retryable(tmp_path):
+    source, output = str(tmp_path / "journal.jsonl"), str(tmp_path / "results.jsonl")
+    write_journal(source, 3)
+    metrics = Metrics([])
+    # Nothing listens on the discard port, so every upstream call fails at once
+    llm_client = LLMClient(api_key="test", transport=HTTPTransport(base_url="http://127.0.0.1:9/v1"),
+                           scheduler=RequestScheduler(retry=RetryPolicy(max_attempts=1), metrics=metrics),
+                           metrics=metrics)
+    pipeline = DreamAnalysisPipeline(llm_client=llm_client, output_dir=str(tmp_path), metrics=metrics)
+    stats = JournalImporter(pipeline, concurrency=3).run(source, output)
+    assert (stats.analyzed, stats.failed) == (0, 3)
+    assert all(line["retryable"] for line in last_lines(output).values())
+    with open(f"{output}.checkpoint") as f:
+        assert json.load(f)["failed"] == [0, 1, 2]
@@ -0,0 +1,113 @@
+import time
+
+import pytest
+
+from modules.jobqueue import MemoryJobQueue, SQLiteJobQueue
+
+
+@pytest.fixture(params=["memory", "sqlite"])
+def make_queue(request, tmp_path):
+    queues = []
+
+    def make(**options):
+        if request.param == "memory":
+            queue = MemoryJobQueue(**options)
+        else:
+            queue = SQLiteJobQueue(str(tmp_path / f"jobs{len(queues)}.db"), **options)
+        queues.append(queue)
+        return queue
+
+    yield make
+    for queue in queues:
+        queue.close()
+
+
+def test_put_is_idempotent_per_job_id(make_queue):
+    queue = make_queue()
+    assert queue.put({"n": 1}, job_id="a") == "a"
+    assert queue.put({"n": 2}, job_id="a") == "a"
+    job = queue.get()
+    assert job.payload == {"n": 1}
+    assert queue.get() is None
+
+
+def test_leased_job_is_invisible_until_the_lease_expires(make_queue):
+    queue = make_queue()
+    job_id = queue.put({"n": 1})
+    job = queue.get(visibility_timeout=0.2)
+    assert job.id == job_id and job.attempts == 1
+    assert queue.get() is None
+    assert queue.status(job_id)["state"] == "running"
+
+    time.sleep(0.25)
+    again = queue.get(visibility_timeout=10)
+    assert again.id == job_id and again.attempts == 2
+    # The first consumer lost its lease, so it can no longer finish the job
+    assert not queue.ack(job, {"stale": True})
+    assert not queue.extend(job, 10)
+    assert queue.ack(again, {"ok": True})
+    assert queue.status(job_id)["result"] == {"ok": True}
+    assert queue.stats()["done"] == 1
+
+
+def test_extend_keeps_the_job_leased(make_queue):
+    queue = make_queue()
+    queue.put({"n": 1})
+    job = queue.get(visibility_timeout=0.2)
+    assert queue.extend(job, 10)
+    time.sleep(0.25)
+    assert queue.get() is None
+    assert queue.ack(job)
+
+
+def test_nack_retries_with_backoff(make_queue):
+    queue = make_queue(retry_delay=0.2, max_attempts=3)
+    job_id = queue.put({"n": 1})
+    job = queue.get()
+    assert queue.nack(job, "boom")
+    status = queue.status(job_id)
+    assert status["state"] == "queued" and status["error"] == "boom"
+    # Not visible again until the backoff has passed
+    assert queue.get() is None
+    time.sleep(0.25)
+    assert queue.get().attempts == 2
+
+
+def test_job_is_dead_lettered_after_max_attempts(make_queue):
+    queue = make_queue(retry_delay=0, max_attempts=2)
+    job_id = queue.put({"n": 1})
+    assert queue.nack(queue.get(), "first")
+    assert queue.nack(queue.get(), "second")
+    assert queue.get() is None
+    assert queue.status(job_id)["state"] == "dead"
+    assert [job["error"] for job in queue.dead_letters()] == ["second"]
+
+    assert queue.retry_dead() == 1
+    job = queue.get()
+    assert job.id == job_id and job.attempts == 1
+
+
+def test_job_whose_lease_keeps_expiring_is_dead_lettered(make_queue):
+    queue = make_queue(max_attempts=1)
+    job_id = queue.put({"n": 1})
+    assert queue.get(visibility_timeout=0.05) is not None
+    time.sleep(0.1)
+    assert queue.get() is None
+    assert queue.status(job_id)["state"] == "dead"
+
+
+def test_nack_without_retry_dead_letters_at_once(make_queue):
+    queue = make_queue(max_attempts=5)
+    job_id = queue.put({"n": 1})
+    assert queue.nack(queue.get(), "invalid job", retry=False)
+    assert queue.status(job_id)["state"] == "dead"
+
+
+def test_purge_removes_finished_jobs(make_queue):
+    queue = make_queue()
+    queue.put({"n": 1}, job_id="done")
+    queue.put({"n": 2}, job_id="waiting")
+    queue.ack(queue.get())
+    assert queue.purge(time.time() + 1) == 1
+    assert queue.status("done") is None
+    assert queue.status("waiting")["state"] == "queued"
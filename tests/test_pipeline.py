@@ -0,0 +1,64 @@
+import asyncio
+import os
+
+import pytest
+
+from benchmarks.mock_server import MockSettings, start_mock_server
+from modules.llm_client import LLMClient
+from modules.metrics import Metrics
+from modules.pipeline import DreamAnalysisPipeline, DreamSchema
+from modules.scheduler import RequestScheduler
+from modules.store import DreamStore
+from modules.transport import HTTPTransport
+
+
+@pytest.fixture
+def base_url():
+    server, base_url = start_mock_server(MockSettings(latency=0.0, jitter=0.0, token_delay=0.0,
+                                                      image_latency=0.3, image_bytes=4096))
+    yield base_url
+    server.shutdown()
+    server.server_close()
+
+
+def make_pipeline(base_url, output_dir, **options) -> DreamAnalysisPipeline:
+    metrics = Metrics([])
+    llm_client = LLMClient(api_key="test", transport=HTTPTransport(base_url=base_url),
+                           scheduler=RequestScheduler(metrics=metrics), metrics=metrics)
+    return DreamAnalysisPipeline(llm_client=llm_client, output_dir=str(output_dir), metrics=metrics, **options)
+
+
+def make_dream(narrative: str = "I was flying over a flooded city") -> DreamSchema:
+    return DreamSchema(narrative=narrative, mainSymbols=["water", "flying"], primaryEmotion="awe",
+                       emotionalIntensity=4, lifeConnection="a new job")
+
+
+def test_the_preview_is_withdrawn_once_the_final_image_lands(base_url, tmp_path):
+    pipeline = make_pipeline(base_url, tmp_path, preview_steps=6)
+    previews = []
+
+    def on_preview(path):
+        # Whenever a preview is offered, its file exists
+        assert path is None or os.path.exists(path)
+        previews.append(path)
+
+    async def run():
+        try:
+            return await pipeline.aanalyze_dream(make_dream(), on_preview=on_preview)
+        finally:
+            await pipeline.llm_client.transport.aclose()
+
+    result = asyncio.run(run())
+    assert len(previews) == 2 and previews[0].endswith("_preview.png") and previews[1] is None
+    assert not os.path.exists(previews[0])
+    assert os.path.exists(result["imagePath"])
+
+
+def test_a_given_dream_id_is_updated_rather_than_duplicated(base_url, tmp_path):
+    with DreamStore(str(tmp_path / "store")) as store:
+        pipeline = make_pipeline(base_url, tmp_path, store=store)
+        first = asyncio.run(pipeline.aanalyze_dream(make_dream(), dream_id="job-1"))
+        second = pipeline.analyze_dream(make_dream(), dream_id="job-1")
+        assert first["id"] == second["id"] == "job-1"
+        assert store.count() == 1
+        assert store.get("job-1")["imagePath"] == second["imagePath"]
@@ -0,0 +1,53 @@
+import pytest
+
+from modules import routing as routing_module
+from modules.routing import RoutingPolicy
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(routing_module.time, "monotonic", lambda: now[0])
+    return now
+
+
+def test_long_narratives_raise_max_tokens_up_to_the_routes_cap():
+    policy = RoutingPolicy()
+    assert policy.choose(narrative_chars=100).max_tokens == 4096
+    assert policy.choose(narrative_chars=12_000).max_tokens == 6512
+    assert policy.choose(narrative_chars=1_000_000).max_tokens == 8192
+    # Degraded routes stay bounded however long the narrative
+    fast = policy.choose(narrative_chars=1_000_000, queue_depth=48)
+    assert fast.name == "fast" and fast.max_tokens == 2048
+    preview = policy.choose(narrative_chars=1_000_000, queue_depth=1000, user_tier="free")
+    assert preview.name == "preview" and preview.max_tokens == 1536
+
+
+def test_load_and_tier_pick_the_route():
+    policy = RoutingPolicy()
+    assert policy.choose().name == "full"
+    assert policy.choose(user_tier="free").name == "balanced"
+    assert policy.choose(queue_depth=16).name == "balanced"
+    assert policy.choose(queue_depth=1000).name == "preview"
+    assert policy.choose(queue_depth=1000, user_tier="premium").name == "balanced"
+
+
+def test_a_route_skipped_after_a_slow_sample_recovers(clock):
+    policy = RoutingPolicy(smoothing=1.0, recovery_half_life=60)
+    policy.observe("full", 100.0)
+    assert policy.choose(latency_budget=30).name == "balanced"
+    # Never chosen, so never observed again; its estimate drifts back to the 20 s prior
+    clock[0] += 60
+    assert policy.expected_seconds(policy.routes[0]) == pytest.approx(60.0)
+    clock[0] += 240
+    assert policy.choose(latency_budget=30).name == "full"
+    # A fresh observation counts from the decayed estimate
+    policy.observe("full", 25.0)
+    assert policy.expected_seconds(policy.routes[0]) == pytest.approx(25.0)
+
+
+def test_estimates_without_recovery_stay_put(clock):
+    policy = RoutingPolicy(smoothing=0.5, recovery_half_life=None)
+    policy.observe("full", 40.0)
+    clock[0] += 10_000
+    assert policy.expected_seconds(policy.routes[0]) == pytest.approx(30.0)
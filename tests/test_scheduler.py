@@ -0,0 +1,155 @@
+import asyncio
+import time
+from email.utils import formatdate
+from types import SimpleNamespace
+
+import pytest
+
+from modules import scheduler as scheduler_module
+from modules.metrics import Metrics
+from modules.scheduler import (CircuitBreaker, CircuitOpenError, RequestScheduler, RetryPolicy, TokenBucket,
+                               retry_after_seconds)
+
+
+class UpstreamError(Exception):
+    def __init__(self, status_code, headers=None):
+        super().__init__(f"HTTP {status_code}")
+        self.status_code = status_code
+        self.response = SimpleNamespace(headers=headers or {})
+
+
+def make_scheduler(**options) -> RequestScheduler:
+    options.setdefault("retry", RetryPolicy(max_attempts=3, base_delay=0))
+    return RequestScheduler(metrics=Metrics([]), **options)
+
+
+def test_token_bucket_lends_tokens_and_reports_the_wait():
+    bucket = TokenBucket(rate=10, capacity=2)
+    assert bucket.reserve() == 0 and bucket.reserve() == 0
+    assert bucket.reserve() == pytest.approx(0.1, abs=0.01)
+    assert not bucket.try_acquire()
+    bucket.adjust(5)
+    assert bucket.try_acquire(2)
+
+
+def test_retry_after_is_read_from_seconds_milliseconds_and_dates():
+    assert retry_after_seconds(UpstreamError(429, {"retry-after": "3"})) == 3
+    assert retry_after_seconds(UpstreamError(429, {"retry-after-ms": "250"})) == 0.25
+    date = formatdate(time.time() + 30, usegmt=True)
+    assert 28 <= retry_after_seconds(UpstreamError(429, {"retry-after": date})) <= 30
+    assert retry_after_seconds(UpstreamError(429)) is None
+    policy = RetryPolicy(base_delay=0.5, max_retry_after=10)
+    assert 10 <= policy.delay(0, UpstreamError(429, {"retry-after": "120"})) <= 10.5
+
+
+def test_transient_failures_are_retried_after_the_servers_hint(monkeypatch):
+    sleeps = []
+    monkeypatch.setattr(scheduler_module.time, "sleep", sleeps.append)
+    scheduler = make_scheduler(retry=RetryPolicy(max_attempts=3, base_delay=0))
+    outcomes = [UpstreamError(429, {"retry-after": "2"}), UpstreamError(503), "ok"]
+
+    def fn():
+        outcome = outcomes.pop(0)
+        if isinstance(outcome, Exception):
+            raise outcome
+        return outcome
+
+    assert scheduler.call(fn) == "ok"
+    assert sleeps[0] == 2
+    assert scheduler.stats()["retries"] == 2
+
+
+def test_permanent_failures_and_exhausted_retries_raise():
+    scheduler = make_scheduler()
+    calls = []
+
+    def bad_request():
+        calls.append(1)
+        raise UpstreamError(400)
+
+    with pytest.raises(UpstreamError):
+        scheduler.call(bad_request)
+    assert len(calls) == 1
+
+    def unavailable():
+        calls.append(1)
+        raise UpstreamError(503)
+
+    with pytest.raises(UpstreamError):
+        scheduler.call(unavailable)
+    assert len(calls) == 4
+    assert scheduler.stats()["failures"] == 1
+
+
+def test_circuit_breaker_opens_half_opens_and_closes():
+    breaker = CircuitBreaker(failure_threshold=2, reset_timeout=0.05)
+    breaker.record_failure()
+    assert breaker.state == "closed"
+    breaker.record_failure()
+    assert breaker.state == "open"
+    with pytest.raises(CircuitOpenError):
+        breaker.before_call()
+
+    time.sleep(0.06)
+    breaker.before_call()
+    assert breaker.state == "half-open"
+    # Only one trial call at a time
+    with pytest.raises(CircuitOpenError):
+        breaker.before_call()
+    breaker.record_failure()
+    assert breaker.state == "open"
+
+    time.sleep(0.06)
+    breaker.before_call()
+    breaker.record_success()
+    assert breaker.state == "closed"
+    breaker.before_call()
+
+
+def test_open_circuit_rejects_calls_without_calling_upstream():
+    scheduler = make_scheduler(retry=RetryPolicy(max_attempts=1), breaker=CircuitBreaker(failure_threshold=1))
+    with pytest.raises(UpstreamError):
+        scheduler.call(lambda: (_ for _ in ()).throw(UpstreamError(503)))
+    with pytest.raises(CircuitOpenError):
+        scheduler.call(lambda: pytest.fail("upstream called while the circuit is open"))
+    assert scheduler.stats()["rejected"] == 1
+
+
+def test_a_slow_call_is_hedged_and_the_first_response_wins():
+    scheduler = make_scheduler(hedge_after=0.02)
+    calls = []
+
+    def fn():
+        calls.append(1)
+        if len(calls) == 1:
+            time.sleep(0.3)
+            return "slow"
+        return "fast"
+
+    assert scheduler.call(fn) == "fast"
+    assert scheduler.stats()["hedges"] == 1
+    assert scheduler.call(fn, hedge=False) == "fast"
+    assert scheduler.stats()["hedges"] == 1
+
+
+def test_no_request_token_is_spent_when_no_hedge_slot_is_free():
+    # The primary attempt holds the only slot, so the hedge never goes out
+    scheduler = make_scheduler(hedge_after=0.01, max_hedge_workers=1, requests_per_second=2)
+    assert scheduler.call(lambda: time.sleep(0.05) or "ok") == "ok"
+    assert scheduler.stats()["hedges"] == 0
+    # The call took one of the bucket's two tokens; the other is still there
+    assert scheduler.request_bucket.try_acquire(1)
+
+
+def test_async_hedges_are_bounded_by_the_hedge_slots():
+    scheduler = make_scheduler(hedge_after=0.01, max_hedge_workers=1)
+
+    async def slow():
+        await asyncio.sleep(0.1)
+        return "ok"
+
+    async def run():
+        return await asyncio.gather(*(scheduler.acall(slow) for _ in range(3)))
+
+    assert asyncio.run(run()) == ["ok"] * 3
+    assert scheduler.stats()["hedges"] == 1
@@ -0,0 +1,72 @@
+import threading
+
+import pytest
+
+from modules.stages import StageGraph
+
+
+def test_a_published_output_starts_dependents_before_its_stage_finishes():
+    image_started = threading.Event()
+
+    def analysis(ctx):
+        ctx.publish("image_prompt", "a tower over water")
+        # Only finishes once the image stage is already running
+        assert image_started.wait(5)
+        return "analysis"
+
+    def image(ctx):
+        image_started.set()
+        return f"image of {ctx.get('image_prompt')}"
+
+    graph = (StageGraph()
+             .add_stage("analysis", analysis, provides=["image_prompt"])
+             .add_stage("image", image, requires=["image_prompt"])
+             .add_stage("save", lambda ctx: (ctx.get("analysis"), ctx.get("image")), requires=["analysis", "image"]))
+    result = graph.run()
+    assert not result.errors
+    assert result.outputs["save"] == ("analysis", "image of a tower over water")
+    assert result.timings["image"].start < result.timings["analysis"].start + result.timings["analysis"].duration
+
+
+def test_an_error_fails_every_dependent_stage():
+    error = ValueError("upstream failed")
+
+    def analysis(ctx):
+        raise error
+
+    graph = (StageGraph()
+             .add_stage("analysis", analysis, provides=["image_prompt"])
+             .add_stage("image", lambda ctx: "image", requires=["image_prompt"])
+             .add_stage("save", lambda ctx: "saved", requires=["image"])
+             .add_stage("unrelated", lambda ctx: "ok"))
+    result = graph.run()
+    assert result.errors == {"analysis": error, "image": error, "save": error}
+    assert result.outputs == {"unrelated": "ok"}
+    assert "image" not in result.timings
+
+
+def test_a_provided_output_that_is_never_published_fails_its_dependents():
+    graph = (StageGraph()
+             .add_stage("analysis", lambda ctx: "analysis", provides=["image_prompt"])
+             .add_stage("image", lambda ctx: "image", requires=["image_prompt"]))
+    result = graph.run()
+    assert result.outputs == {"analysis": "analysis"}
+    assert "without publishing 'image_prompt'" in str(result.errors["image"])
+
+
+def test_a_cycle_is_rejected():
+    graph = (StageGraph()
+             .add_stage("a", lambda ctx: 1, requires=["b"])
+             .add_stage("b", lambda ctx: 2, requires=["a"]))
+    with pytest.raises(ValueError, match="cycle"):
+        graph.run()
+
+
+def test_unknown_and_duplicate_outputs_are_rejected():
+    with pytest.raises(ValueError, match="unknown outputs"):
+        StageGraph().add_stage("image", lambda ctx: 1, requires=["image_prompt"]).run()
+    graph = StageGraph().add_stage("analysis", lambda ctx: 1, provides=["image_prompt"])
+    with pytest.raises(ValueError, match="more than one stage"):
+        graph.add_stage("prompt", lambda ctx: 1, provides=["image_prompt"])
+    with pytest.raises(ValueError, match="already defined"):
+        graph.add_stage("analysis", lambda ctx: 1)
@@ -0,0 +1,80 @@
+from modules.store import DreamStore
+
+
+def dream(narrative, emotion="fear", intensity=3, symbols=("water",), **extra):
+    return {"narrative": narrative, "primaryEmotion": emotion, "emotionalIntensity": intensity,
+            "mainSymbols": list(symbols), "imagePath": "", **extra}
+
+
+def test_save_inserts_then_updates_under_the_same_id(tmp_path):
+    with DreamStore(str(tmp_path)) as store:
+        dream_id = store.save(dream("first draft", symbols=["water", "Teeth"]))
+        assert store.get(dream_id)["narrative"] == "first draft"
+        assert store.count(symbol="teeth") == 1
+
+        assert store.save(dream("rewritten", emotion="Joy", symbols=["flying"]), dream_id) == dream_id
+        assert store.count() == 1
+        assert store.get(dream_id)["narrative"] == "rewritten"
+        # The indexes follow the update
+        assert store.count(emotion="fear") == 0 and store.count(emotion="joy") == 1
+        assert store.count(symbol="teeth") == 0 and store.count(symbol="flying") == 1
+        assert store.get("unknown") is None
+
+
+def test_find_and_count_combine_filters(tmp_path):
+    with DreamStore(str(tmp_path)) as store:
+        store.save(dream("a", "fear", 2, ["water"]))
+        store.save(dream("b", "fear", 5, ["water", "snake"]))
+        store.save(dream("c", "joy", 5, ["snake"]))
+        assert store.count(emotion="FEAR") == 2
+        assert [d["narrative"] for d in store.find(emotion="fear", min_intensity=4)] == ["b"]
+        assert [d["narrative"] for d in store.find(symbol="snake")] == ["c", "b"]
+        assert store.count(symbol="snake", max_intensity=4) == 0
+        assert store.symbol_counts() == [("snake", 2), ("water", 2)]
+        assert store.symbol_counts(min_count=2, limit=1) == [("snake", 2)]
+
+
+def test_find_pages_with_before(tmp_path):
+    with DreamStore(str(tmp_path)) as store:
+        for n in range(5):
+            store.save(dream(f"dream {n}"))
+        pages, before = [], None
+        while True:
+            page = store.find(limit=2, before=before)
+            if not page:
+                break
+            pages.append([d["narrative"] for d in page])
+            before = page[-1]["id"]
+        assert pages == [["dream 4", "dream 3"], ["dream 2", "dream 1"], ["dream 0"]]
+
+
+def test_scan_walks_every_dream_in_creation_order(tmp_path):
+    with DreamStore(str(tmp_path)) as store:
+        for n in range(5):
+            store.save(dream(f"dream {n}", intensity=n + 1, symbols=[f"symbol {n}"], userId=f"user{n % 2}"))
+        chunks = list(store.scan(chunk_size=2))
+        assert [len(chunk) for chunk in chunks] == [2, 2, 1]
+        rows = [row for chunk in chunks for row in chunk]
+        assert [row[2] for row in rows] == [1, 2, 3, 4, 5]
+        assert [row[3] for row in rows] == ["user0", "user1", "user0", "user1", "user0"]
+        assert [row[4] for row in rows] == [[f"symbol {n}"] for n in range(5)]
+
+
+def test_close_commits_writes_still_queued(tmp_path):
+    store = DreamStore(str(tmp_path), flush_interval=0.05)
+    ids = [store.save(dream(f"dream {n}"), wait=False) for n in range(300)]
+    store.close()
+    with DreamStore(str(tmp_path)) as reopened:
+        assert reopened.count() == 300
+        assert reopened.get(ids[-1])["narrative"] == "dream 299"
+
+
+def test_identical_images_are_stored_once(tmp_path):
+    with DreamStore(str(tmp_path / "store")) as store:
+        paths = []
+        for name in ("a.png", "b.png"):
+            path = tmp_path / name
+            path.write_bytes(b"\x89PNG same image")
+            paths.append(store.store_image(str(path)))
+        assert paths[0] == paths[1]
+        assert not (tmp_path / "a.png").exists() and not (tmp_path / "b.png").exists()
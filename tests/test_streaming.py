@@ -0,0 +1,15 @@
+import json
+
+from modules.streaming import repair_json
+
+
+def test_every_truncation_repairs_to_valid_json():
+    full = '{"analysis": "caf\\u00e9 \\"quoted\\" \\\\ end", "symbols": ["water", "teeth"], "intensity": 4}'
+    for cut in range(full.index("{") + 1, len(full) + 1):
+        json.loads(repair_json(full[:cut]))
+
+
+def test_a_cut_off_escape_is_dropped():
+    assert json.loads(repair_json('{"a": "x\\u00')) == {"a": "x"}
+    assert json.loads(repair_json('{"a": "x\\')) == {"a": "x"}
+    assert json.loads(repair_json('{"a": "\\u00e9z')) == {"a": "éz"}
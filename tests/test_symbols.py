@@ -0,0 +1,36 @@
+import pytest
+
+from modules.metrics import Metrics
+from modules.symbols import SymbolIndex
+
+
+def make_index() -> SymbolIndex:
+    index = SymbolIndex(metrics=Metrics([]))
+    index.add("news", "Information arriving from outside.")
+    index.add("glass", "Fragility, or seeing clearly.")
+    index.add("bus", "A shared path through life.")
+    index.add("snake", "Hidden fears or transformation.", synonyms=["snakes", "serpent"])
+    return index
+
+
+def test_suffixes_do_not_create_false_aliases():
+    index = make_index()
+    assert index.lookup("new") is None
+    assert index.lookup("glasses") is None
+    assert index.lookup("bu") is None
+    assert index.lookup("the news").symbol == "news"
+
+
+def test_plurals_match_through_synonyms():
+    index = make_index()
+    assert index.lookup("Snakes").symbol == "snake"
+    assert index.lookup("a serpent").symbol == "snake"
+
+
+def test_load_of_an_explicit_missing_path_raises(tmp_path):
+    path = str(tmp_path / "symbols.json")
+    assert len(SymbolIndex().load(path)) == 0
+    with pytest.raises(FileNotFoundError):
+        SymbolIndex().load(path, missing_ok=False)
+    make_index().save(path)
+    assert len(SymbolIndex().load(path, missing_ok=False)) == 4
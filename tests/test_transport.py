@@ -0,0 +1,69 @@
+import asyncio
+
+import pytest
+
+from benchmarks.mock_server import MockSettings, start_mock_server
+from modules.llm_client import LLMClient
+from modules.metrics import Metrics
+from modules.pipeline import DreamAnalysis
+from modules.scheduler import RequestScheduler
+from modules.transport import HTTPTransport
+
+
+@pytest.fixture
+def stand_in():
+    """The mock Fireworks server, recording every connection it accepts."""
+    server, base_url = start_mock_server(MockSettings(latency=0.0, jitter=0.0, token_delay=0.0,
+                                                      image_latency=0.0, image_bytes=4096))
+    accepted = []
+    get_request = server.get_request
+
+    def counting_get_request():
+        request = get_request()
+        accepted.append(request[1])
+        return request
+
+    server.get_request = counting_get_request
+    yield base_url, accepted
+    server.shutdown()
+    server.server_close()
+
+
+def make_client(transport: HTTPTransport) -> LLMClient:
+    metrics = Metrics([])
+    return LLMClient(api_key="test", transport=transport, scheduler=RequestScheduler(metrics=metrics),
+                     metrics=metrics)
+
+
+def test_chat_and_image_calls_share_one_connection(stand_in, tmp_path):
+    base_url, accepted = stand_in
+    transport = HTTPTransport(base_url=base_url)
+    client = make_client(transport)
+    try:
+        assert client.generate_text("first dream")
+        assert client.generate_text("second dream")
+        assert client.generate_image("a tower over water")[:4] == b"\x89PNG"
+        image_path = str(tmp_path / "dream.png")
+        assert client.generate_image("a tower over water", image_path) == image_path
+        # Copies made by with_options reuse the same pool
+        assert client.with_options(temperature=0.1).generate_text("third dream")
+    finally:
+        transport.close()
+    assert len(accepted) == 1
+
+
+def test_async_calls_reuse_the_async_pool(stand_in):
+    base_url, accepted = stand_in
+    transport = HTTPTransport(base_url=base_url)
+    client = make_client(transport)
+
+    async def run():
+        try:
+            for narrative in ("first dream", "second dream", "third dream"):
+                analysis = await client.agenerate_structured_json(narrative, DreamAnalysis, as_model=True)
+                assert analysis.analysis
+        finally:
+            await transport.aclose()
+
+    asyncio.run(run())
+    assert len(accepted) == 1
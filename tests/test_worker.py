@@ -0,0 +1,65 @@
+import asyncio
+
+from modules.analytics import DreamAnalytics
+from modules.jobqueue import MemoryJobQueue
+from modules.llm_client import LLMClient
+from modules.metrics import Metrics
+from modules.pipeline import DreamAnalysisPipeline, DreamSchema
+from modules.scheduler import RequestScheduler, RetryPolicy
+from modules.store import DreamStore
+from modules.transport import HTTPTransport
+from modules.worker import PipelineWorker
+
+
+def unreachable_pipeline(output_dir, **options) -> DreamAnalysisPipeline:
+    metrics = Metrics([])
+    # Nothing listens on the discard port, so every upstream call fails at once
+    llm_client = LLMClient(api_key="test", transport=HTTPTransport(base_url="http://127.0.0.1:9/v1"),
+                           scheduler=RequestScheduler(retry=RetryPolicy(max_attempts=1), metrics=metrics),
+                           metrics=metrics)
+    return DreamAnalysisPipeline(llm_client=llm_client, output_dir=str(output_dir), metrics=metrics, **options)
+
+
+def test_failed_analysis_is_retried_then_dead_lettered(tmp_path):
+    queue = MemoryJobQueue(max_attempts=3, retry_delay=0)
+    dream = DreamSchema(narrative="I was falling", mainSymbols=["falling"], primaryEmotion="fear",
+                        emotionalIntensity=3, lifeConnection="exams")
+    job_id = queue.put({"dream": dream.model_dump()})
+    store = DreamStore(str(tmp_path / "store"))
+    analytics = DreamAnalytics()
+    pipeline = unreachable_pipeline(tmp_path, store=store, analytics=analytics)
+    worker = PipelineWorker(queue, pipeline, concurrency=1, poll_interval=0.01,
+                            max_poll_interval=0.01, metrics=Metrics([]))
+
+    async def run():
+        stop = asyncio.Event()
+        consumer = asyncio.create_task(worker.arun(stop))
+        for _ in range(500):
+            if queue.status(job_id)["state"] == "dead":
+                break
+            await asyncio.sleep(0.02)
+        stop.set()
+        await consumer
+
+    asyncio.run(run())
+    status = queue.status(job_id)
+    assert status["state"] == "dead"
+    assert status["attempts"] == 3
+    assert status["result"] is None
+    assert status["error"].startswith("analysis failed")
+    # None of the failed attempts left a record or an analytics entry behind
+    assert store.count() == 0
+    assert analytics.dream_count() == 0
+    store.close()
+
+
+def test_invalid_payload_is_dead_lettered_without_retries(tmp_path):
+    queue = MemoryJobQueue(max_attempts=3, retry_delay=0)
+    job_id = queue.put({"dream": {"narrative": 1}})
+    worker = PipelineWorker(queue, unreachable_pipeline(tmp_path), concurrency=1, metrics=Metrics([]))
+
+    asyncio.run(worker._process(queue.get()))
+    status = queue.status(job_id)
+    assert status["state"] == "dead"
+    assert status["attempts"] == 1
+    assert status["error"].startswith("invalid job")